@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+import json
+import logging
+import sys
+import tempfile
+from typing import (
+    List,
+    Optional,
+)
+
+import fire
+import numpy as np
+
+from .runner import (
+    generate_embeddings,
+    run_benchmark,
+)
+
+
+def benchmark(
+    embeddings_file: Optional[str] = None,
+    n_vectors: int = 100_000,
+    dimension: int = 384,
+    n_queries: int = 200,
+    n_chunks: int = 10,
+    oversamplings: List[float] = (2.0, 4.0, 8.0),
+    with_ivf: bool = True,
+    qdrant_url: Optional[str] = None,
+    directory: Optional[str] = None,
+    output_file: Optional[str] = None,
+    debug: bool = False,
+):
+    """
+    Benchmark recall and latency of quantized vector search against exact search.
+    Example: `python -m cybrex.benchmark --embeddings-file embeddings.npy --qdrant-url http://127.0.0.1`
+
+    :param embeddings_file: `.npy` file with embeddings of chunks, synthetic clustered vectors are used if not set
+    :param n_vectors: number of synthetic vectors
+    :param dimension: dimension of synthetic vectors, 384 is the dimension of `bge-small-en`
+    :param n_queries: number of queries, taken from embeddings and perturbed
+    :param n_chunks: how many neighbours every query returns
+    :param oversamplings: rescoring depths benchmarked for every quantization
+    :param with_ivf: benchmark IVF index as well
+    :param qdrant_url: url of Qdrant, only local storage is benchmarked if not set
+    :param directory: directory for local storages, a temporary directory is used if not set
+    :param output_file: file for writing JSON report
+    :param debug: add debugging output
+    """
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO if debug else logging.ERROR)
+    if embeddings_file:
+        embeddings = np.load(embeddings_file).astype(np.float32)
+    else:
+        embeddings = generate_embeddings(n_vectors, dimension)
+    rng = np.random.default_rng(1)
+    queries = embeddings[rng.choice(len(embeddings), n_queries, replace=False)]
+    queries = queries + 0.1 * np.std(queries) * rng.standard_normal(queries.shape).astype(np.float32)
+    qdrant_config = {'url': qdrant_url, 'prefer_grpc': True} if qdrant_url else None
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        report = run_benchmark(
+            embeddings,
+            queries,
+            directory=directory or temporary_directory,
+            n_chunks=n_chunks,
+            oversamplings=oversamplings,
+            with_ivf=with_ivf,
+            qdrant_config=qdrant_config,
+        )
+    for result in report['results']:
+        bytes_per_vector = f"{result['bytes_per_vector']:.0f}" if result['bytes_per_vector'] is not None else '-'
+        print(
+            f"{result['storage']:>6} {result['configuration']:>26}: "
+            f"recall@{n_chunks} {result['recall']:.3f}, "
+            f"p50 {result['p50'] * 1000:.2f}ms, p95 {result['p95'] * 1000:.2f}ms, "
+            f"{bytes_per_vector} bytes per vector",
+            file=sys.stderr,
+        )
+    if output_file:
+        with open(output_file, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+def main():
+    fire.Fire(benchmark, name='cybrex-benchmark')
+
+
+if __name__ == '__main__':
+    main()
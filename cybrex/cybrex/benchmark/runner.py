@@ -0,0 +1,169 @@
+import logging
+import os.path
+import time
+from typing import (
+    Iterable,
+    List,
+    Optional,
+)
+
+import numpy as np
+
+from ..document_chunker import Chunk
+from ..vector_storage.base import BaseVectorStorage
+from ..vector_storage.local import LocalVectorStorage
+from ..vector_storage.qdrant import QdrantVectorStorage
+
+UPSERT_BATCH_SIZE = 1024
+
+
+def percentile(values: List[float], percentile: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * percentile / 100), len(values) - 1)]
+
+
+def generate_embeddings(n_vectors: int, dimension: int, n_clusters: int = 100, seed: int = 0) -> np.ndarray:
+    """
+    Generates normalized vectors grouped around random centers, that resembles embeddings of texts better
+    than uniformly distributed vectors
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dimension)).astype(np.float32)
+    embeddings = centers[rng.integers(0, n_clusters, n_vectors)]
+    embeddings += 0.5 * rng.standard_normal((n_vectors, dimension)).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def get_configurations(oversamplings: Iterable[float], with_ivf: bool = True) -> dict:
+    """
+    Returns parameters of `LocalVectorStorage` for every benchmarked configuration
+    """
+    configurations = {
+        'exact': {'dtype': 'float16'},
+        'int8': {'dtype': 'int8'},
+    }
+    for quantization in ('int8', 'binary'):
+        for oversampling in oversamplings:
+            configurations[f'{quantization}-quantization-x{oversampling:g}'] = {
+                'quantization': quantization,
+                'oversampling': oversampling,
+            }
+    if with_ivf:
+        configurations['ivf'] = {'ivf_threshold': 1}
+    return configurations
+
+
+def get_exact_neighbours(embeddings: np.ndarray, queries: np.ndarray, n_chunks: int) -> List[set]:
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    scores = queries @ embeddings.T
+    return [set(np.argsort(-query_scores)[:n_chunks].tolist()) for query_scores in scores]
+
+
+def fill_storage(vector_storage: BaseVectorStorage, embeddings: np.ndarray):
+    for start in range(0, len(embeddings), UPSERT_BATCH_SIZE):
+        vector_storage.upsert([
+            Chunk(document_id=str(row), chunk_id=0, title='', length=0, embedding=embeddings[row].tolist())
+            for row in range(start, min(start + UPSERT_BATCH_SIZE, len(embeddings)))
+        ])
+
+
+def measure(
+    vector_storage: BaseVectorStorage,
+    queries: np.ndarray,
+    exact_neighbours: List[set],
+    n_chunks: int,
+) -> dict:
+    latencies = []
+    recalls = []
+    for query, neighbours in zip(queries, exact_neighbours):
+        started_at = time.perf_counter()
+        scored_chunks = vector_storage.query(query.tolist(), n_chunks=n_chunks)
+        latencies.append(time.perf_counter() - started_at)
+        found = {int(scored_chunk.chunk.document_id) for scored_chunk in scored_chunks}
+        recalls.append(len(found & neighbours) / len(neighbours))
+    return {
+        'recall': float(np.mean(recalls)),
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+    }
+
+
+def get_directory_size(directory: str, exclude: Iterable[str] = ('payloads', 'meta.json')) -> int:
+    return sum(
+        os.path.getsize(os.path.join(directory, file_name))
+        for file_name in os.listdir(directory)
+        if file_name not in exclude
+    )
+
+
+def run_benchmark(
+    embeddings: np.ndarray,
+    queries: np.ndarray,
+    directory: str,
+    n_chunks: int = 10,
+    oversamplings: Iterable[float] = (2.0, 4.0, 8.0),
+    with_ivf: bool = True,
+    qdrant_config: Optional[dict] = None,
+) -> dict:
+    """
+    Compares recall and latency of quantized search against exact search over the same vectors.
+    Recall is the share of true nearest neighbours, found by brute force over float32 vectors, in the results.
+
+    :param embeddings: vectors to search in
+    :param queries: query vectors
+    :param directory: directory for local storages
+    :param n_chunks: how many neighbours every query returns
+    :param oversamplings: rescoring depths benchmarked for every quantization
+    :param with_ivf: benchmark IVF index as well
+    :param qdrant_config: arguments of `QdrantClient`, Qdrant is benchmarked if set
+    """
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    exact_neighbours = get_exact_neighbours(embeddings, queries, n_chunks)
+    results = []
+    for name, parameters in get_configurations(oversamplings, with_ivf=with_ivf).items():
+        logging.getLogger('statbox').info({'action': 'benchmark_configuration', 'mode': 'cybrex', 'name': name})
+        vector_storage = LocalVectorStorage(
+            directory=directory,
+            collection_name=name,
+            embedding_function=None,
+            **parameters,
+        )
+        fill_storage(vector_storage, embeddings)
+        # The first query builds IVF index and pages vectors in
+        vector_storage.query(queries[0].tolist(), n_chunks=n_chunks)
+        results.append({
+            'storage': 'local',
+            'configuration': name,
+            'bytes_per_vector': get_directory_size(vector_storage.directory) / len(embeddings),
+            **measure(vector_storage, queries, exact_neighbours, n_chunks),
+        })
+    if qdrant_config:
+        for quantization in (None, 'int8', 'binary'):
+            for oversampling in (oversamplings if quantization else (1.0,)):
+                name = f'{quantization}-quantization-x{oversampling:g}' if quantization else 'exact'
+                logging.getLogger('statbox').info({'action': 'benchmark_configuration', 'mode': 'cybrex', 'name': name})
+                vector_storage = QdrantVectorStorage(
+                    qdrant_config=qdrant_config,
+                    collection_name=f'cybrex_benchmark_{name}',
+                    embedding_function=None,
+                    force_recreate=True,
+                    quantization=quantization,
+                    oversampling=oversampling,
+                )
+                fill_storage(vector_storage, embeddings)
+                results.append({
+                    'storage': 'qdrant',
+                    'configuration': name,
+                    'bytes_per_vector': None,
+                    **measure(vector_storage, queries, exact_neighbours, n_chunks),
+                })
+                vector_storage.db.delete_collection(vector_storage.collection_name)
+    return {
+        'vectors': len(embeddings),
+        'dimension': embeddings.shape[1],
+        'queries': len(queries),
+        'n_chunks': n_chunks,
+        'results': results,
+    }
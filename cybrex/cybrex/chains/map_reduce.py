@@ -1,7 +1,9 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import (
     Iterable,
     List,
+    Optional,
 )
 
 from ..document_chunker import Chunk
@@ -9,9 +11,16 @@ from ..llm_manager import LLMManager
 
 
 class MapReduceChain:
-    def __init__(self, llm_manager: LLMManager, chunk_accumulator):
+    def __init__(self, llm_manager: LLMManager, chunk_accumulator, map_concurrency: Optional[int] = None):
+        """
+        :param llm_manager: LLM processing prompts
+        :param chunk_accumulator: accumulator packing chunks into prompts
+        :param map_concurrency: number of prompts of a single step processed concurrently,
+            `llm_manager.map_concurrency` by default
+        """
         self.llm_manager = llm_manager
         self.chunk_accumulator = chunk_accumulator
+        self.map_concurrency = map_concurrency or llm_manager.map_concurrency
 
     def input_splitter(self, chunks: List[Chunk]) -> str:
         for chunk in chunks:
@@ -30,20 +39,27 @@ class MapReduceChain:
             length=len(llm_output)
         )
 
+    def map_step(self, input_chunk: str) -> str:
+        llm_output = self.llm_manager.process(input_chunk)
+        logging.getLogger('statbox').info({
+            'action': 'intermediate_map_reduce_step',
+            'output': llm_output,
+        })
+        return llm_output
+
     def process(self, chunks: Iterable[Chunk]):
-        while True:
-            input_chunks = self.input_splitter(chunks)
-            outputs = []
-            for input_chunk in input_chunks:
-                llm_output = self.llm_manager.process(input_chunk)
-                logging.getLogger('statbox').info({
-                    'action': 'intermediate_map_reduce_step',
-                    'output': llm_output,
-                })
-                outputs.append(llm_output)
-            if len(outputs) == 1:
-                return outputs[0].strip()
-            chunks = list(map(self.output_processor, outputs))
+        # Prompts of a step are independent, so they are processed concurrently.
+        # `map` returns outputs in the order of prompts, so the next step sees chunks in the order of the document
+        with ThreadPoolExecutor(max_workers=self.map_concurrency) as executor:
+            while True:
+                input_chunks = list(self.input_splitter(chunks))
+                if len(input_chunks) > 1 and self.map_concurrency > 1:
+                    outputs = list(executor.map(self.map_step, input_chunks))
+                else:
+                    outputs = list(map(self.map_step, input_chunks))
+                if len(outputs) == 1:
+                    return outputs[0].strip()
+                chunks = list(map(self.output_processor, outputs))
 
 
 class ChunkAccumulator:
@@ -85,22 +101,25 @@ class SummarizeChunkAccumulator(ChunkAccumulator):
 
 
 class QAChain(MapReduceChain):
-    def __init__(self, query: str, llm_manager):
+    def __init__(self, query: str, llm_manager, map_concurrency: Optional[int] = None):
         super().__init__(
             llm_manager=llm_manager,
             chunk_accumulator=QAChunkAccumulator(
                 query=query,
                 prompter=llm_manager.prompter,
                 max_chunk_length=llm_manager.max_prompt_chars,
-            ))
+            ),
+            map_concurrency=map_concurrency,
+        )
 
 
 class SummarizeChain(MapReduceChain):
-    def __init__(self, llm_manager: LLMManager):
+    def __init__(self, llm_manager: LLMManager, map_concurrency: Optional[int] = None):
         super().__init__(
             llm_manager=llm_manager,
             chunk_accumulator=SummarizeChunkAccumulator(
                 prompter=llm_manager.prompter,
                 max_chunk_length=llm_manager.max_prompt_chars,
-            )
+            ),
+            map_concurrency=map_concurrency,
         )
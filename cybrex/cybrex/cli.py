@@ -10,6 +10,7 @@ from termcolor import colored
 
 from .cybrex_ai import CybrexAI
 from .exceptions import QdrantStorageNotAvailableError
+from .ingestion import IngestionPipeline
 
 
 def exception_handler(func):
@@ -31,17 +32,42 @@ class CybrexCli:
     def __init__(self, cybrex: Optional[CybrexAI] = None):
         self.cybrex = cybrex or CybrexAI()
 
-    async def add_all_documents(self, query: str = '', batch_size: int = 200):
+    @exception_handler
+    async def add_all_documents(
+        self,
+        query: str = '',
+        batch_size: int = 200,
+        fetch_concurrency: int = 16,
+        chunk_workers: Optional[int] = None,
+        embed_batch_size: int = 64,
+        upsert_concurrency: int = 2,
+    ):
+        """
+        Chunk, embed and store all documents matching the query
+
+        :param query: query to STC, all documents with content if empty
+        :param batch_size: how many documents are checked for existence in vector storage at once
+        :param fetch_concurrency: number of concurrent content resolutions
+        :param chunk_workers: number of processes for chunking, CPU count by default
+        :param embed_batch_size: number of chunks passed to the embedder at once
+        :param upsert_concurrency: number of concurrent upserts into vector storage
+        """
         async with self.cybrex as cybrex:
-            batch = []
-            async for document in cybrex.data_source.stream_documents(query=query):
-                logging.getLogger('statbox').info({'action': 'collect_document', 'document': document.document_id})
-                batch.append(document)
-                if len(batch) >= batch_size:
-                    await self.cybrex.upsert_documents(batch)
-                    batch = []
-            if batch:
-                await self.cybrex.upsert_documents(batch)
+            pipeline = IngestionPipeline(
+                cybrex,
+                existence_batch_size=batch_size,
+                fetch_concurrency=fetch_concurrency,
+                chunk_workers=chunk_workers,
+                embed_batch_size=embed_batch_size,
+                upsert_concurrency=upsert_concurrency,
+            )
+            report = await pipeline.run(cybrex.data_source.stream_documents(query=query))
+            for stage_report in report:
+                print(
+                    f"{colored(stage_report['stage'], 'green')}: {stage_report['items']} items, "
+                    f"{stage_report['items_per_second']:.2f} items/s, utilization {stage_report['utilization']:.2f}",
+                    file=sys.stderr,
+                )
 
     @exception_handler
     async def chat_doc(self, document_query: str, query: str, n_chunks: int = 5, minimum_score: float = 0.5):
@@ -0,0 +1,266 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import multiprocessing.pool
+import os
+import posixpath
+import tempfile
+import zipfile
+from typing import (
+    AsyncIterator,
+    List,
+    Optional,
+    Union,
+)
+from urllib.parse import unquote
+
+import lxml.etree
+import lxml.html
+import pypdf
+from aiokit import AioThing
+
+from .exceptions import ContentExtractionTimeoutError
+
+SUPPORTED_EXTENSIONS = ('pdf', 'epub')
+CONTAINER_PATH = 'META-INF/container.xml'
+# EPUB requires UTF-8 or UTF-16 for documents, while HTML parser falls back to Latin-1 without declaration
+EPUB_DOCUMENT_PARSER = lxml.html.HTMLParser(encoding='utf-8')
+# Result of batches that were running in the killed pool
+_RECYCLED = object()
+
+
+def _get_epub_spine(epub_file: zipfile.ZipFile) -> List[str]:
+    container = lxml.etree.fromstring(epub_file.read(CONTAINER_PATH))
+    opf_path = container.xpath('//*[local-name()="rootfile"]/@full-path')[0]
+    opf = lxml.etree.fromstring(epub_file.read(opf_path))
+    hrefs = {
+        item.get('id'): posixpath.normpath(posixpath.join(posixpath.dirname(opf_path), unquote(item.get('href'))))
+        for item in opf.xpath('//*[local-name()="manifest"]/*[local-name()="item"]')
+    }
+    return [
+        hrefs[idref]
+        for idref in opf.xpath('//*[local-name()="spine"]/*[local-name()="itemref"]/@idref')
+        if idref in hrefs
+    ]
+
+
+def _list_pages(file_path: str, extension: str) -> List[Union[int, str]]:
+    """
+    Returns identifiers of pages, page numbers for PDF and paths of spine documents for EPUB
+    """
+    if extension == 'pdf':
+        return list(range(len(pypdf.PdfReader(file_path).pages)))
+    with zipfile.ZipFile(file_path) as epub_file:
+        return _get_epub_spine(epub_file)
+
+
+def _extract_pages(file_path: str, extension: str, pages: List[Union[int, str]]) -> List[str]:
+    """
+    Returns text of PDF pages or HTML of bodies of EPUB documents
+    """
+    if extension == 'pdf':
+        pdf_reader = pypdf.PdfReader(file_path)
+        return [pdf_reader.pages[page].extract_text() for page in pages]
+    extracted_pages = []
+    with zipfile.ZipFile(file_path) as epub_file:
+        for page in pages:
+            body = lxml.html.document_fromstring(epub_file.read(page), parser=EPUB_DOCUMENT_PARSER).body
+            extracted_pages.append(
+                (body.text or '') + ''.join(lxml.html.tostring(child, encoding='unicode') for child in body)
+            )
+    return extracted_pages
+
+
+def _set_future_result(future: asyncio.Future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_future_exception(future: asyncio.Future, exception: BaseException):
+    if not future.done():
+        future.set_exception(exception)
+
+
+class ContentExtractor(AioThing):
+    """
+    Extracts content of PDF and EPUB files in a dedicated process pool, so parsing does not block the event loop.
+
+    Files are split into batches of pages that are extracted in parallel and streamed back in order. Batches are sent
+    to the pool only when a worker is free, so `batch_timeout` limits time of extraction and not time of waiting
+    in the queue. The pool is killed and recreated once a batch exceeds its timeout, so a few pathological files
+    cannot occupy the whole pool, and batches of other files that were running in it are restarted.
+    """
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        timeout: float = 300.0,
+        batch_timeout: float = 60.0,
+        max_pages: int = 2000,
+        page_batch_size: int = 16,
+    ):
+        """
+        :param max_workers: number of worker processes, CPU count by default
+        :param timeout: seconds allowed for extracting a single file, including waiting for free workers
+        :param batch_timeout: seconds allowed for extracting a single batch of pages
+        :param max_pages: maximum number of pages extracted from a single file
+        :param page_batch_size: number of pages extracted by a single task
+        """
+        super().__init__()
+        self.max_workers = max_workers or os.cpu_count()
+        self.timeout = timeout
+        self.batch_timeout = batch_timeout
+        self.max_pages = max_pages
+        self.page_batch_size = page_batch_size
+        self.pool = None
+        self.pending = set()
+        self.abandoned = set()
+        self.free_workers = None
+
+    async def start(self):
+        self.pool = multiprocessing.Pool(self.max_workers)
+        self.free_workers = asyncio.Semaphore(self.max_workers)
+
+    async def stop(self):
+        if self.pool:
+            pool, self.pool = self.pool, None
+            for task in self.abandoned:
+                task.cancel()
+            await asyncio.get_running_loop().run_in_executor(None, pool.terminate)
+
+    def _recycle_pool(self, pool: multiprocessing.pool.Pool):
+        """
+        Kills workers of the pool and replaces it with the new one. Batches that were running in the pool
+        are resolved with `_RECYCLED` and restarted by `_run`
+        """
+        if pool is not self.pool:
+            return
+        self.pool = multiprocessing.Pool(self.max_workers)
+        pending, self.pending = self.pending, set()
+        for future in pending:
+            _set_future_result(future, _RECYCLED)
+        asyncio.get_running_loop().run_in_executor(None, pool.terminate)
+
+    async def _wait_abandoned(self, pool: multiprocessing.pool.Pool, future: asyncio.Future, deadline: float):
+        try:
+            await asyncio.wait_for(future, timeout=deadline - asyncio.get_running_loop().time())
+        except asyncio.TimeoutError:
+            self._recycle_pool(pool)
+        except Exception:
+            # Nobody waits for the result of the abandoned batch
+            pass
+        finally:
+            self.free_workers.release()
+
+    async def _run(self, deadline: float, func, *args):
+        """
+        Runs `func` in a free worker, restarting it in the new pool if the worker has been killed
+        because of another task
+
+        :param deadline: the batch is killed at this time of the event loop if it has not finished before
+        """
+        loop = asyncio.get_running_loop()
+        await self.free_workers.acquire()
+        is_releasing = True
+        try:
+            while True:
+                batch_deadline = min(loop.time() + self.batch_timeout, deadline)
+                if batch_deadline <= loop.time():
+                    raise asyncio.TimeoutError()
+                pool, future = self.pool, loop.create_future()
+                self.pending.add(future)
+                pool.apply_async(
+                    func,
+                    args,
+                    callback=functools.partial(loop.call_soon_threadsafe, _set_future_result, future),
+                    error_callback=functools.partial(loop.call_soon_threadsafe, _set_future_exception, future),
+                )
+                try:
+                    result = await asyncio.wait_for(asyncio.shield(future), timeout=batch_deadline - loop.time())
+                except asyncio.TimeoutError:
+                    self._recycle_pool(pool)
+                    raise
+                except asyncio.CancelledError:
+                    if not future.done():
+                        # The worker cannot be interrupted, so it stays occupied until the batch finishes
+                        # or is killed at its deadline
+                        is_releasing = False
+                        task = asyncio.create_task(self._wait_abandoned(pool, future, batch_deadline))
+                        self.abandoned.add(task)
+                        task.add_done_callback(self.abandoned.discard)
+                    raise
+                finally:
+                    self.pending.discard(future)
+                if result is not _RECYCLED:
+                    return result
+        finally:
+            if is_releasing:
+                self.free_workers.release()
+
+    async def stream_pages(self, file_content: bytes, extension: str) -> AsyncIterator[List[str]]:
+        """
+        Yields batches of pages in order as they are extracted
+
+        :param file_content: content of the file
+        :param extension: `pdf` or `epub`
+        :raises ContentExtractionTimeoutError: if extraction of the file or of its batch has exceeded the timeout
+        """
+        if extension not in SUPPORTED_EXTENSIONS:
+            raise ValueError(f'Unsupported extension `{extension}`')
+        if not self.pool:
+            await self.start()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        # Workers read the file by path, so its content is not pickled for every batch
+        file_descriptor, file_path = tempfile.mkstemp(suffix=f'.{extension}')
+        tasks = []
+        try:
+            with os.fdopen(file_descriptor, 'wb') as f:
+                await loop.run_in_executor(None, f.write, file_content)
+            pages = await self._run(deadline, _list_pages, file_path, extension)
+            if len(pages) > self.max_pages:
+                logging.getLogger('warning').warning({
+                    'action': 'truncated_content',
+                    'mode': 'cybrex',
+                    'extension': extension,
+                    'pages': len(pages),
+                    'max_pages': self.max_pages,
+                })
+            selected_pages = pages[:self.max_pages]
+            tasks = [
+                asyncio.create_task(self._run(
+                    deadline,
+                    _extract_pages,
+                    file_path,
+                    extension,
+                    selected_pages[start:start + self.page_batch_size],
+                ))
+                for start in range(0, len(selected_pages), self.page_batch_size)
+            ]
+            for task in tasks:
+                yield await task
+        except asyncio.TimeoutError:
+            logging.getLogger('warning').warning({
+                'action': 'extraction_timeout',
+                'mode': 'cybrex',
+                'extension': extension,
+                'timeout': self.timeout,
+                'batch_timeout': self.batch_timeout,
+            })
+            raise ContentExtractionTimeoutError(extension=extension, timeout=self.timeout)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            os.remove(file_path)
+
+    async def extract(self, file_content: bytes, extension: str) -> str:
+        """
+        Returns the whole content of the file, pages are joined with new lines
+
+        :param file_content: content of the file
+        :param extension: `pdf` or `epub`
+        :raises ContentExtractionTimeoutError: if extraction of the file or of its batch has exceeded the timeout
+        """
+        return '\n'.join([page async for pages in self.stream_pages(file_content, extension) for page in pages])
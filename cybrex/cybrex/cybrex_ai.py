@@ -1,9 +1,9 @@
 import asyncio
-import io
 import logging
 import os.path
 from dataclasses import dataclass
 from typing import (
+    AsyncIterator,
     Iterable,
     List,
     Literal,
@@ -11,7 +11,6 @@ from typing import (
     Tuple,
 )
 
-import pypdf
 import yaml
 from aiokit import AioThing
 from izihawa_configurator import Configurator
@@ -24,18 +23,19 @@ from .chains.map_reduce import (
     QAChain,
     SummarizeChain,
 )
+from .content_extractor import ContentExtractor
 from .data_source.base import SourceDocument
 from .data_source.geck_data_source import GeckDataSource
 from .document_chunker import (
     Chunk,
     DocumentChunker,
 )
+from .embedding_cache import EmbeddingCache
 from .model import CybrexModel
 from .utils import MultipleAsyncExecution
-from .vector_storage.qdrant import (
-    QdrantVectorStorage,
-    ScoredChunk,
-)
+from .vector_storage.base import ScoredChunk
+from .vector_storage.local import LocalVectorStorage
+from .vector_storage.qdrant import QdrantVectorStorage
 
 
 class DocumentNotFoundError(BaseError):
@@ -76,6 +76,7 @@ class CybrexAI(AioThing):
         self.document_chunker = DocumentChunker(
             text_splitter=self.model.text_splitter,
             add_metadata=self.model.config['text_splitter']['add_metadata'],
+            engine=self.model.config['text_splitter'].get('engine', 'unstructured'),
         )
 
         self.geck = geck
@@ -88,12 +89,43 @@ class CybrexAI(AioThing):
             self.starts.append(self.geck)
 
         self.data_source = GeckDataSource(self.geck)
-        self.vector_storage = QdrantVectorStorage(
-            qdrant_config=config['qdrant'],
-            collection_name=self.model.get_embeddings_id(),
-            embedding_function=self.model.embed_documents,
-            force_recreate=config['qdrant'].pop('force_recreate', False)
+        content_extractor_config = config.get('content_extractor', {})
+        self.content_extractor = ContentExtractor(
+            max_workers=content_extractor_config.get('max_workers'),
+            timeout=content_extractor_config.get('timeout', 300.0),
+            batch_timeout=content_extractor_config.get('batch_timeout', 60.0),
+            max_pages=content_extractor_config.get('max_pages', 2000),
         )
+        self.starts.append(self.content_extractor)
+        self.embedding_cache = None
+        embedding_cache_config = config.get('embedding_cache', {})
+        if embedding_cache_config.get('enabled', True):
+            self.embedding_cache = EmbeddingCache(
+                directory=os.path.expanduser(embedding_cache_config.get('path', os.path.join(self.home_path, 'embedding_cache'))),
+                embeddings_id=self.model.get_embeddings_id(),
+            )
+        vector_storage_config = config.get('vector_storage', {})
+        if vector_storage_config.get('type', 'qdrant') == 'local':
+            self.vector_storage = LocalVectorStorage(
+                directory=os.path.expanduser(vector_storage_config.get('path', os.path.join(self.home_path, 'vectors'))),
+                collection_name=self.model.get_embeddings_id(),
+                embedding_function=self.model.embed_documents,
+                dtype=vector_storage_config.get('dtype', 'float16'),
+                ivf_threshold=vector_storage_config.get('ivf_threshold'),
+                quantization=vector_storage_config.get('quantization'),
+                oversampling=vector_storage_config.get('oversampling', 4.0),
+                embedding_cache=self.embedding_cache,
+            )
+        else:
+            self.vector_storage = QdrantVectorStorage(
+                qdrant_config=config['qdrant'],
+                collection_name=self.model.get_embeddings_id(),
+                embedding_function=self.model.embed_documents,
+                force_recreate=config['qdrant'].pop('force_recreate', False),
+                quantization=vector_storage_config.get('quantization'),
+                oversampling=vector_storage_config.get('oversampling', 4.0),
+                embedding_cache=self.embedding_cache,
+            )
 
     async def _get_missing_chunks_job(self, all_chunks, document):
         document_chunks = await self.generate_chunks_from_document(document)
@@ -102,12 +134,12 @@ class CybrexAI(AioThing):
     async def _get_missing_chunks(self, documents: List[SourceDocument], skip_downloading_pdf: bool = True, par: int = 16) -> List[Chunk]:
         all_chunks = []
         executor = MultipleAsyncExecution(par)
+        stored_document_ids = await asyncio.get_running_loop().run_in_executor(
+            None,
+            lambda: self.vector_storage.existing_document_ids(document.document_id for document in documents)
+        )
         for document in documents:
-            is_stored = await asyncio.get_running_loop().run_in_executor(
-                None,
-                lambda: self.vector_storage.exists_by_field_value('document_id', document.document_id)
-            )
-            if is_stored:
+            if document.document_id in stored_document_ids:
                 logging.getLogger('statbox').info({
                     'action': 'already_stored',
                     'mode': 'cybrex',
@@ -183,6 +215,8 @@ class CybrexAI(AioThing):
         ipfs_http_base_url: str = 'http://127.0.0.1:8080',
         summa_endpoint: str = '127.0.0.1:10082',
         qdrant_base_url: str = 'http://127.0.0.1',
+        vector_storage: Literal['qdrant', 'local'] = 'qdrant',
+        vector_quantization: Optional[Literal['int8', 'binary']] = None,
         llm_name: Literal['llama-2-7b', 'llama-2-7b-uncensored', 'llama-2-13b', 'openai', 'petals-llama-2-70b', 'petals-stable-beluga', 'mistral-7b'] = 'mistral-7b',
         embedder_name: Literal['instructor-xl', 'openai', 'bge-small-en'] = 'bge-small-en',
         device: str = 'cpu',
@@ -194,6 +228,8 @@ class CybrexAI(AioThing):
         :param ipfs_http_base_url: IPFS HTTP base url, i.e. `http://127.0.0.1:8080`
         :param summa_endpoint: Summa endpoint, i.e. `127.0.0.1:10082`
         :param qdrant_base_url:
+        :param vector_storage: 'qdrant' or 'local', the latter keeps vectors in $CYBREX_HOME/vectors and does not require Qdrant
+        :param vector_quantization: 'int8' or 'binary', search scans quantized vectors and rescores the best candidates
         :param llm_name: 'llama-2-7b', 'llama-2-7b-uncensored', 'llama-2-13b', 'openai', 'petals-llama-2-70b', 'petals-stable-beluga', 'mistral-7b'
         :param embedder_name: 'instructor-xl', 'openai', 'bge-small-en''
         :param device: 'cpu' or 'cuda'
@@ -209,6 +245,10 @@ class CybrexAI(AioThing):
                         'base_url': ipfs_http_base_url,
                     }
                 },
+                'embedding_cache': {
+                    'enabled': True,
+                    'path': os.path.join(self.home_path, 'embedding_cache'),
+                },
                 'model': CybrexModel.default_config(
                     llm_name=llm_name,
                     embedder_name=embedder_name,
@@ -222,27 +262,45 @@ class CybrexAI(AioThing):
                 'summa': {
                     'endpoint': summa_endpoint,
                 },
+                'vector_storage': {
+                    'type': vector_storage,
+                    'quantization': vector_quantization,
+                    'oversampling': 4.0,
+                },
             }
             with open(config_path, 'w') as f:
                 f.write(yaml.dump(config, default_flow_style=False))
         return config_path
 
-    async def resolve_document_content(self, document: SourceDocument) -> Optional[str]:
+    async def stream_document_content(self, document: SourceDocument) -> AsyncIterator[str]:
         """
-        Retrieves document content from `content` field or from underlying PDF file.
+        Yields document content from `content` field or batches of pages of underlying PDF or EPUB file
+        as they are extracted.
 
         :param document:
         :return:
         """
         document = document.document
         if 'content' in document:
-            return document['content']
-        document_holder = BaseDocumentHolder(document)
-        # ToDo: should also utilize epub links
-        if pdf_link := document_holder.get_links().get_link_with_extension('pdf'):
-            file_content = await self.geck.download(pdf_link['cid'])
-            pdf_reader = pypdf.PdfReader(io.BytesIO(file_content))
-            return '\n'.join(page.extract_text() for page in pdf_reader.pages)
+            yield document['content']
+            return
+        links = BaseDocumentHolder(document).get_links()
+        for extension in ('pdf', 'epub'):
+            if link := links.get_link_with_extension(extension):
+                file_content = await self.geck.download(link['cid'])
+                async for pages in self.content_extractor.stream_pages(file_content, extension):
+                    yield '\n'.join(pages)
+                return
+
+    async def resolve_document_content(self, document: SourceDocument) -> Optional[str]:
+        """
+        Retrieves document content from `content` field or from underlying PDF or EPUB file.
+
+        :param document:
+        :return:
+        """
+        parts = [part async for part in self.stream_document_content(document)]
+        return '\n'.join(parts) or None
 
     async def generate_chunks_from_document(self, document: SourceDocument) -> List[Chunk]:
         """
@@ -340,18 +398,8 @@ class CybrexAI(AioThing):
         :return:
         """
         ids = set([chunk['document_id'] for chunk in chunks])
-        subqueries = []
-        for id_ in ids:
-            field, value = id_.split(':', 1)
-            subqueries.append({'query': {'match': {'value': f'{field}:"{value}"'}}, 'occur': 'should'})
-
-        search_request = {
-            'index_alias': 'nexus_science',
-            'query': {'boolean': {'subqueries': subqueries}},
-            'collectors': [{'top_docs': {'limit': len(subqueries)}}],
-            'is_fieldnorms_scoring_enabled': False,
-        }
-        return await self.geck.get_summa_client().search_documents(search_request)
+        documents = await self.geck.get_many_by_internal_ids(ids)
+        return list(documents.values())
 
     async def semantic_search_in_documents(
         self,
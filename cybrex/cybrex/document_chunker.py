@@ -3,18 +3,26 @@ import re
 from dataclasses import dataclass
 from datetime import datetime
 from typing import (
+    Iterator,
     List,
     Optional, cast, Any,
+    Tuple,
 )
 
+import lxml.html
 import unstructured.documents.elements
 from bs4 import BeautifulSoup
 from unstructured.chunking.title import (
     _split_elements_by_title_and_table,
     chunk_table_element, _NonTextSection, _TableSection, _TextSection,
 )
-from unstructured.cleaners.core import clean
+from unstructured.cleaners.core import (
+    clean,
+    clean_bullets,
+    replace_unicode_quotes,
+)
 from unstructured.partition.html import partition_html
+from unstructured.partition.text_type import is_bulleted_text
 
 from .data_source.base import SourceDocument
 
@@ -39,6 +47,32 @@ BANNED_SECTIONS = {
     'footnotes',
     'suggested readings',
 }
+CHUNKING_ENGINES = ('unstructured', 'lxml')
+STRIPPED_SELECTOR = (
+    'table, nav, ref, formula, math, figure, img, [role="note"], .Affiliations, '
+    '.ArticleOrChapterToc, '
+    '.AuthorGroup, .ChapterContextInformation, '
+    '.Contacts, .CoverFigure, .Bibliography, '
+    '.BookTitlePage, .BookFrontmatter, .CopyrightPage, .Equation, '
+    '.FootnoteSection, .Table, .reference, .side-box-text, .thumbcaption'
+)
+# Tags and classes from `STRIPPED_SELECTOR` for `lxml` engine, plus tags without text content
+STRIPPED_TAGS = {'table', 'nav', 'ref', 'formula', 'math', 'figure', 'img', 'script', 'style'}
+STRIPPED_CLASSES = {
+    'Affiliations', 'ArticleOrChapterToc', 'AuthorGroup', 'ChapterContextInformation', 'Contacts', 'CoverFigure',
+    'Bibliography', 'BookTitlePage', 'BookFrontmatter', 'CopyrightPage', 'Equation', 'FootnoteSection', 'Table',
+    'reference', 'side-box-text', 'thumbcaption',
+}
+SECTION_HEADER_TAGS = {'header', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'div'}
+HEADER_DEPTHS = {'header': 0, 'h1': 0, 'h2': 1, 'h3': 2, 'h4': 3, 'h5': 4, 'h6': 5}
+TEXT_BLOCK_TAGS = {'p', 'li', 'dt', 'dd', 'pre', 'summary', 'caption'}
+INLINE_TAGS = {
+    'a', 'abbr', 'b', 'cite', 'code', 'del', 'em', 'font', 'i', 'ins', 'kbd', 'label', 'mark', 'q', 's', 'small',
+    'span', 'strong', 'sub', 'sup', 'time', 'u', 'var',
+}
+FIGURE_REFERENCE_REGEX = re.compile(r'\((?:[Ff]ig|[Tt]able|[Ss]ection)\.?\s*[^)]*\)')
+CITATION_REGEX = re.compile(r'\[[,\s–\d]*]', flags=re.MULTILINE)
+SPACE_BEFORE_PUNCTUATION_REGEX = re.compile(r'\s+([.,;])', flags=re.MULTILINE)
 
 
 @dataclass
@@ -134,11 +168,113 @@ def chunk_by_title(
     return chunked_elements
 
 
+def _is_banned(element: lxml.html.HtmlElement) -> bool:
+    return element.text_content().lower().strip(' :,.;') in BANNED_SECTIONS
+
+
+def _is_stripped(element: lxml.html.HtmlElement) -> bool:
+    if not isinstance(element.tag, str):
+        # Comments and processing instructions
+        return True
+    if element.tag in STRIPPED_TAGS or element.get('role') == 'note':
+        return True
+    if (classes := element.get('class')) and not STRIPPED_CLASSES.isdisjoint(classes.split()):
+        return True
+    if element.tag == 'section':
+        return any(child.tag in SECTION_HEADER_TAGS and _is_banned(child) for child in element)
+    if element.tag == 'details':
+        return any(
+            child.tag == 'summary' and 'section-heading' in (child.get('class') or '').split() and _is_banned(child)
+            for child in element
+        )
+    return False
+
+
+def _inline_text(element: lxml.html.HtmlElement) -> str:
+    parts = [element.text or '']
+    for child in element:
+        if child.tag == 'br':
+            parts.append('\n')
+        elif not _is_stripped(child):
+            parts.append(_inline_text(child))
+        parts.append(child.tail or '')
+    return ''.join(parts)
+
+
+def _normalize_block(text: str) -> Optional[str]:
+    text = FIGURE_REFERENCE_REGEX.sub('', text)
+    text = CITATION_REGEX.sub('', text)
+    text = SPACE_BEFORE_PUNCTUATION_REGEX.sub(r'\g<1>', text)
+    text = replace_unicode_quotes(text).strip()
+    if is_bulleted_text(text):
+        text = clean_bullets(text)
+    if len(text) >= 2:
+        return text
+
+
+def _walk_blocks(element: lxml.html.HtmlElement) -> Iterator[Tuple[str, Optional[int]]]:
+    """
+    Yields text blocks of the element with header depth for headers and `None` for other blocks.
+    Consecutive inline content of the element is merged into a single block.
+    """
+    inline_parts = [element.text or '']
+
+    def flush():
+        if text := _normalize_block(''.join(inline_parts)):
+            yield text, None
+        inline_parts.clear()
+
+    skipped_child = None
+    for child in element:
+        if child is skipped_child:
+            pass
+        elif child.tag == 'br':
+            inline_parts.append('\n')
+        elif _is_stripped(child):
+            pass
+        elif child.tag in INLINE_TAGS:
+            inline_parts.append(_inline_text(child))
+        else:
+            yield from flush()
+            if child.tag in HEADER_DEPTHS:
+                if text := _normalize_block(_inline_text(child)):
+                    yield text, HEADER_DEPTHS[child.tag]
+            elif child.tag in TEXT_BLOCK_TAGS:
+                text = _inline_text(child)
+                next_child = child.getnext()
+                # Quotations are merged into preceding paragraphs
+                if child.tag == 'p' and not (child.tail or '').strip() and next_child is not None and next_child.tag == 'blockquote':
+                    text = f'{text} {next_child.text_content()}'
+                    skipped_child = next_child
+                if text := _normalize_block(text):
+                    yield text, None
+            else:
+                yield from _walk_blocks(child)
+        inline_parts.append(child.tail or '')
+    yield from flush()
+
+
+def _iter_blocks(html: str) -> Iterator[Tuple[str, Optional[int]]]:
+    if not html.strip():
+        return
+    yield from _walk_blocks(lxml.html.document_fromstring('<html>' + html + '</html>'))
+
+
 class DocumentChunker:
-    def __init__(self, text_splitter, minimal_chunk_size: int = 128, add_metadata: bool = False):
+    def __init__(self, text_splitter, minimal_chunk_size: int = 128, add_metadata: bool = False, engine: str = 'unstructured'):
+        """
+        :param text_splitter: splitter of section texts into chunks
+        :param minimal_chunk_size: shorter chunks are dropped
+        :param add_metadata: add title, year, keywords and tags to embedded texts
+        :param engine: `unstructured` or `lxml`, the latter does a single pass over the document and does not guess
+            titles from text, so sections are started only by headers
+        """
+        if engine not in CHUNKING_ENGINES:
+            raise ValueError(f'Unknown chunking engine `{engine}`, should be one of {CHUNKING_ENGINES}')
         self.text_splitter = text_splitter
         self.minimal_chunk_size = minimal_chunk_size
         self.add_metadata = add_metadata
+        self.engine = engine
 
     def to_chunks(self, source_document: SourceDocument) -> List[Chunk]:
         logging.getLogger('statbox').info({
@@ -146,7 +282,13 @@ class DocumentChunker:
             'document_id': source_document.document_id,
             'mode': 'cybrex',
         })
-        document = source_document.document
+        if self.engine == 'lxml':
+            sections = self._to_sections_lxml(source_document.document)
+        else:
+            sections = self._to_sections_unstructured(source_document.document)
+        return self._sections_to_chunks(source_document, sections)
+
+    def _to_sections_unstructured(self, document: dict) -> List[Tuple[str, Optional[str]]]:
         abstract = document.get('abstract', '')
         content = document.get('content', '')
 
@@ -181,21 +323,16 @@ class DocumentChunker:
         for header in list(soup.find_all('header')):
             header.name = 'h1'
 
-        for el in list(soup.select('table, nav, ref, formula, math, figure, img, [role="note"], .Affiliations, '
-                                   '.ArticleOrChapterToc, '
-                                   '.AuthorGroup, .ChapterContextInformation, '
-                                   '.Contacts, .CoverFigure, .Bibliography, '
-                                   '.BookTitlePage, .BookFrontmatter, .CopyrightPage, .Equation, '
-                                   '.FootnoteSection, .Table, .reference, .side-box-text, .thumbcaption')):
+        for el in list(soup.select(STRIPPED_SELECTOR)):
             el.extract()
 
         for el in list(soup.select('a, span')):
             el.unwrap()
 
         text = str(soup)
-        text = re.sub(r'\((?:[Ff]ig|[Tt]able|[Ss]ection)\.?\s*[^)]*\)', '', text)
-        text = re.sub(r'\[[,\s–\d]*]', '', text, flags=re.MULTILINE)
-        text = re.sub(r'\s+([.,;])', '\g<1>', text, flags=re.MULTILINE)
+        text = FIGURE_REFERENCE_REGEX.sub('', text)
+        text = CITATION_REGEX.sub('', text)
+        text = SPACE_BEFORE_PUNCTUATION_REGEX.sub('\g<1>', text)
 
         pre_elements = partition_html(text=text)
         elements = []
@@ -203,19 +340,44 @@ class DocumentChunker:
             if isinstance(pre_element, unstructured.documents.elements.Text):
                 elements.append(pre_element)
 
+        return [(str(element), element.metadata.section) for element in chunk_by_title(elements)]
+
+    def _to_sections_lxml(self, document: dict) -> List[Tuple[str, Optional[str]]]:
+        sections = []
+        section_texts = []
+        current_title_parts = [''] * 6
+        last_title_parts = -1
+
+        def flush():
+            if section_texts:
+                section = '\n'.join(current_title_parts[:last_title_parts + 1]) if last_title_parts != -1 else None
+                sections.append(('\n\n'.join(section_texts), section))
+                section_texts.clear()
+
+        for text, depth in _iter_blocks(document.get('abstract', '') + document.get('content', '')):
+            if depth is not None:
+                flush()
+                current_title_parts[depth] = re.sub('\n+', ' ', text)
+                last_title_parts = depth
+            section_texts.append(text)
+        flush()
+        return sections
+
+    def _sections_to_chunks(self, source_document: SourceDocument, sections: List[Tuple[str, Optional[str]]]) -> List[Chunk]:
+        document = source_document.document
+        content = document.get('content', '')
         chunks = []
         chunk_id = 0
-        elements = chunk_by_title(elements)
-        for element in elements:
-            for chunk in self.text_splitter.split_text(str(element)):
+        for section_text, section in sections:
+            for chunk in self.text_splitter.split_text(section_text):
                 chunk_text = clean(str(chunk), extra_whitespace=True, dashes=True, bullets=True, trailing_punctuation=True)
                 if len(chunk_text) < self.minimal_chunk_size:
                     continue
                 parts = [chunk_text]
                 title_parts = [document["title"]]
                 if self.add_metadata:
-                    if element.metadata.section:
-                        title_parts.extend(filter(bool, element.metadata.section.split('\n')))
+                    if section:
+                        title_parts.extend(filter(bool, section.split('\n')))
                     parts.append(f'TITLE: {" ".join(title_parts)}')
                     if 'issued_at' in document:
                         issued_at = datetime.utcfromtimestamp(document['issued_at'])
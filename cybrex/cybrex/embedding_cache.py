@@ -0,0 +1,143 @@
+import hashlib
+import json
+import logging
+import os.path
+import threading
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Optional,
+)
+
+import numpy as np
+from izihawa_utils.file import mkdir_p
+
+DIGEST_SIZE = hashlib.sha1().digest_size
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of embeddings keyed by SHA-1 of the embedded text.
+
+    Every embedder has its own directory with two append-only files: `keys` storing digests of texts and `vectors`
+    storing float16 vectors in the same order. `vectors` is a plain row-major array that is read through `np.memmap`,
+    so only rows being looked up are paged in. Rows are appended to `vectors` before `keys`, so a torn write
+    is detected on opening and cut off. `meta.json` is written after the first rows, so the cache without it is empty.
+    """
+    def __init__(self, directory: str, embeddings_id: str):
+        """
+        :param directory: root directory of the cache
+        :param embeddings_id: identifier of the embedder, i.e. `CybrexModel.get_embeddings_id()`
+        """
+        self.directory = os.path.join(directory, embeddings_id)
+        self.keys_path = os.path.join(self.directory, 'keys')
+        self.vectors_path = os.path.join(self.directory, 'vectors')
+        self.meta_path = os.path.join(self.directory, 'meta.json')
+        self.lock = threading.Lock()
+        self.dimension = None
+        self.rows: Dict[bytes, int] = {}
+        self.vectors = None
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path) as f:
+            self.dimension = json.load(f)['dimension']
+        # Missing data files are treated as empty ones
+        keys = b''
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, 'rb') as f:
+                keys = f.read()
+        vectors_size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        n_rows = min(len(keys) // DIGEST_SIZE, vectors_size // self.row_size)
+        for row in range(n_rows):
+            self.rows[keys[row * DIGEST_SIZE:(row + 1) * DIGEST_SIZE]] = row
+        if len(keys) != n_rows * DIGEST_SIZE or vectors_size != n_rows * self.row_size:
+            logging.getLogger('warning').warning({
+                'action': 'truncate_embedding_cache',
+                'mode': 'cybrex',
+                'directory': self.directory,
+                'rows': n_rows,
+            })
+            os.truncate(self.keys_path, n_rows * DIGEST_SIZE)
+            os.truncate(self.vectors_path, n_rows * self.row_size)
+        self._map_vectors()
+
+    def _map_vectors(self):
+        self.vectors = None
+        if self.rows:
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float16, mode='r', shape=(len(self.rows), self.dimension))
+
+    @property
+    def row_size(self) -> int:
+        return self.dimension * np.dtype(np.float16).itemsize
+
+    @staticmethod
+    def get_key(text: str) -> bytes:
+        return hashlib.sha1(text.encode()).digest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Returns cached embeddings of texts, `None` for texts that are not in the cache
+        """
+        with self.lock:
+            rows = [self.rows.get(self.get_key(text)) for text in texts]
+            return [self.vectors[row].astype(np.float32).tolist() if row is not None else None for row in rows]
+
+    def put_many(self, texts: List[str], embeddings: List[List[float]]):
+        with self.lock:
+            new_rows = {}
+            for text, embedding in zip(texts, embeddings):
+                key = self.get_key(text)
+                if key not in self.rows and key not in new_rows:
+                    new_rows[key] = embedding
+            if not new_rows:
+                return
+            # Without `meta.json` files are left by an interrupted first write, so they are overwritten
+            mode = 'ab' if self.dimension is not None else 'wb'
+            if self.dimension is None:
+                mkdir_p(self.directory)
+            with open(self.vectors_path, mode) as f:
+                f.write(np.asarray(list(new_rows.values()), dtype=np.float16).tobytes())
+            with open(self.keys_path, mode) as f:
+                f.write(b''.join(new_rows.keys()))
+            if self.dimension is None:
+                # `meta.json` is written the last, so its presence means that data files exist
+                dimension = len(next(iter(new_rows.values())))
+                with open(self.meta_path + '.tmp', 'w') as f:
+                    json.dump({'dimension': dimension}, f)
+                os.replace(self.meta_path + '.tmp', self.meta_path)
+                self.dimension = dimension
+            for key in new_rows:
+                self.rows[key] = len(self.rows)
+            self._map_vectors()
+
+    def embed(self, texts: List[str], embedding_function: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        """
+        Returns embeddings of texts, calling `embedding_function` only for texts missing in the cache
+
+        :param texts: texts to embed
+        :param embedding_function: function embedding a list of texts
+        """
+        embeddings = self.get_many(texts)
+        missing_texts = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        self.hits += len(texts) - len(missing_texts)
+        self.misses += len(missing_texts)
+        if missing_texts:
+            computed_embeddings = dict(zip(missing_texts, embedding_function(missing_texts)))
+            self.put_many(list(computed_embeddings.keys()), list(computed_embeddings.values()))
+            embeddings = [
+                computed_embeddings[text] if embedding is None else embedding
+                for text, embedding in zip(texts, embeddings)
+            ]
+        logging.getLogger('statbox').info({
+            'action': 'embedded',
+            'mode': 'cybrex',
+            'n': len(texts),
+            'computed': len(missing_texts),
+        })
+        return embeddings
@@ -3,3 +3,7 @@ from izihawa_utils.exceptions import BaseError
 
 class QdrantStorageNotAvailableError(BaseError):
     pass
+
+
+class ContentExtractionTimeoutError(BaseError):
+    pass
@@ -0,0 +1,366 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    AsyncIterable,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from .data_source.base import SourceDocument
+from .document_chunker import (
+    Chunk,
+    DocumentChunker,
+)
+from .exceptions import QdrantStorageNotAvailableError
+
+_DONE = object()
+_document_chunker: Optional[DocumentChunker] = None
+
+
+def _init_chunking_worker(document_chunker: DocumentChunker):
+    global _document_chunker
+    _document_chunker = document_chunker
+
+
+def _to_chunks(document: SourceDocument) -> List[Chunk]:
+    return _document_chunker.to_chunks(document)
+
+
+class DocumentAssembly:
+    """
+    Collects chunks of parts of a document that are chunked while the rest of the document is still being extracted.
+    Chunks are released only when all parts have been chunked, so a document that has failed halfway
+    is not stored partially.
+    """
+    def __init__(self, document: SourceDocument):
+        self.document = document
+        self.parts: Dict[int, List[Chunk]] = {}
+        self.n_parts = None
+        self.is_failed = False
+
+    def get_part_document(self, index: int, content: str) -> SourceDocument:
+        document = dict(self.document.document, content=content)
+        if index:
+            # Abstract is chunked only once, together with the first part
+            document.pop('abstract', None)
+        return SourceDocument(document=document, document_id=self.document.document_id)
+
+    def is_complete(self) -> bool:
+        return not self.is_failed and self.n_parts is not None and len(self.parts) == self.n_parts
+
+    def get_chunks(self) -> List[Chunk]:
+        chunks = [chunk for index in range(self.n_parts) for chunk in self.parts[index]]
+        for chunk_id, chunk in enumerate(chunks):
+            chunk.chunk_id = chunk_id
+        return chunks
+
+
+class StageStats:
+    def __init__(self, name: str, concurrency: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.items = 0
+        self.busy = 0.0
+
+    def to_dict(self, elapsed: float) -> dict:
+        return {
+            'stage': self.name,
+            'items': self.items,
+            'items_per_second': self.items / elapsed if elapsed else 0.0,
+            # Share of time workers of the stage were busy, the bottleneck stage is close to 1.0
+            'utilization': self.busy / (elapsed * self.concurrency) if elapsed else 0.0,
+        }
+
+
+class IngestionPipeline:
+    """
+    Upserts a stream of documents into vector storage by stages connected with bounded queues:
+    existence check → content resolution → chunking → embedding → upsert.
+
+    Every stage has its own number of workers, so downloading, parsing, embedding and writes to Qdrant overlap.
+    Batches of pages of PDF and EPUB files are chunked as soon as they are extracted.
+    Bounded queues apply backpressure to preceding stages if the embedder falls behind,
+    and the embedding stage always has the next batch of chunks ready.
+
+    Failures of single documents or batches are logged and skipped, only unavailable vector storage stops the run.
+    """
+    def __init__(
+        self,
+        cybrex,
+        existence_batch_size: int = 200,
+        fetch_concurrency: int = 16,
+        chunk_workers: Optional[int] = None,
+        embed_batch_size: int = 64,
+        embed_concurrency: int = 1,
+        upsert_concurrency: int = 2,
+        queue_size: int = 64,
+        skip_downloading_pdf: bool = True,
+        report_interval: float = 30.0,
+    ):
+        """
+        :param cybrex: an instance of `CybrexAI`
+        :param existence_batch_size: how many documents are checked for existence in vector storage at once
+        :param fetch_concurrency: number of concurrent content resolutions
+        :param chunk_workers: number of processes for chunking, CPU count by default, 0 chunks in threads
+        :param embed_batch_size: number of chunks passed to the embedder at once
+        :param embed_concurrency: number of concurrent calls of the embedder
+        :param upsert_concurrency: number of concurrent upserts into vector storage
+        :param queue_size: capacity of queues between stages
+        :param skip_downloading_pdf: skip documents without `content` field
+        :param report_interval: how often throughput of stages is logged, in seconds
+        """
+        self.cybrex = cybrex
+        self.existence_batch_size = existence_batch_size
+        self.fetch_concurrency = fetch_concurrency
+        self.chunk_workers = os.cpu_count() if chunk_workers is None else chunk_workers
+        self.embed_batch_size = embed_batch_size
+        self.embed_concurrency = embed_concurrency
+        self.upsert_concurrency = upsert_concurrency
+        self.queue_size = queue_size
+        self.skip_downloading_pdf = skip_downloading_pdf
+        self.report_interval = report_interval
+        self.stats = {}
+        self.started_at = None
+
+    def _create_stats(self, name: str, concurrency: int) -> StageStats:
+        self.stats[name] = StageStats(name, concurrency)
+        return self.stats[name]
+
+    def report(self) -> List[dict]:
+        elapsed = time.monotonic() - self.started_at
+        return [stats.to_dict(elapsed) for stats in self.stats.values()]
+
+    async def _run_workers(
+        self,
+        name: str,
+        concurrency: int,
+        input_queue: asyncio.Queue,
+        output_queue: Optional[asyncio.Queue],
+        handler: Callable[[object], Awaitable[Optional[object]]],
+    ):
+        stats = self._create_stats(name, concurrency)
+
+        async def worker():
+            while True:
+                item = await input_queue.get()
+                if item is _DONE:
+                    # Put the marker back for remaining workers of the stage
+                    await input_queue.put(_DONE)
+                    return
+                started_at = time.monotonic()
+                result = await handler(item)
+                stats.busy += time.monotonic() - started_at
+                stats.items += 1
+                if result is not None and output_queue is not None:
+                    await output_queue.put(result)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        if output_queue is not None:
+            await output_queue.put(_DONE)
+
+    async def _stream(self, documents: AsyncIterable[SourceDocument], fetch_queue: asyncio.Queue):
+        stats = self._create_stats('stream', 1)
+        loop = asyncio.get_running_loop()
+
+        async def check_batch(batch):
+            started_at = time.monotonic()
+            stored_document_ids = await loop.run_in_executor(
+                None,
+                lambda: self.cybrex.vector_storage.existing_document_ids(document.document_id for document in batch),
+            )
+            stats.busy += time.monotonic() - started_at
+            for document in batch:
+                stats.items += 1
+                if document.document_id in stored_document_ids:
+                    logging.getLogger('statbox').info({
+                        'action': 'already_stored',
+                        'mode': 'cybrex',
+                        'document_id': document.document_id,
+                    })
+                    continue
+                if self.skip_downloading_pdf and 'content' not in document.document:
+                    logging.getLogger('statbox').info({
+                        'action': 'no_content',
+                        'mode': 'cybrex',
+                        'document_id': document.document_id,
+                    })
+                    continue
+                await fetch_queue.put(document)
+
+        batch = []
+        async for document in documents:
+            batch.append(document)
+            if len(batch) >= self.existence_batch_size:
+                await check_batch(batch)
+                batch = []
+        if batch:
+            await check_batch(batch)
+        await fetch_queue.put(_DONE)
+
+    @staticmethod
+    def _log_broken_content(document: SourceDocument, error: Exception):
+        logging.getLogger('statbox').info({
+            'action': 'broken_content',
+            'mode': 'cybrex',
+            'document_id': document.document_id,
+            'error': repr(error),
+        })
+
+    async def _fetch(self, document: SourceDocument, chunk_queue: asyncio.Queue):
+        """
+        Sends parts of the document to chunking as they are extracted, followed by the marker with the number of parts
+        """
+        assembly = DocumentAssembly(document)
+        n_parts = 0
+        try:
+            async for content in self.cybrex.stream_document_content(document):
+                if content:
+                    await chunk_queue.put((assembly, n_parts, content))
+                    n_parts += 1
+        except Exception as e:
+            assembly.is_failed = True
+            self._log_broken_content(document, e)
+            return
+        if not n_parts:
+            logging.getLogger('statbox').info({
+                'action': 'no_content',
+                'mode': 'cybrex',
+                'document_id': document.document_id,
+            })
+            return
+        await chunk_queue.put((assembly, n_parts, None))
+
+    async def _embed(self, input_queue: asyncio.Queue, upsert_queue: asyncio.Queue):
+        stats = self._create_stats('embed', self.embed_concurrency)
+        loop = asyncio.get_running_loop()
+
+        async def embed_batch(batch):
+            started_at = time.monotonic()
+            try:
+                await loop.run_in_executor(None, lambda: self.cybrex.vector_storage.embed_chunks(batch))
+            except QdrantStorageNotAvailableError:
+                raise
+            except Exception as e:
+                logging.getLogger('warning').warning({
+                    'action': 'failed_embedding',
+                    'mode': 'cybrex',
+                    'document_ids': sorted({chunk.document_id for chunk in batch}),
+                    'error': repr(e),
+                })
+                return
+            finally:
+                stats.busy += time.monotonic() - started_at
+            stats.items += len(batch)
+            await upsert_queue.put(batch)
+
+        async def worker():
+            batch = []
+            while True:
+                chunks = await input_queue.get()
+                if chunks is _DONE:
+                    await input_queue.put(_DONE)
+                    break
+                batch.extend(chunks)
+                while len(batch) >= self.embed_batch_size:
+                    await embed_batch(batch[:self.embed_batch_size])
+                    batch = batch[self.embed_batch_size:]
+            if batch:
+                await embed_batch(batch)
+
+        await asyncio.gather(*(worker() for _ in range(self.embed_concurrency)))
+        await upsert_queue.put(_DONE)
+
+    async def _report_periodically(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            for stage_report in self.report():
+                logging.getLogger('statbox').info({'action': 'ingestion_progress', 'mode': 'cybrex', **stage_report})
+
+    async def run(self, documents: AsyncIterable[SourceDocument]) -> List[dict]:
+        """
+        Upserts documents into vector storage
+
+        :param documents: stream of documents, i.e. `GeckDataSource.stream_documents()`
+        :return: number of processed items, throughput and utilization of every stage,
+            items are documents for `stream` and `fetch`, parts of documents for `chunk`, chunks for `embed`
+            and batches for `upsert`
+        """
+        self.stats = {}
+        self.started_at = time.monotonic()
+        loop = asyncio.get_running_loop()
+        fetch_queue, chunk_queue, embed_queue, upsert_queue = (asyncio.Queue(self.queue_size) for _ in range(4))
+
+        process_pool = None
+        if self.chunk_workers:
+            process_pool = ProcessPoolExecutor(
+                max_workers=self.chunk_workers,
+                initializer=_init_chunking_worker,
+                initargs=(self.cybrex.document_chunker,),
+            )
+
+        async def chunk(part: Tuple[DocumentAssembly, int, Optional[str]]) -> Optional[List[Chunk]]:
+            assembly, index, content = part
+            if content is None:
+                assembly.n_parts = index
+            elif not assembly.is_failed:
+                document = assembly.get_part_document(index, content)
+                try:
+                    if process_pool:
+                        chunks = await loop.run_in_executor(process_pool, _to_chunks, document)
+                    else:
+                        chunks = await loop.run_in_executor(None, self.cybrex.document_chunker.to_chunks, document)
+                except Exception as e:
+                    if not assembly.is_failed:
+                        assembly.is_failed = True
+                        self._log_broken_content(assembly.document, e)
+                    return
+                assembly.parts[index] = chunks
+            if assembly.is_complete():
+                return assembly.get_chunks() or None
+
+        async def upsert(chunks: List[Chunk]):
+            try:
+                await loop.run_in_executor(None, lambda: self.cybrex.vector_storage.upsert(chunks))
+            except QdrantStorageNotAvailableError:
+                raise
+            except Exception as e:
+                logging.getLogger('warning').warning({
+                    'action': 'failed_upsert',
+                    'mode': 'cybrex',
+                    'document_ids': sorted({chunk.document_id for chunk in chunks}),
+                    'error': repr(e),
+                })
+
+        tasks = [
+            asyncio.create_task(self._stream(documents, fetch_queue)),
+            asyncio.create_task(self._run_workers(
+                'fetch',
+                self.fetch_concurrency,
+                fetch_queue,
+                chunk_queue,
+                lambda document: self._fetch(document, chunk_queue),
+            )),
+            asyncio.create_task(self._run_workers('chunk', max(self.chunk_workers, 1), chunk_queue, embed_queue, chunk)),
+            asyncio.create_task(self._embed(embed_queue, upsert_queue)),
+            asyncio.create_task(self._run_workers('upsert', self.upsert_concurrency, upsert_queue, None, upsert)),
+        ]
+        reporter = asyncio.create_task(self._report_periodically())
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            reporter.cancel()
+            for task in tasks:
+                task.cancel()
+            if process_pool:
+                process_pool.shutdown()
+        report = self.report()
+        for stage_report in report:
+            logging.getLogger('statbox').info({'action': 'ingested', 'mode': 'cybrex', **stage_report})
+        return report
@@ -2,12 +2,18 @@ import logging
 
 
 class LLMManager:
-    def __init__(self, llm, prompter, config, max_prompt_chars, tokenizer=None):
+    def __init__(self, llm, prompter, config, max_prompt_chars, tokenizer=None, map_concurrency: int = 1):
+        """
+        :param map_concurrency: number of prompts processed concurrently by map steps of chains,
+            should be 1 for models that are loaded in-process or use HuggingFace tokenizers,
+            as neither is thread-safe
+        """
         self.llm = llm
         self.prompter = prompter
         self.config = config
         self.max_prompt_chars = max_prompt_chars
         self.tokenizer = tokenizer
+        self.map_concurrency = map_concurrency
 
     @property
     def context_length(self):
@@ -46,6 +46,8 @@ class CybrexModel:
                 'add_metadata': True,
                 'chunk_size': 1024,
                 'chunk_overlap': 128,
+                # `unstructured` or `lxml`, the latter is much faster but starts sections only on headers
+                'engine': 'unstructured',
                 'type': 'rcts',
             },
             'embedder': cls.standard_embedders(embedder_name, device=device),
@@ -169,6 +171,7 @@ class CybrexModel:
             'openai': {
                 'config': {},
                 'max_prompt_chars': int(4096 * 3.5),
+                'map_concurrency': 8,
                 'model_type': 'openai',
                 'prompter': {
                     'type': 'default'
@@ -209,6 +212,7 @@ class CybrexModel:
                 prompter=BasePrompter.prompter_from_type(self.config['llm']['prompter']['type']),
                 config=self.config['llm']['config'],
                 max_prompt_chars=self.config['llm']['max_prompt_chars'],
+                map_concurrency=self.config['llm'].get('map_concurrency', 1),
             )
         elif self.config['llm']['model_type'] == 'mistral':
             return LLMManager(
@@ -216,6 +220,7 @@ class CybrexModel:
                 prompter=BasePrompter.prompter_from_type(self.config['llm']['prompter']['type']),
                 config=self.config['llm']['config'],
                 max_prompt_chars=self.config['llm']['max_prompt_chars'],
+                map_concurrency=self.config['llm'].get('map_concurrency', 1),
             )
         elif self.config['llm']['model_type'] == 'openai':
             return LLMManager(
@@ -223,6 +228,7 @@ class CybrexModel:
                 prompter=BasePrompter.prompter_from_type(self.config['llm']['prompter']['type']),
                 config=self.config['llm']['config'],
                 max_prompt_chars=self.config['llm']['max_prompt_chars'],
+                map_concurrency=self.config['llm'].get('map_concurrency', 1),
             )
         elif self.config['llm']['model_type'] == 'petals':
             from petals import AutoDistributedModelForCausalLM
@@ -236,6 +242,7 @@ class CybrexModel:
                 config=self.config['llm']['config'],
                 max_prompt_chars=self.config['llm']['max_prompt_chars'],
                 tokenizer=AutoTokenizer.from_pretrained(self.config['llm']['config']['model_name']),
+                map_concurrency=self.config['llm'].get('map_concurrency', 1),
             )
 
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
@@ -251,5 +258,8 @@ class CybrexModel:
         text_splitter_id = f'{self.config["text_splitter"]["type"]}' \
                            f'-{self.config["text_splitter"]["chunk_size"]}' \
                            f'-{self.config["text_splitter"]["chunk_overlap"]}'
+        # Chunks of different engines are stored separately, keeping identifiers of existing collections
+        if (engine := self.config['text_splitter'].get('engine', 'unstructured')) != 'unstructured':
+            text_splitter_id += f'-{engine}'
         embedder_id = self.config['embedder']['model_name'].replace('/', '-')
         return f"{embedder_id}-{text_splitter_id}"
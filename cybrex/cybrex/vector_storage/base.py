@@ -1,11 +1,56 @@
+import dataclasses
 from typing import (
+    Callable,
     Iterable,
     List,
     Optional,
+    Set,
     Tuple,
 )
 
+from ..document_chunker import Chunk
+from ..embedding_cache import EmbeddingCache
+
+
+@dataclasses.dataclass
+class ScoredChunk:
+    chunk: Chunk
+    score: float
+
 
 class BaseVectorStorage:
+    def __init__(
+        self,
+        embedding_function: Callable[[List[str]], List[List[float]]],
+        embedding_cache: Optional[EmbeddingCache] = None,
+    ):
+        self.embedding_function = embedding_function
+        self.embedding_cache = embedding_cache
+
+    def embed_chunks(self, chunks: List[Chunk]):
+        """
+        Fills `embedding` of chunks, so they may be embedded and upserted separately
+        """
+        texts = [chunk.real_text or chunk.text for chunk in chunks]
+        if self.embedding_cache:
+            embeddings = self.embedding_cache.embed(texts, self.embedding_function)
+        else:
+            embeddings = self.embedding_function(texts)
+        for chunk, embedding in zip(chunks, embeddings):
+            chunk.embedding = embedding
+            chunk.real_text = None
+
     def query(self, query_embedding: List[float], n_chunks: int, field_values: Optional[Iterable[Tuple[str, str]]] = None):
         raise NotImplementedError()
+
+    def upsert(self, chunks: List[Chunk]):
+        raise NotImplementedError()
+
+    def get_by_field_values(self, field_values: Iterable[Tuple[str, str]], sort: bool = True) -> List[Chunk]:
+        raise NotImplementedError()
+
+    def exists_by_field_value(self, field, value) -> bool:
+        raise NotImplementedError()
+
+    def existing_document_ids(self, document_ids: Iterable[str]) -> Set[str]:
+        raise NotImplementedError()
@@ -0,0 +1,398 @@
+import dataclasses
+import json
+import logging
+import os.path
+import threading
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import numpy as np
+from izihawa_utils.file import mkdir_p
+
+from ..document_chunker import Chunk
+from ..embedding_cache import EmbeddingCache
+from .base import (
+    BaseVectorStorage,
+    ScoredChunk,
+)
+
+SUPPORTED_DTYPES = ('float16', 'int8')
+SUPPORTED_QUANTIZATIONS = ('int8', 'binary')
+SCORING_BLOCK_SIZE = 65536
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric scalar quantization with a scale per vector
+    """
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    """
+    Signs of components packed into bits, similarity of vectors is estimated by Hamming distance
+    """
+    return np.packbits(vectors > 0, axis=1)
+
+
+class IvfIndex:
+    """
+    Inverted file index: vectors are clustered by spherical k-means and only clusters closest to the query are scanned
+    """
+    def __init__(self, n_lists: int, n_probe: int, n_iterations: int = 10, seed: int = 0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iterations = n_iterations
+        self.random = np.random.default_rng(seed)
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int32)
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def build(self, get_vectors: Callable[[np.ndarray], np.ndarray], n_rows: int):
+        """
+        :param get_vectors: function returning dequantized vectors of rows
+        :param n_rows: number of rows
+        """
+        n_lists = min(self.n_lists, n_rows)
+        sample = get_vectors(np.sort(self.random.choice(n_rows, size=min(n_rows, 256 * n_lists), replace=False)))
+        self.centroids = sample[self.random.choice(len(sample), size=n_lists, replace=False)]
+        for _ in range(self.n_iterations):
+            assignments = self.assign(sample)
+            for list_id in range(n_lists):
+                centroid = sample[assignments == list_id].sum(axis=0)
+                if norm := np.linalg.norm(centroid):
+                    self.centroids[list_id] = centroid / norm
+        self.assignments = np.concatenate([
+            self.assign(get_vectors(np.arange(start, min(start + SCORING_BLOCK_SIZE, n_rows))))
+            for start in range(0, n_rows, SCORING_BLOCK_SIZE)
+        ])
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        if (new_size := int(rows.max()) + 1) > len(self.assignments):
+            self.assignments = np.concatenate([self.assignments, np.zeros(new_size - len(self.assignments), dtype=np.int32)])
+        self.assignments[rows] = self.assign(vectors)
+
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        probes = np.argsort(-(self.centroids @ query))[:self.n_probe]
+        return np.flatnonzero(np.isin(self.assignments, probes))
+
+
+class LocalVectorStorage(BaseVectorStorage):
+    """
+    In-process vector storage keeping normalized embeddings in a memory-mapped array.
+
+    The collection directory contains `vectors` with float16 or int8 rows, `scales` with float32 scales of int8 rows,
+    and `payloads`, a log of JSON lines with rows and payloads of chunks. The log is replayed on opening, so later lines
+    win for rewritten chunks. Search computes dot products by blocks of rows, or only for rows of clusters closest
+    to the query if the collection is larger than `ivf_threshold`.
+
+    With `quantization`, compact `codes` of vectors are stored besides and searched first. Only `oversampling` times
+    more candidates than requested are then rescored with `vectors`, so the bulk of `vectors` stays on disk.
+    """
+    def __init__(
+        self,
+        directory: str,
+        collection_name: str,
+        embedding_function,
+        dtype: str = 'float16',
+        ivf_threshold: Optional[int] = None,
+        ivf_lists: int = 256,
+        ivf_probe: int = 16,
+        quantization: Optional[str] = None,
+        oversampling: float = 4.0,
+        embedding_cache: Optional[EmbeddingCache] = None,
+    ):
+        """
+        :param directory: root directory of collections
+        :param collection_name: name of the collection
+        :param embedding_function: function embedding a list of texts
+        :param dtype: `float16` or `int8`, the latter halves the size at the cost of precision
+        :param ivf_threshold: number of rows since which IVF index is used for queries without filters, never if not set
+        :param ivf_lists: number of IVF clusters
+        :param ivf_probe: number of IVF clusters scanned for every query
+        :param quantization: `int8` or `binary` codes used for the coarse pass of search, no coarse pass if not set
+        :param oversampling: the coarse pass selects `n_chunks * oversampling` candidates for exact rescoring
+        :param embedding_cache: cache consulted before calling `embedding_function`
+        """
+        super().__init__(embedding_function=embedding_function, embedding_cache=embedding_cache)
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f'Unsupported dtype `{dtype}`, should be one of {SUPPORTED_DTYPES}')
+        if quantization is not None and quantization not in SUPPORTED_QUANTIZATIONS:
+            raise ValueError(f'Unsupported quantization `{quantization}`, should be one of {SUPPORTED_QUANTIZATIONS}')
+        self.directory = os.path.join(directory, collection_name)
+        self.collection_name = collection_name
+        self.dtype = dtype
+        self.ivf_threshold = ivf_threshold
+        self.ivf_lists = ivf_lists
+        self.ivf_probe = ivf_probe
+        self.quantization = quantization
+        self.oversampling = oversampling
+        self.meta_path = os.path.join(self.directory, 'meta.json')
+        self.vectors_path = os.path.join(self.directory, 'vectors')
+        self.scales_path = os.path.join(self.directory, 'scales')
+        self.payloads_path = os.path.join(self.directory, 'payloads')
+        self.codes_path = os.path.join(self.directory, 'codes')
+        self.code_scales_path = os.path.join(self.directory, 'code_scales')
+        self.lock = threading.Lock()
+        self.dimension = None
+        self.payloads: List[dict] = []
+        self.point_rows: Dict[Tuple[str, int], int] = {}
+        self.document_rows: Dict[str, Set[int]] = {}
+        self.vectors = None
+        self.scales = None
+        self.codes = None
+        self.code_scales = None
+        self.ivf_index = None
+        self.ivf_size = 0
+        self._load()
+
+    @property
+    def row_size(self) -> int:
+        return self.dimension * np.dtype(self.dtype).itemsize
+
+    @property
+    def code_size(self) -> int:
+        return self.dimension if self.quantization == 'int8' else (self.dimension + 7) // 8
+
+    def _write_meta(self):
+        with open(self.meta_path + '.tmp', 'w') as f:
+            json.dump({'dimension': self.dimension, 'dtype': self.dtype, 'quantization': self.quantization}, f)
+        os.replace(self.meta_path + '.tmp', self.meta_path)
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        self.dimension, self.dtype = meta['dimension'], meta['dtype']
+        # Missing data files are treated as empty ones
+        for path in (self.vectors_path, self.scales_path, self.payloads_path, self.codes_path, self.code_scales_path):
+            open(path, 'ab').close()
+        n_vectors = os.path.getsize(self.vectors_path) // self.row_size
+        with open(self.payloads_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn write of the last line
+                    break
+                if record['row'] >= n_vectors:
+                    break
+                self._set_payload(record['row'], record['payload'])
+        self._map_vectors()
+        if self.quantization and (meta.get('quantization') != self.quantization or self.codes is None):
+            self._rebuild_codes()
+        elif meta.get('quantization') != self.quantization:
+            # Codes are not updated by upserts anymore, so they are rebuilt once quantization is enabled again
+            self._write_meta()
+
+    def _rebuild_codes(self):
+        logging.getLogger('statbox').info({
+            'action': 'build_codes',
+            'mode': 'cybrex',
+            'collection_name': self.collection_name,
+            'quantization': self.quantization,
+            'rows': len(self.payloads),
+        })
+        for path in (self.codes_path, self.code_scales_path):
+            open(path, 'wb').close()
+        for start in range(0, len(self.payloads), SCORING_BLOCK_SIZE):
+            rows = np.arange(start, min(start + SCORING_BLOCK_SIZE, len(self.payloads)))
+            self._write_codes(rows, self._get_vectors(rows))
+        self._write_meta()
+        self._map_vectors()
+
+    def _map_vectors(self):
+        self.vectors, self.scales = None, None
+        if self.payloads:
+            n_rows = len(self.payloads)
+            self.vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode='r', shape=(n_rows, self.dimension))
+            if self.dtype == 'int8':
+                self.scales = np.memmap(self.scales_path, dtype=np.float32, mode='r', shape=(n_rows,))
+            self.codes, self.code_scales = None, None
+            if self.quantization and os.path.exists(self.codes_path) and os.path.getsize(self.codes_path) >= n_rows * self.code_size:
+                self.codes = np.memmap(self.codes_path, dtype=np.uint8, mode='r', shape=(n_rows, self.code_size))
+                if self.quantization == 'int8':
+                    self.codes = self.codes.view(np.int8)
+                    self.code_scales = np.memmap(self.code_scales_path, dtype=np.float32, mode='r', shape=(n_rows,))
+
+    def _set_payload(self, row: int, payload: dict):
+        if row == len(self.payloads):
+            self.payloads.append(payload)
+        else:
+            previous_payload = self.payloads[row]
+            self.document_rows[previous_payload['document_id']].discard(row)
+            self.payloads[row] = payload
+        self.point_rows[(payload['document_id'], payload['chunk_id'])] = row
+        self.document_rows.setdefault(payload['document_id'], set()).add(row)
+
+    def _encode(self, embeddings: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        if self.dtype == 'int8':
+            return quantize_int8(embeddings)
+        return embeddings.astype(np.float16), None
+
+    def _write_rows(self, path: str, rows: List[int], values: np.ndarray):
+        row_size = values[0].nbytes
+        with open(path, 'r+b') as f:
+            for row, value in zip(rows, values):
+                f.seek(row * row_size)
+                f.write(value.tobytes())
+
+    def _write_codes(self, rows: List[int], vectors: np.ndarray):
+        if self.quantization == 'int8':
+            codes, code_scales = quantize_int8(vectors)
+            self._write_rows(self.code_scales_path, rows, code_scales)
+        else:
+            codes = quantize_binary(vectors)
+        self._write_rows(self.codes_path, rows, codes)
+
+    def _coarse_score(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        scores = np.empty(len(rows), dtype=np.float32)
+        if self.quantization == 'binary':
+            query_code = quantize_binary(query[None, :])[0]
+        for start in range(0, len(rows), SCORING_BLOCK_SIZE):
+            block_rows = rows[start:start + SCORING_BLOCK_SIZE]
+            if self.quantization == 'int8':
+                block_scores = (np.asarray(self.codes[block_rows], dtype=np.float32) @ query) * self.code_scales[block_rows]
+            else:
+                block_scores = -POPCOUNT[np.bitwise_xor(self.codes[block_rows], query_code)].sum(axis=1, dtype=np.int32)
+            scores[start:start + SCORING_BLOCK_SIZE] = block_scores
+        return scores
+
+    def _get_vectors(self, rows: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows, None]
+        return vectors
+
+    def _score(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SCORING_BLOCK_SIZE):
+            scores[start:start + SCORING_BLOCK_SIZE] = self._get_vectors(rows[start:start + SCORING_BLOCK_SIZE]) @ query
+        return scores
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        """
+        Returns indices of `k` largest scores in descending order of scores
+        """
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        return top[np.argsort(-scores[top])]
+
+    def _ensure_ivf_index(self):
+        n_rows = len(self.payloads)
+        if not self.ivf_threshold or n_rows < self.ivf_threshold:
+            return
+        # The index is rebuilt when the collection has doubled, so clusters follow the distribution of new vectors
+        if self.ivf_index is None or n_rows >= 2 * self.ivf_size:
+            logging.getLogger('statbox').info({
+                'action': 'build_ivf_index',
+                'mode': 'cybrex',
+                'collection_name': self.collection_name,
+                'rows': n_rows,
+            })
+            self.ivf_index = IvfIndex(n_lists=self.ivf_lists, n_probe=self.ivf_probe)
+            self.ivf_index.build(self._get_vectors, n_rows)
+            self.ivf_size = n_rows
+
+    def _matching_rows(self, field_values: Iterable[Tuple[str, str]]) -> Set[int]:
+        rows = set()
+        for field, value in field_values:
+            if field == 'document_id':
+                rows.update(self.document_rows.get(value, ()))
+            else:
+                rows.update(row for row, payload in enumerate(self.payloads) if payload.get(field) == value)
+        return rows
+
+    def get_by_field_values(self, field_values: Iterable[Tuple[str, str]], sort: bool = True) -> List[Chunk]:
+        with self.lock:
+            chunks = [Chunk(**self.payloads[row]) for row in self._matching_rows(field_values)]
+        if sort:
+            return list(sorted(chunks, key=lambda x: (x.document_id, x.chunk_id)))
+        return chunks
+
+    def exists_by_field_value(self, field, value) -> bool:
+        with self.lock:
+            return bool(self._matching_rows([(field, value)]))
+
+    def existing_document_ids(self, document_ids: Iterable[str]) -> Set[str]:
+        with self.lock:
+            return {document_id for document_id in document_ids if self.document_rows.get(document_id)}
+
+    def query(self, query_embedding, n_chunks: int, field_values: Optional[Iterable[Tuple[str, str]]] = None) -> List[ScoredChunk]:
+        with self.lock:
+            if n_chunks == 0 or not self.payloads:
+                return []
+            query = np.asarray(query_embedding, dtype=np.float32)
+            query /= np.linalg.norm(query) or 1.0
+            rows = np.arange(len(self.payloads))
+            if field_values:
+                rows = np.fromiter(sorted(self._matching_rows(field_values)), dtype=np.int64)
+            else:
+                self._ensure_ivf_index()
+                if self.ivf_index is not None:
+                    rows = self.ivf_index.candidates(query)
+            if self.codes is not None and len(rows) > (n_candidates := int(n_chunks * self.oversampling)):
+                rows = np.sort(rows[self._top(self._coarse_score(query, rows), n_candidates)])
+            scores = self._score(query, rows)
+            top = self._top(scores, n_chunks)
+            return [
+                ScoredChunk(chunk=Chunk(**self.payloads[rows[i]]), score=float(scores[i]))
+                for i in top
+            ]
+
+    def upsert(self, chunks: List[Chunk]):
+        if not chunks:
+            return
+        if not chunks[0].embedding:
+            self.embed_chunks(chunks)
+        embeddings = np.asarray([chunk.embedding for chunk in chunks], dtype=np.float32)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        vectors, scales = self._encode(embeddings)
+        for chunk in chunks:
+            chunk.embedding = None
+        with self.lock:
+            if self.dimension is None:
+                mkdir_p(self.directory)
+                # Files without `meta.json` are left by an interrupted creation of the collection
+                for path in (self.vectors_path, self.scales_path, self.payloads_path, self.codes_path, self.code_scales_path):
+                    open(path, 'wb').close()
+                self.dimension = vectors.shape[1]
+                self._write_meta()
+            rows, new_rows, next_row = [], {}, len(self.payloads)
+            for chunk in chunks:
+                point = (chunk.document_id, chunk.chunk_id)
+                if point not in self.point_rows and point not in new_rows:
+                    new_rows[point] = next_row
+                    next_row += 1
+                rows.append(self.point_rows.get(point, new_rows.get(point)))
+            # Vectors are written before payloads, so rows in the payload log always have their vectors.
+            # In-memory index is updated only after all writes have succeeded
+            self._write_rows(self.vectors_path, rows, vectors)
+            if scales is not None:
+                self._write_rows(self.scales_path, rows, scales)
+            if self.quantization:
+                self._write_codes(rows, embeddings)
+            payloads = [dataclasses.asdict(chunk) for chunk in chunks]
+            with open(self.payloads_path, 'a') as payloads_file:
+                payloads_file.write(''.join(
+                    json.dumps({'row': row, 'payload': payload}) + '\n'
+                    for row, payload in zip(rows, payloads)
+                ))
+            for row, payload in zip(rows, payloads):
+                self._set_payload(row, payload)
+            self._map_vectors()
+            if self.ivf_index is not None:
+                rows = np.asarray(rows)
+                self.ivf_index.add(rows, self._get_vectors(rows))
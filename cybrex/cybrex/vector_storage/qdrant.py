@@ -5,41 +5,84 @@ from typing import (
     Iterable,
     List,
     Optional,
+    Set,
     Tuple,
 )
 
 import grpc
 from qdrant_client import QdrantClient
 from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
     Distance,
     FieldCondition,
     Filter,
+    MatchAny,
     MatchValue,
     PayloadSchemaType,
     PointStruct,
+    QuantizationSearchParams,
     Range,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
     VectorParams,
 )
 
 from ..document_chunker import Chunk
+from ..embedding_cache import EmbeddingCache
 from ..exceptions import QdrantStorageNotAvailableError
-from .base import BaseVectorStorage
+from .base import (
+    BaseVectorStorage,
+    ScoredChunk,
+)
 
 
-@dataclasses.dataclass
-class ScoredChunk:
-    chunk: Chunk
-    score: float
+SUPPORTED_QUANTIZATIONS = ('int8', 'binary')
 
 
 class QdrantVectorStorage(BaseVectorStorage):
-    def __init__(self, qdrant_config, collection_name, embedding_function, force_recreate: bool = False):
+    def __init__(
+        self,
+        qdrant_config,
+        collection_name,
+        embedding_function,
+        force_recreate: bool = False,
+        quantization: Optional[str] = None,
+        oversampling: float = 4.0,
+        embedding_cache: Optional[EmbeddingCache] = None,
+    ):
+        """
+        :param quantization: `int8` or `binary`, quantized vectors are kept in RAM and original ones on disk,
+            applied only to collections created by this instance
+        :param oversampling: searching with quantization, `n_chunks * oversampling` candidates are rescored
+            with original vectors
+        """
+        super().__init__(embedding_function=embedding_function, embedding_cache=embedding_cache)
+        if quantization is not None and quantization not in SUPPORTED_QUANTIZATIONS:
+            raise ValueError(f'Unsupported quantization `{quantization}`, should be one of {SUPPORTED_QUANTIZATIONS}')
         self.db = QdrantClient(**qdrant_config)
         self.collection_name = collection_name
-        self.embedding_function = embedding_function
         self.force_recreate = force_recreate
+        self.quantization = quantization
+        self.oversampling = oversampling
         self.is_existing = False
 
+    def _get_collection_params(self, size) -> dict:
+        if self.quantization == 'int8':
+            quantization_config = ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8, always_ram=True),
+            )
+        elif self.quantization == 'binary':
+            quantization_config = BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+        else:
+            quantization_config = None
+        return {
+            'vectors_config': VectorParams(size=size, distance=Distance.COSINE, on_disk=quantization_config is not None),
+            'quantization_config': quantization_config,
+        }
+
     def _exists_collection(self, collection_name):
         if self.is_existing:
             return True
@@ -59,12 +102,12 @@ class QdrantVectorStorage(BaseVectorStorage):
                 return
             self.db.create_collection(
                 collection_name=collection_name,
-                vectors_config=VectorParams(size=size, distance=Distance.COSINE),
+                **self._get_collection_params(size),
             )
         else:
             self.db.recreate_collection(
                 collection_name=collection_name,
-                vectors_config=VectorParams(size=size, distance=Distance.COSINE),
+                **self._get_collection_params(size),
             )
             self.force_recreate = False
         self.is_existing = True
@@ -112,6 +155,34 @@ class QdrantVectorStorage(BaseVectorStorage):
         )
         return len(points) > 0
 
+    def existing_document_ids(self, document_ids: Iterable[str]) -> Set[str]:
+        """
+        Returns the subset of `document_ids` having chunks in the storage, using a single filtered scroll
+
+        :param document_ids: identifiers of documents
+        """
+        document_ids = list(set(document_ids))
+        if not document_ids or not self._exists_collection(self.collection_name):
+            return set()
+        existing_document_ids = set()
+        offset = None
+        while True:
+            points, offset = self.db.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=Filter(
+                    must=[FieldCondition(key='document_id', match=MatchAny(any=document_ids))],
+                    # Documents found on previous pages are excluded, so every document costs about one point
+                    must_not=[FieldCondition(key='document_id', match=MatchAny(any=list(existing_document_ids)))]
+                    if existing_document_ids else None,
+                ),
+                with_payload=['document_id'],
+                limit=len(document_ids),
+                offset=offset,
+            )
+            existing_document_ids.update(point.payload['document_id'] for point in points)
+            if offset is None:
+                return existing_document_ids
+
     def query(self, query_embedding, n_chunks: int, field_values: Optional[Iterable[Tuple[str, str]]] = None) -> List[ScoredChunk]:
         self._ensure_collection(
             collection_name=self.collection_name,
@@ -138,6 +209,9 @@ class QdrantVectorStorage(BaseVectorStorage):
             collection_name=self.collection_name,
             query_vector=query_embedding,
             query_filter=query_filter,
+            search_params=SearchParams(
+                quantization=QuantizationSearchParams(rescore=True, oversampling=self.oversampling),
+            ) if self.quantization else None,
             limit=n_chunks,
         )
         return [ScoredChunk(chunk=Chunk(**point.payload), score=point.score) for point in points]
@@ -145,32 +219,30 @@ class QdrantVectorStorage(BaseVectorStorage):
     def upsert(self, chunks: List[Chunk]):
         if not chunks:
             return
+        if not chunks[0].embedding:
+            self.embed_chunks(chunks)
+        embedding_size = len(chunks[0].embedding)
         embeddings = []
-        if chunks[0].embedding:
-            embedding_size = len(chunks[0].embedding)
-            for chunk in chunks:
-                embeddings.append(chunk.embedding)
-                chunk.embedding = None
-        else:
-            embeddings = self.embedding_function([
-                chunk.real_text or chunk.text
-                for chunk in chunks
-            ])
-            embedding_size = len(embeddings[0])
-            for chunk in chunks:
-                chunk.real_text = None
+        for chunk in chunks:
+            embeddings.append(chunk.embedding)
+            chunk.embedding = None
         self._ensure_collection(
             collection_name=self.collection_name,
             size=embedding_size,
         )
-        return self.db.upsert(
-            collection_name=self.collection_name,
-            points=[
-                PointStruct(
-                    id=hashlib.md5(f'{chunk.document_id}@{chunk.chunk_id}'.encode()).hexdigest(),
-                    vector=embedding,
-                    payload=dataclasses.asdict(chunk)
-                )
-                for chunk, embedding in zip(chunks, embeddings)
-            ]
-        )
+        try:
+            return self.db.upsert(
+                collection_name=self.collection_name,
+                points=[
+                    PointStruct(
+                        id=hashlib.md5(f'{chunk.document_id}@{chunk.chunk_id}'.encode()).hexdigest(),
+                        vector=embedding,
+                        payload=dataclasses.asdict(chunk)
+                    )
+                    for chunk, embedding in zip(chunks, embeddings)
+                ]
+            )
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.UNAVAILABLE:
+                raise QdrantStorageNotAvailableError()
+            raise
@@ -1,10 +1,22 @@
+import copy
+import dataclasses
 from collections import OrderedDict
 from typing import (
+    Dict,
     List,
     Optional,
+    Tuple,
+    Union,
 )
 
 from aiosumma import SummaClient
+from aiosumma.proto import query_pb2 as query_pb
+
+from .pagination import FIELD_NAME_REGEX
+from .query_cache import (
+    QueryCache,
+    canonize_search_request,
+)
 
 TEMPORAL_RANKING_FORMULA = "original_score * custom_score * fastsigm(abs(now - issued_at) / (86400 * 3) + 5, -1)"
 PR_TEMPORAL_RANKING_FORMULA = f"{TEMPORAL_RANKING_FORMULA} * 1.96 * fastsigm(iqpr(quantized_page_rank), 0.15)"
@@ -128,6 +140,116 @@ def get_default_scorer(profile: str):
         raise ValueError("Unknown profile")
 
 
+@dataclasses.dataclass(frozen=True)
+class ScorerProfile:
+    name: str
+    eval_expr: Optional[str]
+    # Approximate cost of scoring a single matched document relative to plain BM25
+    relative_cost: float
+
+
+scorer_profiles = OrderedDict((scorer_profile.name, scorer_profile) for scorer_profile in (
+    # Two `fastsigm`, `iqpr` and reads of three fast fields per document
+    ScorerProfile('full', PR_TEMPORAL_RANKING_FORMULA, 4.0),
+    # Single `fastsigm` and reads of two fast fields per document
+    ScorerProfile('temporal', TEMPORAL_RANKING_FORMULA, 2.5),
+    ScorerProfile('bm25', None, 1.0),
+))
+
+# Maximum number of matched documents for which the profile is used, more expensive profiles go first
+default_scorer_thresholds = {
+    'full': 100_000,
+    'temporal': 1_000_000,
+}
+
+
+def get_scorer(scorer_profile: str) -> Optional[dict]:
+    if scorer_profile not in scorer_profiles:
+        raise ValueError(f"Unknown scorer profile `{scorer_profile}`, should be one of {list(scorer_profiles)}")
+    if eval_expr := scorer_profiles[scorer_profile].eval_expr:
+        return {'eval_expr': eval_expr}
+
+
+def choose_scorer_profile(
+    matched_documents: int,
+    scorer_profile: str = 'full',
+    thresholds: Optional[Dict[str, int]] = None,
+) -> str:
+    """
+    Returns `scorer_profile` or a cheaper one if there are too many matched documents for it
+
+    :param matched_documents: number of matched documents, i.e. from `count` collector
+    :param scorer_profile: the most expensive profile allowed
+    :param thresholds: maximum number of matched documents for profiles, `default_scorer_thresholds` by default
+    """
+    thresholds = default_scorer_thresholds if thresholds is None else thresholds
+    candidates = list(scorer_profiles.values())
+    candidates = candidates[[candidate.name for candidate in candidates].index(scorer_profile):]
+    for candidate in candidates:
+        if candidate.name not in thresholds or matched_documents <= thresholds[candidate.name]:
+            return candidate.name
+    return candidates[-1].name
+
+
+def is_sorting_scorer(scorer: Optional[dict]) -> bool:
+    """
+    Returns whether the scorer sorts documents by a field instead of ranking them
+    """
+    return bool(scorer) and ('order_by' in scorer or bool(FIELD_NAME_REGEX.fullmatch(scorer.get('eval_expr', ''))))
+
+
+async def search_with_adaptive_scorer(
+    summa_client: SummaClient,
+    search_request: dict,
+    scorer_profile: str = 'full',
+    thresholds: Optional[Dict[str, int]] = None,
+    count_cache: Optional[QueryCache] = None,
+) -> Tuple[query_pb.SearchResponse, Optional[str]]:
+    """
+    Searches with the scorer profile chosen by `choose_scorer_profile` for the number of matched documents.
+    Counting does not evaluate ranking formulas, so it is cheap compared to scoring broad queries with the full formula.
+
+    Counts are stored in `count_cache`, so further pages and repeated queries are not counted again
+    and get the same profile. `top_docs` collectors sorting documents by a field are left intact,
+    and nothing is counted if there are no other `top_docs` collectors.
+
+    :param summa_client: Summa client
+    :param search_request: search request, its ranking `top_docs` collectors get the chosen scorer
+    :param scorer_profile: the most expensive profile allowed
+    :param thresholds: maximum number of matched documents for profiles, `default_scorer_thresholds` by default
+    :param count_cache: cache for numbers of matched documents
+    :return: search response and the name of the chosen profile, `None` if no collector has been changed
+    """
+    ranking_collectors = [
+        collector_index
+        for collector_index, collector in enumerate(search_request['collectors'])
+        if 'top_docs' in collector and not is_sorting_scorer(collector['top_docs'].get('scorer'))
+    ]
+    if not ranking_collectors:
+        return await summa_client.search(search_request), None
+    count_request = {
+        'index_alias': search_request['index_alias'],
+        'query': search_request['query'],
+        'collectors': [{'count': {}}],
+    }
+    count_key = canonize_search_request(count_request)
+    matched_documents = count_cache.get(count_key) if count_cache is not None else None
+    if matched_documents is None:
+        count_response = await summa_client.search(count_request)
+        matched_documents = count_response.collector_outputs[0].count.count
+        if count_cache is not None:
+            count_cache.put(count_key, matched_documents)
+    chosen_profile = choose_scorer_profile(matched_documents, scorer_profile=scorer_profile, thresholds=thresholds)
+    search_request = copy.deepcopy(search_request)
+    for collector_index in ranking_collectors:
+        top_docs = search_request['collectors'][collector_index]['top_docs']
+        if scorer := get_scorer(chosen_profile):
+            top_docs['scorer'] = scorer
+        else:
+            top_docs.pop('scorer', None)
+    return await summa_client.search(search_request), chosen_profile
+
+
 def format_document(document: dict):
     parts = []
     if title := document.get('title'):
@@ -143,33 +265,50 @@ def format_document(document: dict):
     return '\n'.join(parts)
 
 
-class BaseDocumentHolder:
-    def __init__(self, document):
-        self.document = document
+INTERNAL_ID_FIELDS = (
+    ('internal_iso', 'id.internal_iso', None),
+    ('internal_bs', 'id.internal_bs', None),
+    ('pubmed_id', 'id.pubmed_id', None),
+    ('ark_ids', 'id.ark_ids', -1),
+    ('libgen_ids', 'id.libgen_ids', -1),
+    ('zlibrary_ids', 'id.zlibrary_ids', -1),
+    ('nexus_id', 'id.nexus_id', None),
+    ('wiki', 'id.wiki', None),
+    ('manualslib_id', 'id.manualslib_id', None),
+)
 
-    def __getattr__(self, name):
-        if name in self.document:
-            return self.document[name]
-        elif 'metadata' in self.document and name in self.document['metadata']:
-            return self.document['metadata'][name]
-        elif 'id' in self.document and name in self.document['id']:
-            return self.document['id'][name]
 
-    def has_cover(self):
-        return bool(self.isbns and len(self.isbns) > 0)
+class DocumentView:
+    """
+    Compact view of the document built once from the decoded JSON.
 
-    def get_links(self):
-        if self.has_field('links') and self.links:
-            return LinksWrapper(self.links)
-        return LinksWrapper([])
+    Fields of the top level, `metadata` and `id` are merged into a single flat index with the same precedence
+    `BaseDocumentHolder` uses for attribute lookups. The document is not expected to be modified after the view is built.
+    """
+    __slots__ = ('document', 'fields', 'internal_id', 'ordered_links')
 
-    @property
-    def ordered_links(self):
-        links = self.get_links()
+    def __init__(self, document: dict):
+        self.document = document
+        fields = {}
+        fields.update(document.get('id', {}))
+        fields.update(document.get('metadata', {}))
+        fields.update(document)
+        self.fields = fields
+        self.internal_id = self._compute_internal_id()
+        self.ordered_links = self._compute_ordered_links()
+
+    def _compute_internal_id(self) -> Optional[str]:
+        if (dois := self.fields.get('dois')) and dois[0]:
+            return f'id.dois:{dois[0]}'
+        for field, internal_field, index in INTERNAL_ID_FIELDS:
+            if value := self.fields.get(field):
+                return f'{internal_field}:{value[index] if index is not None else value}'
+
+    def _compute_ordered_links(self) -> tuple:
         pdf_link = None
         epub_link = None
         other_links = []
-        for link in links.links.values():
+        for link in LinksWrapper(self.fields.get('links') or []).links.values():
             if link['extension'] == 'pdf' and not pdf_link:
                 pdf_link = link
             elif link['extension'] == 'pdf' and not epub_link:
@@ -180,43 +319,37 @@ class BaseDocumentHolder:
             other_links = [epub_link] + other_links
         if pdf_link:
             other_links = [pdf_link] + other_links
-        return other_links
+        return tuple(other_links)
+
+
+class BaseDocumentHolder:
+    def __init__(self, document: Union[dict, DocumentView]):
+        self.view = document if isinstance(document, DocumentView) else DocumentView(document)
+        self.document = self.view.document
+
+    def __getattr__(self, name):
+        return self.view.fields.get(name)
+
+    def has_cover(self):
+        return bool(self.isbns and len(self.isbns) > 0)
+
+    def get_links(self):
+        return LinksWrapper(self.view.fields.get('links') or [])
+
+    @property
+    def ordered_links(self):
+        return list(self.view.ordered_links)
 
     @property
     def doi(self):
-        if self.has_field('dois') and self.dois:
-            return self.dois[0]
+        if dois := self.view.fields.get('dois'):
+            return dois[0]
 
     def has_field(self, name):
-        return (
-            name in self.document
-            or name in self.document.get('metadata', {})
-            or name in self.document.get('id', {})
-        )
+        return name in self.view.fields
 
     def get_internal_id(self):
-        if self.doi:
-            return f'id.dois:{self.doi}'
-        elif self.internal_iso:
-            return f'id.internal_iso:{self.internal_iso}'
-        elif self.internal_bs:
-            return f'id.internal_bs:{self.internal_bs}'
-        elif self.pubmed_id:
-            return f'id.pubmed_id:{self.pubmed_id}'
-        elif self.ark_ids:
-            return f'id.ark_ids:{self.ark_ids[-1]}'
-        elif self.libgen_ids:
-            return f'id.libgen_ids:{self.libgen_ids[-1]}'
-        elif self.zlibrary_ids:
-            return f'id.zlibrary_ids:{self.zlibrary_ids[-1]}'
-        elif self.nexus_id:
-            return f'id.nexus_id:{self.nexus_id}'
-        elif self.wiki:
-            return f'id.wiki:{self.wiki}'
-        elif self.manualslib_id:
-            return f'id.manualslib_id:{self.manualslib_id}'
-        else:
-            return None
+        return self.view.internal_id
 
 
 class LinksWrapper:
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+import json
+import logging
+import sys
+from typing import (
+    List,
+    Optional,
+)
+
+import fire
+from termcolor import colored
+
+from .runner import (
+    DEFAULT_QUERIES,
+    find_regressions,
+    run_benchmark,
+)
+from .sample_index import SAMPLE_INDEX_SIZE
+
+
+async def benchmark(
+    index_directory: Optional[str] = None,
+    profiles: List[str] = ('light', 'full'),
+    queries_file: Optional[str] = None,
+    rounds: int = 2,
+    latency: float = 0.05,
+    jitter: float = 0.0,
+    bandwidth: Optional[int] = None,
+    index_alias: str = 'nexus_science',
+    limit: int = 10,
+    default_cache_size: int = 300,
+    cache_directory: Optional[str] = None,
+    sample_size: int = SAMPLE_INDEX_SIZE,
+    output_file: Optional[str] = None,
+    baseline_file: Optional[str] = None,
+    tolerance: float = 0.2,
+    debug: bool = False,
+):
+    """
+    Benchmark search of embedded Summa reading index from the local stand-in IPFS gateway.
+    Example: `python -m stc_geck.benchmark --latency 0.1 --output-file report.json`
+
+    :param index_directory: directory with index files, i.e. created by `geck - mirror`,
+        the fixed sample index of `sample_size` synthetic records is built if not set
+    :param profiles: query parser profiles to benchmark, `light` and/or `full`
+    :param queries_file: file with a query on every line, the built-in corpus is used if not set
+    :param rounds: how many times the corpus is run for every profile, the first round is run on cold caches
+    :param latency: delay of every gateway response in seconds
+    :param jitter: upper bound of random delay added to `latency`
+    :param bandwidth: bandwidth of the gateway in bytes per second
+    :param index_alias: alias of the index
+    :param limit: how many documents every query returns
+    :param default_cache_size: size of Summa CachingDirectory
+    :param cache_directory: directory where a fresh persistent cache of GECK is created for every profile
+    :param sample_size: number of records in the sample index
+    :param output_file: file for writing JSON report
+    :param baseline_file: JSON report of the previous run, exits with non-zero code if metrics have regressed
+    :param tolerance: allowed relative increase of metrics compared to the baseline
+    :param debug: add debugging output
+    """
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO if debug else logging.ERROR)
+    queries = DEFAULT_QUERIES
+    if queries_file:
+        with open(queries_file) as f:
+            queries = [line.strip() for line in f if line.strip()]
+    report = await run_benchmark(
+        index_directory,
+        profiles=profiles,
+        queries=queries,
+        rounds=rounds,
+        latency=latency,
+        jitter=jitter,
+        bandwidth=bandwidth,
+        index_alias=index_alias,
+        limit=limit,
+        default_cache_size=default_cache_size,
+        cache_directory=cache_directory,
+        sample_size=sample_size,
+    )
+    for result in report['results']:
+        print(
+            f"{result['profile']:>6} round {result['round']}: "
+            f"p50 {result['p50']:.3f}s, p95 {result['p95']:.3f}s, p99 {result['p99']:.3f}s, "
+            f"{result['fetched_bytes_per_query']:.0f} bytes and "
+            f"{result['range_requests_per_query']:.1f} requests per query",
+            file=sys.stderr,
+        )
+    if output_file:
+        with open(output_file, 'w') as f:
+            json.dump(report, f, indent=2)
+    if baseline_file:
+        with open(baseline_file) as f:
+            regressions = find_regressions(report, json.load(f), tolerance=tolerance)
+        for regression in regressions:
+            print(
+                f"{colored('REGRESSION', 'red')}: {regression['metric']} of {regression['profile']} "
+                f"round {regression['round']} is {regression['value']:.3f}, baseline is {regression['baseline']:.3f}",
+                file=sys.stderr,
+            )
+        if regressions:
+            sys.exit(1)
+
+
+def main():
+    fire.Fire(benchmark, name='geck-benchmark')
+
+
+if __name__ == '__main__':
+    main()
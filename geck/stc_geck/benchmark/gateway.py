@@ -0,0 +1,94 @@
+import asyncio
+import os.path
+import random
+import re
+from typing import Optional
+
+from aiohttp import web
+from aiokit import AioThing
+
+RANGE_REGEX = re.compile(r'bytes=(\d+)-(\d*)')
+
+
+class StandInGateway(AioThing):
+    """
+    Local HTTP server emulating IPFS gateway that serves index files from the local directory.
+    Every response is delayed by `latency` plus random `jitter`, and the body is throttled to `bandwidth`.
+    """
+    def __init__(
+        self,
+        index_directory: str,
+        data_path: str = '/ipns/libstc.cc/data/',
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        bandwidth: Optional[int] = None,
+        host: str = '127.0.0.1',
+        seed: int = 0,
+    ):
+        """
+        :param index_directory: directory with index files, i.e. created by `geck - mirror`
+        :param data_path: path under which index files are served, it is passed to GECK as `ipfs_data_directory`
+        :param latency: delay in seconds before every response
+        :param jitter: upper bound of random delay added to `latency`
+        :param bandwidth: bytes per second, unlimited if not set
+        :param host: interface for listening
+        :param seed: seed for jitter, makes runs reproducible
+        """
+        super().__init__()
+        self.index_directory = index_directory
+        self.data_path = '/' + data_path.strip('/') + '/'
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.host = host
+        self.random = random.Random(seed)
+        self.port = None
+        self.runner = None
+        self.requests = 0
+        self.sent_bytes = 0
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+        file_name = request.match_info['file_name']
+        if not file_name:
+            # Directory listing is requested by GECK only for detecting gateway type
+            return web.Response(status=200)
+        file_path = os.path.join(self.index_directory, os.path.basename(file_name))
+        if not os.path.isfile(file_path):
+            return web.Response(status=404)
+        file_size = os.path.getsize(file_path)
+        status, start, end = 200, 0, file_size - 1
+        headers = {'Accept-Ranges': 'bytes'}
+        if range_match := RANGE_REGEX.fullmatch(request.headers.get('Range', '')):
+            start = int(range_match.group(1))
+            end = min(int(range_match.group(2)), file_size - 1) if range_match.group(2) else file_size - 1
+            if start > end:
+                return web.Response(status=416, headers={'Content-Range': f'bytes */{file_size}'})
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{file_size}'
+        with open(file_path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        if self.bandwidth:
+            await asyncio.sleep(len(data) / self.bandwidth)
+        self.sent_bytes += len(data)
+        return web.Response(status=status, headers=headers, body=data)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route('GET', self.data_path + '{file_name:.*}', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
@@ -0,0 +1,207 @@
+import logging
+import tempfile
+from contextlib import nullcontext
+import time
+from typing import (
+    Iterable,
+    List,
+    Optional,
+)
+
+from ..advices import (
+    get_default_scorer,
+    get_query_parser_config,
+)
+from ..client import StcGeck
+from ..utils import get_free_endpoint
+from .gateway import StandInGateway
+from .sample_index import (
+    SAMPLE_INDEX_SIZE,
+    build_sample_index,
+)
+
+DEFAULT_QUERIES = (
+    'hemoglobin',
+    'fetal hemoglobin',
+    'quantum entanglement',
+    'theory of everything',
+    'crispr cas9 off-target effects',
+    'deep learning',
+    'attention is all you need',
+    'climate change adaptation',
+    'protein folding',
+    'graphene',
+    'title:"origin of species"',
+    'authors:darwin',
+    'doi:10.1038/nature14539',
+    'isbns:9780262033848',
+    'lang:ru физика',
+    'machine learning interpretability survey',
+    'sars-cov-2 spike protein',
+    'dark matter',
+    'public key cryptography',
+    'history of mathematics',
+)
+REGRESSION_METRICS = ('p50', 'p95', 'p99', 'fetched_bytes_per_query', 'range_requests_per_query')
+
+
+def percentile(values: List[float], percentile: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * percentile / 100), len(values) - 1)]
+
+
+def summarize(query_stats: List[dict]) -> dict:
+    latencies = [stats['elapsed'] for stats in query_stats]
+    return {
+        'queries': len(query_stats),
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'fetched_bytes_per_query': sum(stats['fetched_bytes'] for stats in query_stats) / len(query_stats),
+        'range_requests_per_query': sum(stats['range_requests'] for stats in query_stats) / len(query_stats),
+    }
+
+
+async def run_profile(
+    gateway: StandInGateway,
+    profile: str,
+    queries: Iterable[str],
+    rounds: int,
+    index_alias: str,
+    limit: int,
+    default_cache_size: int,
+    cache_directory: Optional[str],
+) -> List[dict]:
+    """
+    Launches embedded Summa against the gateway and runs queries `rounds` times.
+    The first round is run on cold caches, the following ones show the effect of caching.
+    """
+    query_stats = []
+    geck = StcGeck(
+        ipfs_http_base_url=gateway.base_url,
+        ipfs_data_directory=gateway.data_path,
+        grpc_api_endpoint=get_free_endpoint(),
+        index_alias=index_alias,
+        default_cache_size=default_cache_size,
+        cache_directory=cache_directory,
+        io_metrics_callback=query_stats.append,
+    )
+    rounds_stats = []
+    async with geck:
+        summa_client = geck.get_summa_client()
+        for round_ in range(rounds):
+            query_stats.clear()
+            for query in queries:
+                await summa_client.search_documents({
+                    'index_alias': index_alias,
+                    'query': {'match': {'value': query, 'query_parser_config': get_query_parser_config(profile)}},
+                    'collectors': [{'top_docs': {'limit': limit, 'scorer': get_default_scorer(profile)}}],
+                    'is_fieldnorms_scoring_enabled': False,
+                })
+            rounds_stats.append({'profile': profile, 'round': round_, **summarize(query_stats)})
+            logging.getLogger('statbox').info({'action': 'benchmarked', 'mode': 'benchmark', **rounds_stats[-1]})
+    return rounds_stats
+
+
+async def run_benchmark(
+    index_directory: Optional[str] = None,
+    profiles: Iterable[str] = ('light', 'full'),
+    queries: Iterable[str] = DEFAULT_QUERIES,
+    rounds: int = 2,
+    latency: float = 0.05,
+    jitter: float = 0.0,
+    bandwidth: Optional[int] = None,
+    index_alias: str = 'nexus_science',
+    limit: int = 10,
+    default_cache_size: int = 300,
+    cache_directory: Optional[str] = None,
+    sample_size: int = SAMPLE_INDEX_SIZE,
+) -> dict:
+    """
+    Runs query corpus through embedded Summa reading the index from `StandInGateway`
+
+    :param index_directory: directory with index files, i.e. created by `geck - mirror`,
+        the sample index is built if not set
+    :param profiles: query parser profiles to benchmark
+    :param queries: query corpus
+    :param rounds: how many times the corpus is run for every profile
+    :param latency: delay of every gateway response in seconds
+    :param jitter: upper bound of random delay added to `latency`
+    :param bandwidth: bandwidth of the gateway in bytes per second
+    :param index_alias: alias of the index
+    :param limit: how many documents every query returns
+    :param default_cache_size: size of Summa CachingDirectory
+    :param cache_directory: directory where persistent cache of GECK is created for every profile,
+        caching is in-memory only if not set
+    :param sample_size: number of records in the sample index
+    :return: report with latencies, bytes fetched and range requests per query for every profile and round
+    """
+    queries = list(queries)
+    results = []
+    with tempfile.TemporaryDirectory() if not index_directory else nullcontext() as sample_directory:
+        if sample_directory:
+            index_directory = sample_directory
+            await build_sample_index(index_directory, n_documents=sample_size, index_name=index_alias)
+        started_at = time.monotonic()
+        for profile in profiles:
+            # Every profile gets its own embedded Summa and its own persistent cache, so it starts with cold caches
+            profile_cache = (
+                tempfile.TemporaryDirectory(dir=cache_directory, prefix=f'{profile}-')
+                if cache_directory else nullcontext()
+            )
+            async with StandInGateway(index_directory, latency=latency, jitter=jitter, bandwidth=bandwidth) as gateway:
+                with profile_cache as profile_cache_directory:
+                    results.extend(await run_profile(
+                        gateway,
+                        profile=profile,
+                        queries=queries,
+                        rounds=rounds,
+                        index_alias=index_alias,
+                        limit=limit,
+                        default_cache_size=default_cache_size,
+                        cache_directory=profile_cache_directory,
+                    ))
+        elapsed = time.monotonic() - started_at
+    return {
+        'settings': {
+            'latency': latency,
+            'jitter': jitter,
+            'bandwidth': bandwidth,
+            'queries': len(queries),
+            'rounds': rounds,
+            'limit': limit,
+            'default_cache_size': default_cache_size,
+            'sample_size': sample_size if sample_directory else None,
+        },
+        'results': results,
+        'elapsed': elapsed,
+    }
+
+
+def find_regressions(report: dict, baseline: dict, tolerance: float = 0.2) -> List[dict]:
+    """
+    Compares metrics of the report with the baseline report
+
+    :param report: report of `run_benchmark`
+    :param baseline: report of `run_benchmark` for the baseline version
+    :param tolerance: allowed relative increase of metrics
+    :return: metrics that have increased more than allowed
+    """
+    baseline_results = {(result['profile'], result['round']): result for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        if not (baseline_result := baseline_results.get((result['profile'], result['round']))):
+            continue
+        for metric in REGRESSION_METRICS:
+            value, baseline_value = result[metric], baseline_result[metric]
+            if value is not None and baseline_value and value > baseline_value * (1 + tolerance):
+                regressions.append({
+                    'profile': result['profile'],
+                    'round': result['round'],
+                    'metric': metric,
+                    'value': value,
+                    'baseline': baseline_value,
+                })
+    return regressions
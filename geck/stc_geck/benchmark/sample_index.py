@@ -0,0 +1,251 @@
+import copy
+import json
+import os.path
+import random
+import shutil
+import tempfile
+from typing import (
+    Iterator,
+    List,
+)
+
+import summa_embed
+from aiosumma import SummaClient
+
+from ..client import get_config
+from ..utils import get_free_endpoint
+
+SAMPLE_INDEX_SIZE = 20000
+# Files of Summa and Tantivy that are not a part of the index served by IPFS
+LOCK_FILE_NAMES = ('.tantivy-meta.lock', '.tantivy-writer.lock')
+# Subset of the schema of `nexus_science`, see `search/nexus-science.yaml`
+SAMPLE_SCHEMA = [
+    {'name': 'abstract', 'type': 'text', 'options': {
+        'indexing': {'fieldnorms': True, 'record': 'position', 'tokenizer': 'summa_html'},
+        'stored': True,
+    }},
+    {'name': 'authors', 'type': 'json_object', 'options': {
+        'expand_dots_enabled': True,
+        'fast': False,
+        'indexing': {'fieldnorms': False, 'record': 'position', 'tokenizer': 'summa_without_stop_words'},
+        'stored': True,
+    }},
+    {'name': 'concepts', 'type': 'text', 'options': {
+        'indexing': {'fieldnorms': True, 'record': 'position', 'tokenizer': 'summa_dict'},
+        'stored': False,
+    }},
+    {'name': 'content', 'type': 'text', 'options': {
+        'indexing': {'fieldnorms': True, 'record': 'position', 'tokenizer': 'summa_html'},
+        'stored': True,
+    }},
+    {'name': 'extra', 'type': 'text', 'options': {
+        'fast': False,
+        'indexing': {'fieldnorms': True, 'record': 'position', 'tokenizer': 'summa'},
+        'stored': False,
+    }},
+    {'name': 'ctr', 'type': 'f64', 'options': {'fast': True, 'indexed': False, 'stored': True}},
+    {'name': 'custom_score', 'type': 'f64', 'options': {'fast': True, 'indexed': False, 'stored': True}},
+    {'name': 'id', 'type': 'json_object', 'options': {
+        'expand_dots_enabled': True,
+        'fast': False,
+        'indexing': {'fieldnorms': False, 'record': 'basic', 'tokenizer': 'raw'},
+        'stored': True,
+    }},
+    {'name': 'issued_at', 'type': 'i64', 'options': {'fast': True, 'indexed': False, 'stored': True}},
+    {'name': 'languages', 'type': 'text', 'options': {
+        'indexing': {'fieldnorms': False, 'record': 'basic', 'tokenizer': 'raw'},
+        'stored': True,
+    }},
+    {'name': 'links', 'type': 'json_object', 'options': {
+        'expand_dots_enabled': True,
+        'fast': False,
+        'indexing': {'fieldnorms': False, 'record': 'basic', 'tokenizer': 'raw'},
+        'stored': True,
+    }},
+    {'name': 'metadata', 'type': 'json_object', 'options': {
+        'expand_dots_enabled': True,
+        'fast': False,
+        'indexing': {'fieldnorms': False, 'record': 'basic', 'tokenizer': 'raw'},
+        'stored': True,
+    }},
+    {'name': 'quantized_page_rank', 'type': 'u64', 'options': {'fast': True, 'indexed': False, 'stored': False}},
+    {'name': 'title', 'type': 'text', 'options': {
+        'indexing': {'fieldnorms': True, 'record': 'position', 'tokenizer': 'summa_html'},
+        'stored': True,
+    }},
+    {'name': 'type', 'type': 'text', 'options': {
+        'fast': True,
+        'indexing': {'fieldnorms': False, 'record': 'basic', 'tokenizer': 'raw'},
+        'stored': True,
+    }},
+    {'name': 'updated_at', 'type': 'i64', 'options': {'fast': True, 'indexed': False, 'stored': True}},
+]
+SAMPLE_INDEX_ATTRIBUTES = {
+    'description': 'Sample of synthetic records for benchmarks',
+    'mapped_fields': [
+        {'source_field': 'abstract', 'target_field': 'concepts'},
+        {'source_field': 'authors.family', 'target_field': 'extra'},
+        {'source_field': 'metadata.container_title', 'target_field': 'extra'},
+        {'source_field': 'metadata.isbns', 'target_field': 'extra'},
+        {'source_field': 'metadata.publisher', 'target_field': 'extra'},
+        {'source_field': 'title', 'target_field': 'concepts'},
+    ],
+    'multi_fields': ['authors', 'concepts', 'extra', 'languages', 'links'],
+}
+# Topics that the built-in query corpus searches for, every topic is mixed into a share of documents
+TOPICS = (
+    ('hemoglobin', 'fetal', 'erythrocyte', 'oxygen', 'anemia'),
+    ('quantum', 'entanglement', 'qubit', 'decoherence', 'teleportation'),
+    ('theory', 'everything', 'string', 'gravity', 'unification'),
+    ('crispr', 'cas9', 'off-target', 'genome', 'editing'),
+    ('deep', 'learning', 'neural', 'network', 'attention'),
+    ('climate', 'change', 'adaptation', 'emissions', 'warming'),
+    ('protein', 'folding', 'structure', 'chaperone', 'prediction'),
+    ('graphene', 'nanotube', 'carbon', 'conductivity', 'monolayer'),
+    ('machine', 'learning', 'interpretability', 'survey', 'explanation'),
+    ('sars-cov-2', 'spike', 'protein', 'vaccine', 'antibody'),
+    ('dark', 'matter', 'galaxy', 'halo', 'lensing'),
+    ('public', 'key', 'cryptography', 'signature', 'elliptic'),
+    ('history', 'mathematics', 'geometry', 'euclid', 'algebra'),
+)
+FAMILY_NAMES = (
+    'Smith', 'Ivanov', 'Wang', 'Garcia', 'Müller', 'Kim', 'Rossi', 'Nakamura', 'Silva', 'Cohen', 'Novak', 'Darwin',
+)
+LANGUAGES = ('en', 'en', 'en', 'en', 'ru', 'de', 'zh')
+TYPES = ('journal-article', 'journal-article', 'journal-article', 'book', 'book-chapter', 'proceedings-article')
+# Records that are looked up by the identifiers and fields of the built-in query corpus
+KNOWN_DOCUMENTS = (
+    {
+        'title': 'On the origin of species',
+        'authors': [{'given': 'Charles', 'family': 'Darwin'}],
+        'metadata': {'isbns': ['9780451529060'], 'publisher': 'John Murray'},
+        'type': 'book',
+        'issued_at': -3502483200,
+    },
+    {
+        'title': 'Deep learning',
+        'authors': [{'given': 'Yann', 'family': 'LeCun'}, {'given': 'Yoshua', 'family': 'Bengio'}],
+        'id': {'dois': ['10.1038/nature14539']},
+        'metadata': {'container_title': 'Nature'},
+        'type': 'journal-article',
+        'issued_at': 1432684800,
+    },
+    {
+        'title': 'Introduction to algorithms',
+        'authors': [{'given': 'Thomas', 'family': 'Cormen'}],
+        'metadata': {'isbns': ['9780262033848'], 'publisher': 'MIT Press'},
+        'type': 'book',
+        'issued_at': 1246406400,
+    },
+    {
+        'title': 'Квантовая физика твёрдого тела',
+        'abstract': 'Учебник по физике конденсированного состояния',
+        'authors': [{'given': 'Лев', 'family': 'Ландау'}],
+        'languages': ['ru'],
+        'type': 'book',
+        'issued_at': 31536000,
+    },
+)
+
+
+def generate_words(rng: random.Random, n_words: int) -> List[str]:
+    syllables = ('ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'si', 'po', 'de', 'vo', 'an', 'er', 'is', 'on', 'ul')
+    words = set()
+    while len(words) < n_words:
+        words.add(''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def generate_sample_documents(n_documents: int = SAMPLE_INDEX_SIZE, seed: int = 0) -> Iterator[dict]:
+    """
+    Generates the same synthetic records for the same arguments. Words of texts are drawn from Zipf distribution,
+    so the sample has both long and short posting lists.
+
+    :param n_documents: number of generated records
+    :param seed: seed of the generator
+    """
+    rng = random.Random(seed)
+    vocabulary = generate_words(rng, 5000)
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    for i in range(n_documents):
+        if i < len(KNOWN_DOCUMENTS):
+            document = copy.deepcopy(KNOWN_DOCUMENTS[i])
+        else:
+            topic = rng.choice(TOPICS)
+            title_words = rng.sample(topic, 2) + rng.choices(vocabulary, weights, k=rng.randint(3, 10))
+            rng.shuffle(title_words)
+            abstract_words = rng.choices(topic, k=rng.randint(2, 12)) + rng.choices(vocabulary, weights, k=120)
+            rng.shuffle(abstract_words)
+            document = {
+                'title': ' '.join(title_words).capitalize(),
+                'abstract': ' '.join(abstract_words),
+                'authors': [
+                    {'given': rng.choice(vocabulary).capitalize(), 'family': rng.choice(FAMILY_NAMES)}
+                    for _ in range(rng.randint(1, 5))
+                ],
+                'languages': [rng.choice(LANGUAGES)],
+                'type': rng.choice(TYPES),
+                'issued_at': rng.randint(0, 1700000000),
+            }
+        document.setdefault('id', {}).setdefault('dois', []).append(f'10.0000/sample.{i}')
+        document.setdefault('languages', ['en'])
+        document.setdefault('links', [{'cid': f'sample{i}', 'extension': 'pdf'}])
+        document.update({
+            'ctr': 0.1,
+            'custom_score': 1.0,
+            'quantized_page_rank': rng.randint(0, 7),
+            'updated_at': 1700000000,
+        })
+        yield document
+
+
+async def build_sample_index(
+    index_directory: str,
+    n_documents: int = SAMPLE_INDEX_SIZE,
+    seed: int = 0,
+    index_name: str = 'nexus_science',
+):
+    """
+    Indexes synthetic records with embedded Summa and stores index files to `index_directory` in the same layout as
+    `geck - mirror` does. Records are fixed by `n_documents` and `seed`, so benchmarks with equal arguments are
+    comparable.
+
+    :param index_directory: directory for index files
+    :param n_documents: number of records in the index
+    :param seed: seed of the generator of records
+    :param index_name: name of the index
+    """
+    with tempfile.TemporaryDirectory() as data_path:
+        server_config = get_config()
+        server_config['api']['grpc_endpoint'] = get_free_endpoint()
+        server_config['core']['writer_threads'] = {'n': 1}
+        server_config['data_path'] = data_path
+        server_config['log_path'] = data_path
+        summa_embed_server = summa_embed.SummaEmbedServerBin(server_config)
+        await summa_embed_server.start()
+        summa_client = SummaClient(endpoint=server_config['api']['grpc_endpoint'])
+        try:
+            await summa_client.start()
+            await summa_client.create_index(
+                index_name,
+                schema=json.dumps(SAMPLE_SCHEMA),
+                index_engine={'file': {}},
+                compression='Zstd22',
+                blocksize=131072,
+                index_attributes=SAMPLE_INDEX_ATTRIBUTES,
+            )
+            await summa_client.index_document_stream(
+                index_name,
+                documents=(json.dumps(document).encode() for document in generate_sample_documents(n_documents, seed)),
+                bulk_size=1000,
+                skip_updated_at_modification=True,
+            )
+            await summa_client.commit_index(index_name, with_hotcache=True)
+        finally:
+            await summa_client.stop()
+            await summa_embed_server.stop()
+        os.makedirs(index_directory, exist_ok=True)
+        built_index_directory = os.path.join(data_path, index_name)
+        for file_name in os.listdir(built_index_directory):
+            if file_name not in LOCK_FILE_NAMES:
+                shutil.copy(os.path.join(built_index_directory, file_name), index_directory)
@@ -0,0 +1,134 @@
+import asyncio
+import os.path
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from aiokit import AioThing
+
+# Index files that may change in place when the index is updated. Segment files of Tantivy index are immutable
+# so their ranges may be cached forever, but metadata files must always be read from the origin.
+UNCACHEABLE_SUFFIXES = ('.json', '.lock')
+
+
+class DiskBlockCache(AioThing):
+    """
+    Size-bounded on-disk LRU cache of byte ranges read from the remote index.
+
+    The cache is backed by SQLite database in WAL mode, so it survives restarts and may be shared by several processes
+    on the same host. Ranges are keyed by file name and the offsets of the range.
+    """
+    def __init__(self, cache_directory: str, max_size_bytes: int = 1024 * 1024 * 1024):
+        """
+        :param cache_directory: directory for storing the cache database
+        :param max_size_bytes: upper bound for the total size of cached ranges
+        """
+        super().__init__()
+        self.cache_directory = cache_directory
+        self.max_size_bytes = max_size_bytes
+        self.database_path = os.path.join(cache_directory, 'blocks.db')
+        self.executor = None
+        self.connection = None
+
+    @staticmethod
+    def is_cacheable(file_name: str) -> bool:
+        return not file_name.endswith(UNCACHEABLE_SUFFIXES)
+
+    def _open(self):
+        os.makedirs(self.cache_directory, exist_ok=True)
+        connection = sqlite3.connect(self.database_path, timeout=60, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript('''
+            CREATE TABLE IF NOT EXISTS blocks (
+                file_name TEXT NOT NULL,
+                start INTEGER NOT NULL,
+                end INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (file_name, start, end)
+            );
+            CREATE INDEX IF NOT EXISTS blocks_accessed_at ON blocks(accessed_at);
+            CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY CHECK (id = 0), total_size INTEGER NOT NULL);
+            INSERT OR IGNORE INTO stats (id, total_size) VALUES (0, 0);
+            CREATE TRIGGER IF NOT EXISTS blocks_insert AFTER INSERT ON blocks BEGIN
+                UPDATE stats SET total_size = total_size + new.size WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS blocks_delete AFTER DELETE ON blocks BEGIN
+                UPDATE stats SET total_size = total_size - old.size WHERE id = 0;
+            END;
+        ''')
+        self.connection = connection
+
+    def _close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    def _get(self, file_name: str, start: int, end: int) -> Optional[bytes]:
+        row = self.connection.execute(
+            'SELECT data FROM blocks WHERE file_name = ? AND start = ? AND end = ?',
+            (file_name, start, end),
+        ).fetchone()
+        if row is None:
+            return None
+        self.connection.execute(
+            'UPDATE blocks SET accessed_at = ? WHERE file_name = ? AND start = ? AND end = ?',
+            (time.time(), file_name, start, end),
+        )
+        return row[0]
+
+    def _put(self, file_name: str, start: int, end: int, data: bytes):
+        if len(data) > self.max_size_bytes:
+            return
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute(
+                'INSERT OR IGNORE INTO blocks (file_name, start, end, size, accessed_at, data) VALUES (?, ?, ?, ?, ?, ?)',
+                (file_name, start, end, len(data), time.time(), data),
+            )
+            self._evict()
+
+    def _evict(self):
+        while self._total_size() > self.max_size_bytes:
+            self.connection.execute(
+                'DELETE FROM blocks WHERE rowid = (SELECT rowid FROM blocks ORDER BY accessed_at LIMIT 1)'
+            )
+
+    def _total_size(self) -> int:
+        return self.connection.execute('SELECT total_size FROM stats WHERE id = 0').fetchone()[0]
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def get(self, file_name: str, start: int, end: int) -> Optional[bytes]:
+        """
+        Returns cached range or `None` if the range has not been cached yet
+
+        :param file_name: name of the index file
+        :param start: first byte of the range
+        :param end: last byte of the range, inclusive
+        """
+        return await self._run(self._get, file_name, start, end)
+
+    async def put(self, file_name: str, start: int, end: int, data: bytes):
+        """
+        Stores range and evicts least recently used ranges if the cache has grown over `max_size_bytes`
+        """
+        await self._run(self._put, file_name, start, end, data)
+
+    async def total_size(self) -> int:
+        return await self._run(self._total_size)
+
+    async def start(self):
+        # SQLite connection must be used from the single thread, so all operations are serialized through it
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='geck_block_cache')
+        await self._run(self._open)
+
+    async def stop(self):
+        if self.executor:
+            await self._run(self._close)
+            self.executor.shutdown()
+            self.executor = None
@@ -0,0 +1,108 @@
+import asyncio
+import os.path
+import sys
+import tempfile
+from typing import (
+    AsyncIterator,
+    Tuple,
+)
+from urllib.parse import quote
+
+import ipfs_hamt_directory_py
+
+from .exceptions import CarBuildError
+
+
+class CarBuilder:
+    """
+    Builds CAR file with HAMT directory from entries added one by one.
+
+    `ipfs_hamt_directory_py` holds GIL while reading its input, so it is launched in a child process that reads entries
+    from the pipe. Entries are sent as soon as they are added and nothing is accumulated in memory or in
+    intermediate files. The root CID is stored in the header of CAR and it depends on every entry, so the CAR
+    is available only after `finish()`.
+    """
+    def __init__(self, output_car: str):
+        """
+        :param output_car: filename of the output CAR
+        """
+        self.output_car = output_car
+        self.temp_dir = None
+        self.stderr_file = None
+        self.process = None
+
+    async def start(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        # Nobody reads stderr while entries are written, so a pipe could fill up with warnings and block the child
+        self.stderr_file = open(os.path.join(self.temp_dir.name, 'stderr'), 'w+b')
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, '-m', 'stc_geck.car', self.output_car, self.temp_dir.name,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=self.stderr_file,
+        )
+
+    async def add(self, name: str, cid: str, size: int = 0):
+        """
+        Adds entry to the directory
+
+        :param name: name of the item inside directory
+        :param cid: CID of the item
+        :param size: size of the item in bytes
+        """
+        self.process.stdin.write(f'{quote(name, safe="")} {cid} {size or 0}\n'.encode())
+        await self.process.stdin.drain()
+
+    async def finish(self) -> str:
+        """
+        Waits until CAR is written
+
+        :return: the root CID of the directory
+        """
+        self.process.stdin.close()
+        stdout, _ = await self.process.communicate()
+        try:
+            if self.process.returncode != 0:
+                self.stderr_file.seek(0)
+                raise CarBuildError(error=self.stderr_file.read().decode(errors='replace'))
+            return stdout.decode().strip()
+        finally:
+            self._cleanup()
+
+    async def abort(self):
+        if self.process.returncode is None:
+            self.process.kill()
+            await self.process.wait()
+        self._cleanup()
+
+    def _cleanup(self):
+        self.stderr_file.close()
+        self.temp_dir.cleanup()
+
+
+async def write_car(entries: AsyncIterator[Tuple[str, str, int]], output_car: str) -> str:
+    """
+    Writes CAR file with HAMT directory containing all entries
+
+    :param entries: `(name, cid, size)` of the items
+    :param output_car: filename of the output CAR
+    :return: the root CID that you can use for addressing directory after importing CAR to IPFS daemon
+    """
+    car_builder = CarBuilder(output_car)
+    await car_builder.start()
+    try:
+        async for name, cid, size in entries:
+            await car_builder.add(name, cid, size)
+    except BaseException:
+        await car_builder.abort()
+        raise
+    return await car_builder.finish()
+
+
+def main():
+    output_car, temp_dir = sys.argv[1:3]
+    print(ipfs_hamt_directory_py.from_file('/dev/stdin', os.path.abspath(output_car), temp_dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+import asyncio
+import heapq
+import mmap
+import os
+import random
+import struct
+import tempfile
+from typing import (
+    AsyncIterator,
+    BinaryIO,
+    Iterable,
+    Iterator,
+    List,
+    Set,
+    Tuple,
+)
+
+MAGIC = b'STCM'
+VERSION = 1
+CID_WIDTH = 64
+HEADER = struct.Struct(f'<4sIQ{CID_WIDTH}s')
+RECORD = struct.Struct(f'<{CID_WIDTH}sQ')
+# Number of records sorted in memory at once while building the manifest
+RUN_SIZE = 1_000_000
+READ_BATCH_SIZE = 4096
+
+
+def _read_records(f: BinaryIO) -> Iterator[bytes]:
+    while batch := f.read(READ_BATCH_SIZE * RECORD.size):
+        for offset in range(0, len(batch), RECORD.size):
+            yield batch[offset:offset + RECORD.size]
+
+
+class CidManifest:
+    """
+    Compact local copy of the directory listing that allows sampling items without walking the directory.
+
+    The manifest is a file with fixed-width records `(cid, size)` sorted by CID, so it is memory-mapped and
+    every record is accessed in constant time. The header keeps the root CID of the listed directory that is used for
+    detecting whether the manifest is stale.
+
+    Records are never held in memory all at once: entries are sorted by runs of `RUN_SIZE` records spilled
+    to temporary files, and runs are merged into the new manifest together with records of the current one.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+        self.mmap = None
+        self.root_cid = None
+        self.count = 0
+
+    def open(self) -> bool:
+        """
+        Maps existing manifest into memory
+
+        :return: `False` if there is no manifest yet
+        """
+        self.close()
+        if not os.path.exists(self.path):
+            return False
+        self.file = open(self.path, 'rb')
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, root_cid = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            return False
+        self.root_cid = root_cid.rstrip(b'\0').decode()
+        return True
+
+    def close(self):
+        if self.mmap:
+            self.mmap.close()
+            self.mmap = None
+        if self.file:
+            self.file.close()
+            self.file = None
+        self.root_cid = None
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i: int) -> Tuple[str, int]:
+        cid, size = RECORD.unpack_from(self.mmap, HEADER.size + i * RECORD.size)
+        return cid.rstrip(b'\0').decode(), size
+
+    def _iter_records(self) -> Iterator[bytes]:
+        for i in range(self.count):
+            offset = HEADER.size + i * RECORD.size
+            yield self.mmap[offset:offset + RECORD.size]
+
+    async def _write_runs(self, entries: AsyncIterator[Tuple[str, int]], runs: List[BinaryIO]):
+        loop = asyncio.get_running_loop()
+        records = []
+
+        def spill(sorted_records):
+            sorted_records.sort()
+            run = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(self.path)))
+            run.writelines(sorted_records)
+            run.seek(0)
+            runs.append(run)
+
+        async for cid, size in entries:
+            encoded_cid = cid.encode()
+            if len(encoded_cid) <= CID_WIDTH:
+                records.append(RECORD.pack(encoded_cid, size))
+                if len(records) >= RUN_SIZE:
+                    await loop.run_in_executor(None, spill, records)
+                    records = []
+        if records:
+            await loop.run_in_executor(None, spill, records)
+
+    def _write_temp(self, temp_path: str, root_cid: str, records: Iterable[bytes], removed_cids: Set[str]) -> int:
+        removed_cids = {cid.encode().ljust(CID_WIDTH, b'\0') for cid in removed_cids}
+        count = 0
+        previous_cid = None
+        with open(temp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, root_cid.encode()))
+            for record in records:
+                cid = record[:CID_WIDTH]
+                if cid == previous_cid or cid in removed_cids:
+                    continue
+                previous_cid = cid
+                f.write(record)
+                count += 1
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION, count, root_cid.encode()))
+        return count
+
+    async def _write(self, root_cid: str, records: Iterable[bytes], removed_cids: Set[str]) -> int:
+        """
+        Writes sorted records skipping duplicates and `removed_cids`, then replaces the manifest atomically,
+        so other processes keep using the previous version until they reopen it. Records are merged and written
+        in the executor, the manifest is remapped in the event loop
+        """
+        temp_path = f'{self.path}.{os.getpid()}.tmp'
+        count = await asyncio.get_running_loop().run_in_executor(
+            None,
+            self._write_temp,
+            temp_path,
+            root_cid,
+            records,
+            removed_cids,
+        )
+        os.replace(temp_path, self.path)
+        self.open()
+        return count
+
+    async def build(self, root_cid: str, entries: AsyncIterator[Tuple[str, int]]) -> int:
+        """
+        Writes new manifest from `(cid, size)` entries and maps it
+
+        :param root_cid: CID of the listed directory
+        :param entries: listing of the directory
+        :return: number of written records
+        """
+        runs = []
+        try:
+            await self._write_runs(entries, runs)
+            return await self._write(root_cid, heapq.merge(*map(_read_records, runs)), set())
+        finally:
+            for run in runs:
+                run.close()
+
+    async def update(
+        self,
+        root_cid: str,
+        added_entries: Iterable[Tuple[str, int]],
+        removed_cids: Set[str],
+    ) -> int:
+        """
+        Merges changes of the directory into the current manifest
+
+        :param root_cid: CID of the new version of the directory
+        :param added_entries: `(cid, size)` entries added since the version of the current manifest
+        :param removed_cids: CIDs removed since the version of the current manifest
+        :return: number of written records
+        """
+        async def entries():
+            for entry in added_entries:
+                yield entry
+
+        runs = []
+        try:
+            await self._write_runs(entries(), runs)
+            return await self._write(
+                root_cid,
+                heapq.merge(self._iter_records(), *map(_read_records, runs)),
+                removed_cids,
+            )
+        finally:
+            for run in runs:
+                run.close()
+
+    def sample(self, n: int) -> List[str]:
+        """
+        Returns `n` distinct random CIDs
+        """
+        return [self[i][0] for i in random.sample(range(self.count), min(n, self.count))]
+
+    def sample_by_size(self, space_bytes: int, max_misses: int = 64) -> List[str]:
+        """
+        Returns distinct random CIDs with total size that fits `space_bytes`
+
+        :param space_bytes: budget for the total size of items
+        :param max_misses: stop after this number of consecutive items that do not fit remaining space
+        """
+        selected = []
+        seen = set()
+        remaining = space_bytes
+        misses = 0
+        while remaining > 0 and len(seen) < self.count and misses < max_misses:
+            i = random.randrange(self.count)
+            if i in seen:
+                continue
+            seen.add(i)
+            cid, size = self[i]
+            if size <= remaining:
+                selected.append(cid)
+                remaining -= size
+                misses = 0
+            else:
+                misses += 1
+        return selected
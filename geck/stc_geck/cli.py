@@ -1,21 +1,32 @@
 #!/usr/bin/env python3
 import asyncio
 import functools
+import json
 import logging
 import os.path
 import sys
 from typing import (
     List,
     Optional,
+    Union,
 )
 
 import fire
 import humanfriendly
-from stc_geck.advices import BaseDocumentHolder
+from stc_geck.advices import (
+    BaseDocumentHolder,
+    get_default_scorer,
+    get_query_parser_config,
+)
 from termcolor import colored
 
 from .client import StcGeck
 from .exceptions import IpfsConnectionError
+from .export import export_documents
+from .pagination import (
+    apply_cursor,
+    get_next_cursor,
+)
 
 
 def exception_handler(func):
@@ -41,12 +52,14 @@ def exception_handler(func):
 class StcGeckCli:
     def __init__(
         self,
-        ipfs_http_base_url: str,
+        ipfs_http_base_url: Union[str, List[str]],
         ipfs_api_base_url: str,
         ipfs_data_directory: str,
         grpc_api_endpoint: str,
         index_alias: str,
         timeout: int,
+        cache_directory: Optional[str] = None,
+        mirror_directory: Optional[str] = None,
     ):
         self.geck = StcGeck(
             ipfs_http_base_url=ipfs_http_base_url,
@@ -55,15 +68,19 @@ class StcGeckCli:
             grpc_api_endpoint=grpc_api_endpoint,
             index_alias=index_alias,
             timeout=timeout,
+            cache_directory=cache_directory,
+            mirror_directory=mirror_directory,
+            lazy_summa=True,
         )
         self.grpc_api_endpoint = grpc_api_endpoint
         self.index_alias = index_alias
 
-    def prompt(self):
-        if self.geck.is_embed:
+    async def start_summa(self):
+        if await self.geck.detect_embed():
             print(f"{colored('INFO', 'green')}: Setting up indices...", file=sys.stderr)
         else:
             print(f"{colored('INFO', 'green')}: Using existent instance on {self.geck.grpc_api_endpoint}", file=sys.stderr)
+        await self.geck.start_summa()
 
     @exception_handler
     async def documents(self, query_filter: Optional[dict] = None, fields: Optional[List[str]] = None):
@@ -72,8 +89,8 @@ class StcGeckCli:
 
         :return: metadata records
         """
-        self.prompt()
         async with self.geck as geck:
+            await self.start_summa()
             async for document in geck.get_summa_client().documents(
                 self.index_alias,
                 query_filter=query_filter,
@@ -82,17 +99,20 @@ class StcGeckCli:
                 print(document)
 
     @exception_handler
-    async def download(self, query: str, output_path: str):
+    async def download(self, query: str, output_path: str, verify_size: bool = False):
         """
         Download file from STC using default Summa match queries.
+        Interrupted downloads are resumed on the next launch with the same `output_path`.
         Examples: `doi:10.1234/abc, isbns:9781234567890`
 
         :param query: query in Summa match format
         :param output_path: filepath for writing file
+        :param verify_size: check the size of the downloaded file against the size stored in STC
 
         :return: file if record has corresponding CID
         """
         async with self.geck:
+            await self.start_summa()
             results = await self._search(query)
             output_path, output_path_ext = os.path.splitext(output_path)
             output_path_ext = output_path_ext.lstrip('.')
@@ -111,17 +131,161 @@ class StcGeckCli:
                             file=sys.stderr
                         )
                         output_path_ext = real_extension
-                    data = await self.geck.download(link['cid'])
                     final_file_name = output_path + '.' + output_path_ext
-                    with open(final_file_name, 'wb') as f:
-                        f.write(data)
-                        f.close()
-                        print(f"{colored('INFO', 'green')}: File {final_file_name} is written", file=sys.stderr)
+                    await self.geck.download_to_file(
+                        link['cid'],
+                        final_file_name,
+                        filesize=link.get('filesize') if verify_size else None,
+                    )
+                    print(f"{colored('INFO', 'green')}: File {final_file_name} is written", file=sys.stderr)
                 else:
                     print(f"{colored('ERROR', 'red')}: Not found CID for {query} and extension {output_path_ext}", file=sys.stderr)
             else:
                 print(f"{colored('ERROR', 'red')}: Not found {query}", file=sys.stderr)
 
+    @exception_handler
+    async def download_many(
+        self,
+        input_file: str,
+        output_directory: str,
+        concurrency: int = 8,
+        batch_size: int = 32,
+        report_file: Optional[str] = None,
+        verify_size: bool = False,
+    ):
+        """
+        Download files for every query from the input file. Files that already exist are skipped.
+        Examples of lines: `doi:10.1234/abc, isbns:9781234567890`
+
+        :param input_file: file with a query in Summa match format on every line
+        :param output_directory: directory for writing files
+        :param concurrency: how many files are downloaded simultaneously
+        :param batch_size: how many queries are resolved simultaneously
+        :param report_file: JSONL file for writing results, `download-report.jsonl` in `output_directory` by default
+        :param verify_size: check the size of downloaded files against the size stored in STC
+        """
+        with open(input_file) as f:
+            queries = [line.strip() for line in f if line.strip()]
+        report_file = report_file or os.path.join(output_directory, 'download-report.jsonl')
+        statuses = {}
+        async with self.geck as geck:
+            await self.start_summa()
+            print(f"{colored('INFO', 'green')}: Downloading {len(queries)} items...", file=sys.stderr)
+            os.makedirs(output_directory, exist_ok=True)
+            with open(report_file, 'a') as report:
+                async for record in geck.download_many(
+                    queries,
+                    output_directory,
+                    concurrency=concurrency,
+                    batch_size=batch_size,
+                    verify_size=verify_size,
+                ):
+                    report.write(json.dumps(record) + '\n')
+                    report.flush()
+                    statuses[record['status']] = statuses.get(record['status'], 0) + 1
+        print(f"{colored('INFO', 'green')}: Done {statuses}, report is written to {report_file}", file=sys.stderr)
+
+    @exception_handler
+    async def export(
+        self,
+        output_directory: str,
+        format: str = 'jsonl.zst',
+        fields: Optional[List[str]] = None,
+        query_filter: Optional[dict] = None,
+        shard_size: int = 1_000_000,
+        batch_size: int = 10_000,
+        writers: int = 2,
+    ):
+        """
+        Export all STC documents into compressed files for analytics.
+
+        :param output_directory: directory for writing files
+        :param format: `jsonl.zst` or `parquet`
+        :param fields: fields to export, all fields by default
+        :param query_filter: export only documents matching this query
+        :param shard_size: maximum number of documents in a single file
+        :param batch_size: number of documents encoded at once, it is also the size of Parquet row groups
+        :param writers: number of threads encoding and compressing documents
+        """
+        async with self.geck as geck:
+            await self.start_summa()
+            file_names = await export_documents(
+                geck.get_summa_client().documents(
+                    self.index_alias,
+                    query_filter=query_filter,
+                    fields=fields,
+                ),
+                output_directory,
+                export_format=format,
+                shard_size=shard_size,
+                batch_size=batch_size,
+                writers=writers,
+            )
+            print(f"{colored('INFO', 'green')}: Written {len(file_names)} files to {output_directory}", file=sys.stderr)
+
+    @exception_handler
+    async def mirror(self, directory: Optional[str] = None, concurrency: int = 8):
+        """
+        Download the whole index to the local disk. Subsequent launches with `--mirror-directory` read the index
+        from the local copy instead of IPFS. Launch it again for updating the copy, only changed files are downloaded.
+
+        :param directory: directory for storing index, `--mirror-directory` by default
+        :param concurrency: how many files are downloaded simultaneously
+        """
+        async with self.geck:
+            print(f"{colored('INFO', 'green')}: Mirroring {self.geck.ipfs_data_directory}...", file=sys.stderr)
+            stats = await self.geck.mirror(directory, concurrency=concurrency)
+        print(f"{colored('INFO', 'green')}: Done {stats}", file=sys.stderr)
+
+    @exception_handler
+    async def stats(self, query: str, profiles: List[str] = ('light', 'full'), limit: int = 10, repeats: int = 2):
+        """
+        Run the query with every query parser profile and print I/O done by every run: number of range requests,
+        fetched bytes, cache hits and latencies of gateways. Repeated runs show the effect of warm caches.
+
+        :param query: query in Summa match format
+        :param profiles: query parser profiles to compare, `light` and/or `full`
+        :param limit: how many results to return
+        :param repeats: how many times the query is run with every profile
+        """
+        queries = []
+        self.geck.enable_io_metrics(callback=queries.append)
+        async with self.geck as geck:
+            await self.start_summa()
+            for profile in profiles:
+                for run in range(repeats):
+                    # Metrics are not reported for cached responses or when Summa reads the index not through GECK,
+                    # and a single search may report several of them
+                    n_queries = len(queries)
+                    await geck.get_summa_client().search_documents({
+                        'index_alias': self.index_alias,
+                        'query': {'match': {'value': query, 'query_parser_config': get_query_parser_config(profile)}},
+                        'collectors': [{'top_docs': {'limit': limit, 'scorer': get_default_scorer(profile)}}],
+                        'is_fieldnorms_scoring_enabled': False,
+                    })
+                    for query_stats in queries[n_queries:]:
+                        query_stats.update(profile=profile, run=run)
+            print(json.dumps({'queries': queries, 'total': geck.get_io_stats()}, indent=2))
+
+    @exception_handler
+    async def warmup(self, profiles: List[str] = ('light', 'full'), is_full: bool = False):
+        """
+        Fetch hot parts of the index. Useful together with `--cache-directory`: the next launches
+        serve the first queries from the disk instead of IPFS.
+
+        :param profiles: query parser profiles that are going to be used, `light` and/or `full`
+        :param is_full: warm up the whole index instead of its hot parts
+        """
+        async with self.geck as geck:
+            await self.start_summa()
+            print(f"{colored('INFO', 'green')}: Warming up {self.index_alias}...", file=sys.stderr)
+            stats = await geck.warmup(profiles=profiles, is_full=is_full)
+        prefetched = (
+            humanfriendly.format_size(stats['prefetched_bytes'])
+            if stats['prefetched_bytes'] is not None else 'unknown amount of data'
+        )
+        print(f"{colored('INFO', 'green')}: Prefetched {prefetched} in {stats['elapsed']:.2f}s", file=sys.stderr)
+
     @exception_handler
     async def random_cids(self, n: Optional[int] = None, space: Optional[str] = None):
         """
@@ -132,12 +296,9 @@ class StcGeckCli:
         """
         if not n and not space:
             raise ValueError("`n` or `space_bytes` should be set")
-        if space:
-            # 3.61MB is the average size of the item
-            n = int(humanfriendly.parse_size(space) / (3.61 * 1024 * 1024))
-        self.prompt()
+        space_bytes = humanfriendly.parse_size(space) if space else None
         async with self.geck as geck:
-            return await geck.random_cids(n=n)
+            return await geck.random_cids(n=n, space_bytes=space_bytes)
 
     async def _search(self, query: str, limit: int = 1, offset: int = 0):
         logging.getLogger('statbox').info({'action': 'search', 'query': query})
@@ -151,7 +312,14 @@ class StcGeckCli:
         return await summa_client.search_documents(search_request)
 
     @exception_handler
-    async def search(self, query: str, limit: int = 1, offset: int = 0):
+    async def search(
+        self,
+        query: str,
+        limit: int = 1,
+        offset: int = 0,
+        order_by: Optional[str] = None,
+        cursor: Optional[str] = None,
+    ):
         """
         Searches in STC using default Summa match queries.
         Examples: `doi:10.1234/abc, isbns:9781234567890, "fetal hemoglobin"`
@@ -159,21 +327,42 @@ class StcGeckCli:
         :param query: query in Summa match format
         :param limit: how many results to return, higher values incurs LARGE performance penalty.
         :param offset:
+        :param order_by:
+            fast field for sorting results in descending order, i.e. `issued_at`. Pages of sorted results
+            requested with `cursor` cost the same regardless of their depth
+        :param cursor:
+            cursor printed by the previous call for receiving the next page, requires `order_by`.
+            Results ordered by relevance are paged only with `offset`, deep pages of them are expensive
 
         :return: metadata records
         """
-        self.prompt()
         async with self.geck:
+            await self.start_summa()
             print(f"{colored('INFO', 'green')}: Searching {query}...", file=sys.stderr)
-            return await self._search(query, limit=limit, offset=offset)
+            logging.getLogger('statbox').info({'action': 'search', 'query': query, 'cursor': cursor})
+            search_request = {
+                'index_alias': self.index_alias,
+                'query': {'match': {'value': query.lower()}},
+                'collectors': [{'top_docs': {'limit': limit, 'offset': offset}}],
+                'is_fieldnorms_scoring_enabled': False,
+            }
+            if order_by:
+                search_request['collectors'][0]['top_docs']['scorer'] = {'order_by': order_by}
+            response = await self.geck.get_summa_client().search(apply_cursor(search_request, cursor))
+            documents = response.collector_outputs[0].documents
+            if next_cursor := get_next_cursor(search_request, documents.scored_documents, documents.has_next, cursor):
+                print(f"{colored('INFO', 'green')}: Next page: --cursor {next_cursor}", file=sys.stderr)
+            elif documents.has_next and not order_by:
+                print(f"{colored('INFO', 'green')}: Next page: --offset {offset + limit}", file=sys.stderr)
+            return [json.loads(scored_document.document) for scored_document in documents.scored_documents]
 
     @exception_handler
     async def serve(self):
         """
         Start serving Summa
         """
-        self.prompt()
         async with self.geck:
+            await self.start_summa()
             print(f"{colored('INFO', 'green')}: Serving on {self.grpc_api_endpoint}", file=sys.stderr)
             while True:
                 await asyncio.sleep(5)
@@ -191,27 +380,31 @@ class StcGeckCli:
 
         :return: metadata records
         """
-        self.prompt()
         async with self.geck as geck:
+            await self.start_summa()
             return await geck.create_ipfs_directory(output_car, query, limit, name_template)
 
 
 async def stc_geck_cli(
-    ipfs_http_base_url: str = 'http://127.0.0.1:8080',
+    ipfs_http_base_url: Union[str, List[str]] = 'http://127.0.0.1:8080',
     ipfs_api_base_url: str = 'http://127.0.0.1:5001',
     ipfs_data_directory: str = '/ipns/libstc.cc/data',
     grpc_api_endpoint: str = '127.0.0.1:10082',
     index_alias: str = 'nexus_science',
     timeout: int = 120,
+    cache_directory: Optional[str] = None,
+    mirror_directory: Optional[str] = None,
     debug: bool = False,
 ):
     """
-    :param ipfs_http_base_url: IPFS HTTP Endpoint
+    :param ipfs_http_base_url: IPFS HTTP Endpoint or the list of them, i.e. `'["http://127.0.0.1:8080", "https://dweb.link"]'`
     :param ipfs_api_base_url: IPFS HTTP API Endpoint
     :param ipfs_data_directory: path to the directory with index
     :param grpc_api_endpoint: port used for Summa
     :param index_alias: default index alias
     :param timeout: timeout for requests to IPFS
+    :param cache_directory: directory for persistent cache of index parts fetched from IPFS
+    :param mirror_directory: directory with the full local copy of the index created by `mirror` command
     :param debug: add debugging output
     :return:
     """
@@ -223,14 +416,21 @@ async def stc_geck_cli(
         grpc_api_endpoint=grpc_api_endpoint,
         index_alias=index_alias,
         timeout=timeout,
+        cache_directory=cache_directory,
+        mirror_directory=mirror_directory,
     )
     return {
         'create-ipfs-directory': stc_geck_client.create_ipfs_directory,
         'documents': stc_geck_client.documents,
+        'export': stc_geck_client.export,
         'download': stc_geck_client.download,
+        'download-many': stc_geck_client.download_many,
+        'mirror': stc_geck_client.mirror,
         'random-cids': stc_geck_client.random_cids,
         'search': stc_geck_client.search,
         'serve': stc_geck_client.serve,
+        'stats': stc_geck_client.stats,
+        'warmup': stc_geck_client.warmup,
     }
 
 
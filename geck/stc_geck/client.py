@@ -1,10 +1,21 @@
+import asyncio
+import base64
 import json
 import logging
+import os
 import re
 import tempfile
+import time
 from typing import (
     AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
     Optional,
+    Set,
+    Tuple,
+    Union,
 )
 from urllib.parse import (
     quote,
@@ -15,24 +26,56 @@ import aiohttp
 import aiohttp.client_exceptions
 import orjson
 import summa_embed
+from aiobaseclient.exceptions import TemporaryError
 from aiokit import AioThing
 from aiosumma import SummaClient
-from izihawa_ipfs_api import (
-    IpfsApiClient,
-    IpfsHttpClient,
-)
+from izihawa_ipfs_api import IpfsApiClient
+from izihawa_utils.itertools import ichunks
 from izihawa_utils.random import reservoir_sampling_async
 
 from .advices import (
     BaseDocumentHolder,
+    get_default_scorer,
     get_light_query_parser_config,
+    get_query_parser_config,
+)
+from .block_cache import DiskBlockCache
+from .cid_manifest import CidManifest
+from .exceptions import (
+    DownloadError,
+    IpfsConnectionError,
+)
+from .gateway_pool import (
+    Gateway,
+    GatewayPool,
+)
+from .metrics import (
+    InstrumentedIpfsHttpClient,
+    InstrumentedSummaClient,
+    IoMetrics,
 )
-from .exceptions import IpfsConnectionError
+from .query_cache import (
+    CachingSummaClient,
+    QueryCache,
+)
+from .range_proxy import RangeProxy
 from .utils import (
     create_car,
     is_endpoint_listening,
+    is_mirrored,
+    read_mirror_manifest,
+    write_mirror_manifest,
+    write_mirror_progress,
 )
 
+WARMUP_QUERIES = ('science', 'theory of everything')
+STC_HUB_PATH = '/ipns/hub.standard-template-construct.org'
+# Prefix of UnixFS `Data` of HAMT shards: field 1 (`Type`) with value 5 (`HAMTShard`)
+UNIXFS_HAMT_SHARD_TYPE = bytes([0x08, 0x05])
+HAMT_SHARD_NAME_LENGTH = 2
+# 3.61MB is the average size of the item
+AVERAGE_ITEM_SIZE = 3.61 * 1024 * 1024
+
 
 def get_config():
     return {
@@ -72,6 +115,20 @@ async def load_document(documents: AsyncIterator):
             yield document
 
 
+async def raw_response(response):
+    return response
+
+
+def get_field_values(document, path: List[str]):
+    if isinstance(document, list):
+        for item in document:
+            yield from get_field_values(item, path)
+    elif not path:
+        yield str(document)
+    elif isinstance(document, dict) and path[0] in document:
+        yield from get_field_values(document[path[0]], path[1:])
+
+
 async def trace_iteration(iter, every_n, **kwargs):
     i = 1
     async for el in iter:
@@ -84,31 +141,41 @@ async def trace_iteration(iter, every_n, **kwargs):
         yield el
 
 
-async def detect_host_header(url):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, allow_redirects=False) as resp:
-            if 300 <= resp.status < 400:
-                redirection_url = resp.headers['Location']
-                if 'localhost' in redirection_url:
-                    parsed_url = urlparse(redirection_url)
-                    return re.search(r'(.*)\.localhost.*', parsed_url.netloc).group(0)
+async def detect_host_header(session: aiohttp.ClientSession, url: str):
+    async with session.get(url, allow_redirects=False) as resp:
+        if 300 <= resp.status < 400:
+            redirection_url = resp.headers['Location']
+            if 'localhost' in redirection_url:
+                parsed_url = urlparse(redirection_url)
+                return re.search(r'(.*)\.localhost.*', parsed_url.netloc).group(0)
 
 
 class StcGeck(AioThing):
     def __init__(
             self,
-            ipfs_http_base_url: str = 'http://127.0.0.1:8080',
+            ipfs_http_base_url: Union[str, List[str]] = 'http://127.0.0.1:8080',
             ipfs_api_base_url: str = 'http://127.0.0.1:5001',
             ipfs_data_directory: str = '/ipns/libstc.cc/data',
             grpc_api_endpoint: str = '127.0.0.1:10082',
             index_alias: str = 'nexus_science',
             timeout: int = 300,
             default_cache_size: int = 300,
+            cache_directory: Optional[str] = None,
+            cache_max_size_bytes: int = 1024 * 1024 * 1024,
+            query_cache_size: int = 0,
+            query_cache_ttl: float = 600.0,
+            mirror_directory: Optional[str] = None,
+            prewarm: bool = False,
+            io_metrics_callback: Optional[Callable[[dict], None]] = None,
+            lazy_summa: bool = False,
+            probe_timeout: float = 5.0,
     ):
         """
         Constructs GECK that may be used to access STC dataset.
 
-        :param ipfs_http_base_url: IPFS HTTP base url, i.e `http://127.0.0.1:8080`
+        :param ipfs_http_base_url:
+            IPFS HTTP base url, i.e `http://127.0.0.1:8080`, or the list of them. The first one is used for downloads,
+            and reads of the embedded index are spread over all of them with hedging and failover
         :param ipfs_api_base_url: IPFS API base url, i.e `http://127.0.0.1:5001`
         :param ipfs_data_directory: path to the directory with indices
         :param grpc_api_endpoint:
@@ -116,10 +183,31 @@ class StcGeck(AioThing):
             GECK uses existing instance otherwise launches its own one
         :param timeout: timeout for requests sent to IPFS
         :param default_cache_size: the CachingDirectory size in bytes
+        :param cache_directory:
+            directory for persistent cache of index ranges fetched from IPFS and the manifest of STC Hub.
+            The cache survives restarts and may be shared by several processes.
+            If not set, only in-memory CachingDirectory is used
+        :param cache_max_size_bytes: upper bound for the size of persistent cache
+        :param query_cache_size: number of search responses cached by Summa client, 0 disables caching
+        :param query_cache_ttl: time in seconds during which cached search response is used
+        :param mirror_directory:
+            directory with the local copy of the index created by `mirror()`. If the copy is complete, embedded Summa
+            reads the index from the local disk instead of IPFS
+        :param prewarm: fetch hot parts of the index during start, so the first queries are not slowed down by IPFS
+        :param io_metrics_callback:
+            function called with I/O statistics of every search request. Setting it enables collecting I/O metrics,
+            see `enable_io_metrics()`
+        :param lazy_summa:
+            do not connect to Summa during start, it is done by the first method that needs the index.
+            Methods working only with IPFS do not wait for launching embedded Summa then
+        :param probe_timeout: timeout for checking Summa endpoint and IPFS gateways during start
         """
         super().__init__()
-        self.ipfs_http_base_url = canonoize_base_url(ipfs_http_base_url)
-        self.ipfs_http_client = IpfsHttpClient(self.ipfs_http_base_url, timeout=timeout)
+        if isinstance(ipfs_http_base_url, str):
+            ipfs_http_base_url = [ipfs_http_base_url]
+        self.ipfs_http_base_urls = [canonoize_base_url(base_url) for base_url in ipfs_http_base_url]
+        self.ipfs_http_base_url = self.ipfs_http_base_urls[0]
+        self.ipfs_http_client = InstrumentedIpfsHttpClient(self.ipfs_http_base_url, timeout=timeout)
         self.starts.append(self.ipfs_http_client)
         self.ipfs_api_client = IpfsApiClient(canonoize_base_url(ipfs_api_base_url), timeout=timeout)
         self.starts.append(self.ipfs_api_client)
@@ -127,39 +215,146 @@ class StcGeck(AioThing):
         self.grpc_api_endpoint = grpc_api_endpoint
         self.index_alias = index_alias
         self.default_cache_size = default_cache_size
+        self.cache_directory = cache_directory
+        self.cache_max_size_bytes = cache_max_size_bytes
+        self.range_proxy = None
+        self.mirror_directory = mirror_directory
+        self.prewarm = prewarm
+        self.timeout = timeout
         self.temp_dir = tempfile.TemporaryDirectory()
 
-        self.is_embed = not is_endpoint_listening(self.grpc_api_endpoint)
+        self.lazy_summa = lazy_summa
+        self.probe_timeout = probe_timeout
+        # Whether GECK launches its own Summa, it is known after `detect_embed()`
+        self.is_embed: Optional[bool] = None
         self.summa_embed_server = None
+        self.summa_lock = asyncio.Lock()
 
-        self.summa_client = SummaClient(
-            endpoint=self.grpc_api_endpoint,
-            max_message_length=2 * 1024 * 1024 * 1024 - 1,
-        )
+        self.query_cache = None
+        if query_cache_size > 0:
+            self.query_cache = QueryCache(max_size=query_cache_size, ttl=query_cache_ttl)
+            self.summa_client = CachingSummaClient(
+                endpoint=self.grpc_api_endpoint,
+                max_message_length=2 * 1024 * 1024 * 1024 - 1,
+                query_cache=self.query_cache,
+            )
+        else:
+            self.summa_client = InstrumentedSummaClient(
+                endpoint=self.grpc_api_endpoint,
+                max_message_length=2 * 1024 * 1024 * 1024 - 1,
+            )
+
+        self.io_metrics = None
+        if io_metrics_callback:
+            self.enable_io_metrics(io_metrics_callback)
+
+    def enable_io_metrics(self, callback: Optional[Callable[[dict], None]] = None) -> IoMetrics:
+        """
+        Starts collecting counters and latencies of range requests, gateway requests and IPFS downloads.
+        Should be called before start. Range requests of embedded Summa are routed through GECK proxy to be observed.
+
+        :param callback: function called with I/O statistics of every search request
+        :return: metrics that are updated while GECK is working
+        """
+        self.io_metrics = IoMetrics(callback=callback)
+        self.ipfs_http_client.io_metrics = self.io_metrics
+        self.summa_client.io_metrics = self.io_metrics
+        return self.io_metrics
+
+    def get_io_stats(self) -> Optional[dict]:
+        """
+        Returns I/O statistics collected since start if `enable_io_metrics()` has been called
+        """
+        return self.io_metrics.stats() if self.io_metrics else None
+
+    async def detect_gateways(self) -> List[Gateway]:
+        full_paths = [base_url + self.ipfs_data_directory for base_url in self.ipfs_http_base_urls]
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.probe_timeout)) as session:
+            host_headers = await asyncio.gather(
+                *(detect_host_header(session, full_path) for full_path in full_paths),
+                return_exceptions=True,
+            )
+        gateways = []
+        for full_path, host_header in zip(full_paths, host_headers):
+            if isinstance(host_header, (
+                aiohttp.client_exceptions.ClientOSError,
+                ConnectionRefusedError,
+                asyncio.TimeoutError,
+            )):
+                logging.getLogger('warning').warning({'action': 'unavailable_gateway', 'gateway': full_path})
+                continue
+            if isinstance(host_header, BaseException):
+                raise host_header
+            gateways.append(Gateway(full_path, host_header=host_header))
+        if not gateways:
+            raise IpfsConnectionError(base_error=host_headers[0])
+        return gateways
+
+    async def get_remote_index_config(self) -> dict:
+        headers_template = {'range': 'bytes={start}-{end}'}
+        gateways = await self.detect_gateways()
+        if self.cache_directory or len(gateways) > 1 or self.io_metrics:
+            self.range_proxy = RangeProxy(
+                gateway_pool=GatewayPool(gateways, timeout=self.timeout, io_metrics=self.io_metrics),
+                block_cache=DiskBlockCache(
+                    self.cache_directory,
+                    max_size_bytes=self.cache_max_size_bytes,
+                ) if self.cache_directory else None,
+                io_metrics=self.io_metrics,
+            )
+            await self.range_proxy.start()
+            full_path = self.range_proxy.base_url
+        else:
+            full_path = gateways[0].base_url
+            if gateways[0].host_header:
+                headers_template['host'] = gateways[0].host_header
+        return {'remote': {
+            'method': 'GET',
+            'url_template': f'{full_path}{{file_name}}',
+            'headers_template': headers_template,
+            'cache_config': {'cache_size': self.default_cache_size},
+        }}
+
+    async def detect_embed(self) -> bool:
+        """
+        Checks if there is Summa listening on `grpc_api_endpoint`
+
+        :return: `True` if GECK should launch its own Summa
+        """
+        if self.is_embed is None:
+            self.is_embed = not await is_endpoint_listening(self.grpc_api_endpoint, timeout=self.probe_timeout)
+        return self.is_embed
 
     async def start(self):
-        if self.is_embed:
+        if not self.lazy_summa:
+            await self.start_summa()
+
+    async def start_summa(self):
+        """
+        Launches embedded Summa if it is required and connects to Summa. Called by `start()` unless GECK is created
+        with `lazy_summa=True`, and by all methods that need the index.
+        """
+        async with self.summa_lock:
+            if self.summa_client.started:
+                return
+            await self.launch_summa()
+        if self.is_embed and self.prewarm:
+            await self.warmup()
+
+    async def launch_summa(self):
+        if await self.detect_embed():
             server_config = get_config()
             server_config['api']['grpc_endpoint'] = self.grpc_api_endpoint
             server_config['data_path'] = self.temp_dir.name
             server_config['log_path'] = self.temp_dir.name
-            full_path = self.ipfs_http_base_url + self.ipfs_data_directory
-            headers_template = {'range': 'bytes={start}-{end}'}
-            remote_index_config = {'remote': {
-                'method': 'GET',
-                'url_template': f'{full_path}{{file_name}}',
-                'headers_template': headers_template,
-                'cache_config': {'cache_size': self.default_cache_size},
-            }}
-            logging.getLogger('info').info({'action': 'launching_embedded', 'remote_index_config': remote_index_config})
-            try:
-                if host_header := await detect_host_header(full_path):
-                    headers_template['host'] = host_header
-            except (aiohttp.client_exceptions.ClientConnectorError, ConnectionRefusedError) as e:
-                raise IpfsConnectionError(base_error=e)
+            if self.mirror_directory and is_mirrored(self.mirror_directory):
+                index_config = {'file': {'path': os.path.abspath(self.mirror_directory)}}
+            else:
+                index_config = await self.get_remote_index_config()
+            logging.getLogger('info').info({'action': 'launching_embedded', 'index_config': index_config})
             server_config['core']['indices'][self.index_alias] = {
                 'query_parser_config': get_light_query_parser_config(),
-                'config': remote_index_config,
+                'config': index_config,
                 'field_triggers': {},
             }
             self.summa_embed_server = summa_embed.SummaEmbedServerBin(server_config)
@@ -169,16 +364,58 @@ class StcGeck(AioThing):
         except (aiohttp.client_exceptions.ClientConnectorError, ConnectionRefusedError) as e:
             raise IpfsConnectionError(base_error=e)
 
+    async def warmup(self, profiles: Iterable[str] = ('light', 'full'), is_full: bool = False) -> dict:
+        """
+        Fetches hot parts of the index ahead of time: term dictionaries of default fields, fast fields used by
+        ranking formulas and store blocks of top documents. Summa warmup and probing queries of every query parser
+        profile are sent in parallel.
+
+        :param profiles: query parser profiles that are going to be used, `light` and/or `full`
+        :param is_full: warm up the whole index instead of its hot parts, requires downloading the whole index
+        :return: statistics of the warmup, `prefetched_bytes` is `None` if Summa reads index not through GECK proxy
+        """
+        await self.start_summa()
+        fetched_bytes_before = self.range_proxy.fetched_bytes if self.range_proxy else None
+        started_at = time.monotonic()
+        await asyncio.gather(
+            self.summa_client.warmup_index(self.index_alias, is_full=is_full),
+            *(
+                self.summa_client.search_documents({
+                    'index_alias': self.index_alias,
+                    'query': {'match': {
+                        'value': query,
+                        'query_parser_config': get_query_parser_config(profile),
+                    }},
+                    'collectors': [{'top_docs': {'limit': 10, 'scorer': get_default_scorer(profile)}}],
+                    'is_fieldnorms_scoring_enabled': False,
+                })
+                for profile in profiles
+                for query in WARMUP_QUERIES
+            ),
+        )
+        stats = {
+            'prefetched_bytes': (
+                self.range_proxy.fetched_bytes - fetched_bytes_before
+                if fetched_bytes_before is not None else None
+            ),
+            'elapsed': time.monotonic() - started_at,
+        }
+        logging.getLogger('statbox').info({'action': 'warmed_up', 'mode': 'geck', **stats})
+        return stats
+
     async def stop(self):
         await self.summa_client.stop()
         if self.summa_embed_server:
             await self.summa_embed_server.stop()
             self.summa_embed_server = None
+        if self.range_proxy:
+            await self.range_proxy.stop()
+            self.range_proxy = None
         self.temp_dir.cleanup()
 
     def get_summa_client(self) -> SummaClient:
         """
-        Returns Summa client
+        Returns Summa client. If GECK is created with `lazy_summa=True`, `start_summa()` should be awaited before using it
         :return: Summa client
         """
         return self.summa_client
@@ -195,12 +432,97 @@ class StcGeck(AioThing):
         except (aiohttp.client_exceptions.ClientConnectorError, ConnectionRefusedError) as e:
             raise IpfsConnectionError(base_error=e)
 
-    async def download_document(self, document: dict, file_name: Optional[str] = None):
+    async def download_to_file(
+        self,
+        cid: str,
+        file_name: str,
+        filesize: Optional[int] = None,
+        chunk_size: int = 1024 * 1024,
+        max_attempts: int = 5,
+        read_timeout: float = 60.0,
+    ) -> int:
+        """
+        Download item by its IPFS CID and write it to the file chunk by chunk.
+        The file is written into `{file_name}.part` first and renamed after completion. If the transfer is interrupted,
+        it is resumed from the last written byte using HTTP Range requests, both within this call and in the next calls
+        for the same `file_name`.
+
+        :param cid: IPFS CID to the item required to download
+        :param file_name: filename for storing file
+        :param filesize: expected size of the file, i.e. `link['filesize']`. Used for verifying the downloaded file
+        :param chunk_size: size of chunks written to the disk
+        :param max_attempts: how many times in a row the transfer is resumed after failures without receiving any data
+        :param read_timeout: seconds without receiving data after which the transfer is resumed,
+            there is no limit on the duration of the whole transfer
+        :return: number of bytes in the written file
+        """
+        loop = asyncio.get_running_loop()
+        partial_file_name = file_name + '.part'
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=read_timeout)
+        attempt = 0
+        while True:
+            offset = os.path.getsize(partial_file_name) if os.path.exists(partial_file_name) else 0
+            if filesize and offset >= filesize:
+                break
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            try:
+                response = await self.ipfs_http_client.get(
+                    f'/ipfs/{cid}',
+                    headers=headers,
+                    response_processor=raw_response,
+                    timeout=timeout,
+                )
+                try:
+                    if response.status == 416:
+                        # The whole file has already been received before the interruption
+                        break
+                    if response.status == 200:
+                        # Range is not supported by the gateway, so start from scratch
+                        offset = 0
+                    elif response.status != 206:
+                        raise DownloadError(cid=cid, status=response.status)
+                    with open(partial_file_name, 'r+b' if offset else 'wb') as f:
+                        f.seek(offset)
+                        f.truncate()
+                        buffer = bytearray()
+                        try:
+                            async for data in response.content.iter_chunked(chunk_size):
+                                buffer.extend(data)
+                                if len(buffer) >= chunk_size:
+                                    await loop.run_in_executor(None, f.write, bytes(buffer))
+                                    buffer.clear()
+                        finally:
+                            # Data received before the interruption is kept for resuming
+                            await loop.run_in_executor(None, f.write, bytes(buffer))
+                    break
+                finally:
+                    response.release()
+            except (aiohttp.client_exceptions.ClientPayloadError, TemporaryError, asyncio.TimeoutError) as e:
+                written_size = os.path.getsize(partial_file_name) if os.path.exists(partial_file_name) else 0
+                # Only failures without progress are counted, so slow but steady transfers are not aborted
+                attempt = attempt + 1 if written_size <= offset else 1
+                logging.getLogger('warning').warning({
+                    'action': 'resuming_download',
+                    'cid': cid,
+                    'attempt': attempt,
+                    'written_size': written_size,
+                    'error': str(e),
+                })
+                if attempt >= max_attempts:
+                    raise DownloadError(cid=cid, reason='max_attempts_exceeded')
+        written_size = os.path.getsize(partial_file_name)
+        if filesize and written_size != filesize:
+            raise DownloadError(cid=cid, reason='size_mismatch', expected_size=filesize, size=written_size)
+        os.replace(partial_file_name, file_name)
+        return written_size
+
+    async def download_document(self, document: dict, file_name: Optional[str] = None, verify_size: bool = False):
         """
         Download document
 
         :param document: JSON document from STC
         :param file_name: Filename for storing file
+        :param verify_size: check the size of the downloaded file against `filesize` of the link
         :return: True if file has been successfully written
         """
         document_holder = BaseDocumentHolder(document)
@@ -208,37 +530,362 @@ class StcGeck(AioThing):
         if link:
             if not file_name:
                 file_name = quote(document_holder.get_internal_id(), safe='') + '.' + link['extension']
-            with open(file_name, 'wb') as f:
-                pdf_file = await self.download(link['cid'])
-                f.write(pdf_file)
+            await self.download_to_file(link['cid'], file_name, filesize=link.get('filesize') if verify_size else None)
             return True
         return False
 
-    async def random_cids(self, n: int = 1000):
+    async def resolve(self, query: str) -> Optional[dict]:
+        """
+        Returns the first document matching the query
+
+        :param query: query in Summa match format, i.e. `doi:10.1234/abc`
+        :return: JSON document or `None` if nothing has been found
+        """
+        await self.start_summa()
+        documents = await self.summa_client.search_documents({
+            'index_alias': self.index_alias,
+            'query': {'match': {'value': query.lower()}},
+            'collectors': [{'top_docs': {'limit': 1}}],
+            'is_fieldnorms_scoring_enabled': False,
+        })
+        if documents:
+            return documents[0]
+
+    async def get_many_by_internal_ids(
+        self,
+        internal_ids: Iterable[str],
+        batch_size: int = 100,
+        concurrency: int = 4,
+    ) -> Dict[str, dict]:
+        """
+        Returns documents for many internal IDs at once. IDs are looked up with boolean queries,
+        one query per `batch_size` IDs, instead of a query per ID.
+
+        :param internal_ids: IDs in `field:value` format, i.e. `id.dois:10.1234/abc`
+        :param batch_size: how many IDs are looked up by a single query
+        :param concurrency: how many queries are sent simultaneously
+        :return: mapping from found IDs to documents
+        """
+        await self.start_summa()
+        parsed_ids = {}
+        for internal_id in internal_ids:
+            field, value = internal_id.split(':', 1)
+            parsed_ids[internal_id] = (field, value)
+        semaphore = asyncio.Semaphore(concurrency)
+        results = {}
+
+        async def search(batch, limit):
+            async with semaphore:
+                return await self.summa_client.search_documents({
+                    'index_alias': self.index_alias,
+                    'query': {'boolean': {'subqueries': [{
+                        'occur': 'should',
+                        'query': {'term': {'field': field, 'value': value}},
+                    } for field, value in (parsed_ids[internal_id] for internal_id in batch)]}},
+                    'collectors': [{'top_docs': {'limit': limit}}],
+                    'is_fieldnorms_scoring_enabled': False,
+                })
+
+        def match_documents(batch, documents):
+            for document in documents:
+                for internal_id in batch:
+                    field, value = parsed_ids[internal_id]
+                    if internal_id not in results and value in get_field_values(document, field.split('.')):
+                        results[internal_id] = document
+
+        async def lookup_batch(batch):
+            # Leave room for duplicates sharing the same ID
+            limit = 2 * len(batch)
+            documents = await search(batch, limit)
+            match_documents(batch, documents)
+            # A value matching many documents may fill up the limit and push out documents of other IDs,
+            # so IDs that are still missing are looked up one by one
+            if len(documents) >= limit:
+                await asyncio.gather(*(lookup_id(internal_id) for internal_id in batch if internal_id not in results))
+
+        async def lookup_id(internal_id):
+            match_documents([internal_id], await search([internal_id], 1))
+
+        await asyncio.gather(*map(lookup_batch, ichunks(parsed_ids.keys(), batch_size)))
+        return results
+
+    async def _download_resolved(
+        self,
+        semaphore: asyncio.Semaphore,
+        query: str,
+        document: Optional[dict],
+        output_directory: str,
+        verify_size: bool,
+    ) -> dict:
+        if not document:
+            return {'query': query, 'status': 'not_found'}
+        document_holder = BaseDocumentHolder(document)
+        link = document_holder.get_links().get_first_link()
+        if not link:
+            return {'query': query, 'status': 'no_link'}
+        file_name = os.path.join(
+            output_directory,
+            quote(document_holder.get_internal_id() or link['cid'], safe='') + '.' + link['extension'],
+        )
+        report = {'query': query, 'cid': link['cid'], 'file_name': file_name}
+        if os.path.exists(file_name):
+            return {**report, 'status': 'skipped'}
+        async with semaphore:
+            try:
+                size = await self.download_to_file(
+                    link['cid'],
+                    file_name,
+                    filesize=link.get('filesize') if verify_size else None,
+                )
+            except (DownloadError, IpfsConnectionError, TemporaryError) as e:
+                return {**report, 'status': 'failed', 'error': str(e)}
+        return {**report, 'status': 'downloaded', 'size': size}
+
+    async def download_many(
+        self,
+        queries: Iterable[str],
+        output_directory: str,
+        concurrency: int = 8,
+        batch_size: int = 32,
+        verify_size: bool = False,
+    ) -> AsyncIterator[dict]:
+        """
+        Resolve queries and download found files concurrently.
+        Queries are resolved in batches while files of previous batches are being downloaded.
+        Files that already exist in `output_directory` are skipped.
+
+        :param queries: queries in Summa match format, i.e. `doi:10.1234/abc`
+        :param output_directory: directory for storing files
+        :param concurrency: how many files are downloaded simultaneously
+        :param batch_size: how many queries are resolved simultaneously
+        :param verify_size: check the size of downloaded files against `filesize` of the links
+        :return: report record for every query, in order of completion
+        """
+        os.makedirs(output_directory, exist_ok=True)
+        semaphore = asyncio.Semaphore(concurrency)
+        pending = {}
+
+        def get_report(task: asyncio.Task) -> dict:
+            query = pending.pop(task)
+            if task.exception() is not None:
+                return {'query': query, 'status': 'failed', 'error': repr(task.exception())}
+            return task.result()
+
+        try:
+            for batch in ichunks(queries, batch_size):
+                documents = await asyncio.gather(*[self.resolve(query) for query in batch], return_exceptions=True)
+                for query, document in zip(batch, documents):
+                    if isinstance(document, Exception):
+                        yield {'query': query, 'status': 'failed', 'error': repr(document)}
+                        continue
+                    pending[asyncio.create_task(
+                        self._download_resolved(semaphore, query, document, output_directory, verify_size)
+                    )] = query
+                # Do not let resolved but not downloaded items to pile up
+                while len(pending) >= batch_size:
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield get_report(task)
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield get_report(task)
+        finally:
+            # Downloads should not outlive the generator if it has been closed or has failed
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _list_hub(self, size: bool = False, path: str = STC_HUB_PATH) -> AsyncIterator[dict]:
+        async for item in trace_iteration(
+            self.ipfs_api_client.ls_stream(path, size=size, resolve_type=False),
+            10000,
+            action='trace_listing_items',
+        ):
+            for link in json.loads(item)['Objects'][0]['Links']:
+                yield link
+
+    async def _resolve_hub_root(self) -> str:
+        response = await self.ipfs_api_client.post(f'/api/v0/resolve?arg={STC_HUB_PATH}')
+        return (await response.json())['Path'].split('/')[-1]
+
+    async def _get_directory_node(self, cid: str) -> Tuple[bool, Dict[str, dict]]:
+        """
+        Returns whether the node is a shard of HAMT-sharded directory and its links by names
+        """
+        response = await self.ipfs_api_client.post(f'/api/v0/dag/get?arg={cid}')
+        node = await response.json()
+        data = node.get('Data', {}).get('/', {}).get('bytes', '')
+        data = base64.b64decode(data + '=' * (-len(data) % 4))
+        return data[:2] == UNIXFS_HAMT_SHARD_TYPE, {link['Name']: link for link in node['Links']}
+
+    async def _diff_directory_nodes(
+        self,
+        previous_cid: Optional[str],
+        cid: Optional[str],
+        added: Dict[str, int],
+        removed: Set[str],
+    ):
+        """
+        Collects items added and removed between two versions of a directory node, descending only into
+        shards of HAMT-sharded directory that have changed
+        """
+        (previous_is_shard, previous_links), (is_shard, links) = await asyncio.gather(
+            self._get_directory_node(previous_cid) if previous_cid else asyncio.sleep(0, (True, {})),
+            self._get_directory_node(cid) if cid else asyncio.sleep(0, (True, {})),
+        )
+        subshards = []
+        for name in set(previous_links) | set(links):
+            previous_link, link = previous_links.get(name), links.get(name)
+            previous_hash = previous_link['Hash']['/'] if previous_link else None
+            current_hash = link['Hash']['/'] if link else None
+            if previous_hash == current_hash:
+                continue
+            # Links to subshards have names of exactly two hex digits, links to items are prefixed by them
+            if previous_is_shard and is_shard and len(name) == HAMT_SHARD_NAME_LENGTH:
+                subshards.append(self._diff_directory_nodes(previous_hash, current_hash, added, removed))
+                continue
+            if previous_hash:
+                removed.add(previous_hash)
+            if current_hash:
+                added[current_hash] = link.get('Tsize', 0)
+        await asyncio.gather(*subshards)
+
+    async def _diff_hub(self, previous_root_cid: str, root_cid: str) -> Tuple[Dict[str, int], Set[str]]:
+        """
+        Returns items added to STC Hub with their sizes and items removed from it since `previous_root_cid`
+        """
+        added, removed = {}, set()
+        await self._diff_directory_nodes(previous_root_cid, root_cid, added, removed)
+        return added, removed - set(added)
+
+    async def get_cid_manifest(self) -> CidManifest:
+        """
+        Returns manifest of STC Hub stored in `cache_directory`. The manifest is built on the first call.
+        If the root of STC Hub has changed since then, only changed shards of STC Hub are fetched
+        and merged into the manifest.
+
+        :return: memory-mapped manifest with CIDs and sizes of all items in STC Hub
+        """
+        if not self.cache_directory:
+            raise ValueError('`cache_directory` should be set for using CID manifest')
+        os.makedirs(self.cache_directory, exist_ok=True)
+        cid_manifest = CidManifest(os.path.join(self.cache_directory, 'hub-manifest.bin'))
+        cid_manifest.open()
+        root_cid = await self._resolve_hub_root()
+        if cid_manifest.root_cid == root_cid:
+            return cid_manifest
+        if cid_manifest.root_cid:
+            added, removed = await self._diff_hub(cid_manifest.root_cid, root_cid)
+            logging.getLogger('statbox').info({
+                'action': 'updating_cid_manifest',
+                'root_cid': root_cid,
+                'previous_root_cid': cid_manifest.root_cid,
+                'added': len(added),
+                'removed': len(removed),
+            })
+            await cid_manifest.update(root_cid, added.items(), removed)
+        else:
+            logging.getLogger('statbox').info({'action': 'building_cid_manifest', 'root_cid': root_cid})
+            await cid_manifest.build(
+                root_cid,
+                ((link['Hash'], link.get('Size', 0)) async for link in self._list_hub(size=True)),
+            )
+        return cid_manifest
+
+    async def mirror(self, mirror_directory: Optional[str] = None, concurrency: int = 8) -> dict:
+        """
+        Downloads index files from `ipfs_data_directory` to the local directory. Files are downloaded in parallel,
+        interrupted downloads are resumed and files that have not changed since the previous call are skipped.
+        Files that have disappeared from `ipfs_data_directory` are removed from the local copy.
+
+        :param mirror_directory: directory for storing index, `mirror_directory` passed to constructor by default
+        :param concurrency: how many files are downloaded simultaneously
+        :return: statistics of the mirroring
+        """
+        mirror_directory = mirror_directory or self.mirror_directory
+        if not mirror_directory:
+            raise ValueError('`mirror_directory` should be set for mirroring')
+        os.makedirs(mirror_directory, exist_ok=True)
+        previous_files = read_mirror_manifest(mirror_directory)
+        listing = await self.ipfs_api_client.ls(self.ipfs_data_directory, size=True, resolve_type=True)
+        files = {
+            link['Name']: link
+            for item in listing['Objects']
+            for link in item['Links']
+            if link['Type'] == 2
+        }
+        intact_files = {
+            name: file_hash
+            for name, file_hash in previous_files.items()
+            if (
+                name in files
+                and files[name]['Hash'] == file_hash
+                and os.path.exists(os.path.join(mirror_directory, name))
+            )
+        }
+        if intact_files != previous_files or len(intact_files) != len(files):
+            # Files are replaced in place, so the mirror must not be opened until all of them are downloaded
+            write_mirror_progress(mirror_directory, intact_files)
+        semaphore = asyncio.Semaphore(concurrency)
+        stats = {'downloaded': 0, 'skipped': 0, 'removed': 0, 'downloaded_bytes': 0}
+
+        async def mirror_file(name, link):
+            if name in intact_files:
+                stats['skipped'] += 1
+                return
+            async with semaphore:
+                logging.getLogger('statbox').info({'action': 'mirroring', 'file_name': name, 'size': link['Size']})
+                downloaded_bytes = await self.download_to_file(
+                    link['Hash'],
+                    os.path.join(mirror_directory, name),
+                    filesize=link['Size'],
+                )
+                stats['downloaded_bytes'] += downloaded_bytes
+                stats['downloaded'] += 1
+                # Downloaded files are skipped if mirroring is interrupted and restarted
+                intact_files[name] = link['Hash']
+                write_mirror_progress(mirror_directory, intact_files)
+
+        tasks = [asyncio.create_task(mirror_file(name, link)) for name, link in files.items()]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # Remaining downloads are stopped if one of them has failed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for name in set(previous_files) - set(files):
+            file_name = os.path.join(mirror_directory, name)
+            if os.path.exists(file_name):
+                os.remove(file_name)
+                stats['removed'] += 1
+        write_mirror_manifest(mirror_directory, {name: link['Hash'] for name, link in files.items()})
+        return stats
+
+    async def random_cids(self, n: Optional[int] = 1000, space_bytes: Optional[int] = None):
         """
         Returns random CIDs from STC dataset. May be helpful for pinning random subsets of STC.
+        If `cache_directory` is set, CIDs are sampled from the local manifest of STC Hub
+        instead of listing the whole STC Hub on every call.
 
         :param n: the number of Random CIDs
+        :param space_bytes: select CIDs with total size fitting into this number of bytes instead of `n`
         :return:
         """
-        items = await reservoir_sampling_async(
-            async_iterator=trace_iteration(
-                self.ipfs_api_client.ls_stream(
-                    '/ipns/hub.standard-template-construct.org',
-                    size=False,
-                    resolve_type=False,
-                ),
-                10000,
-                action='trace_listing_items',
-            ),
-            n=n
-        )
-        cids = []
-        for item in items:
-            item = json.loads(item)
-            link = item['Objects'][0]['Links'][0]
-            cids.append(link['Hash'])
-        return cids
+        if self.cache_directory:
+            cid_manifest = await self.get_cid_manifest()
+            try:
+                if space_bytes:
+                    return cid_manifest.sample_by_size(space_bytes)
+                return cid_manifest.sample(n)
+            finally:
+                cid_manifest.close()
+        if space_bytes:
+            n = int(space_bytes / AVERAGE_ITEM_SIZE)
+        items = await reservoir_sampling_async(async_iterator=self._list_hub(), n=n)
+        return [item['Hash'] for item in items]
 
     async def create_ipfs_directory(
             self,
@@ -256,6 +903,7 @@ class StcGeck(AioThing):
         :param name_template: template that will be used for naming items inside CAR
         :return: the root CID that you can use for addressing directory after importing CAR to IPFS daemon
         """
+        await self.start_summa()
         if query and self.is_embed:
             logging.getLogger('warning').warning('Too high limit for embedded Summa')
         if query:
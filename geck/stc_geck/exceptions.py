@@ -5,6 +5,14 @@ class IpfsConnectionError(BaseError):
     pass
 
 
+class CarBuildError(BaseError):
+    pass
+
+
+class DownloadError(BaseError):
+    pass
+
+
 class ItemNotFound(BaseError):
     def __init__(self, query):
         self.query = query
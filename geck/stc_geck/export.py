@@ -0,0 +1,224 @@
+import asyncio
+import os.path
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    AsyncIterator,
+    List,
+    Union,
+)
+
+import orjson
+
+EXPORT_FORMATS = ('jsonl.zst', 'parquet')
+
+
+class JsonlZstShardWriter:
+    """
+    Writes documents as they are received from Summa into zstd-compressed JSONL files
+    """
+    extension = 'jsonl.zst'
+
+    def __init__(self, file_name_template: str, shard_size: int, compression_level: int = 3):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('Install `zstandard` for exporting to `jsonl.zst`: `pip install stc-geck[export]`')
+        self.compressor = zstandard.ZstdCompressor(level=compression_level)
+        self.file_name_template = file_name_template
+        self.shard_size = shard_size
+        self.shard = 0
+        self.written = 0
+        self.file = None
+        self.stream = None
+        self.file_names = []
+
+    def open_shard(self):
+        file_name = self.file_name_template.format(shard=self.shard, extension=self.extension)
+        self.file = open(file_name, 'wb')
+        self.stream = self.compressor.stream_writer(self.file)
+        self.file_names.append(file_name)
+        self.shard += 1
+        self.written = 0
+
+    def write(self, documents: List[Union[str, bytes]]):
+        for document in documents:
+            if self.stream is None or self.written >= self.shard_size:
+                self.close()
+                self.open_shard()
+            self.stream.write(document.encode() if isinstance(document, str) else document)
+            self.stream.write(b'\n')
+            self.written += 1
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+            self.file = None
+
+
+class ParquetShardWriter:
+    """
+    Writes documents into Parquet files, one row group per batch. Nested fields are stored as JSON strings.
+
+    Schema is inferred from the first batch of every shard. If a batch does not fit the schema of the current shard,
+    the next shard is started, so files may have slightly different schemas and should be read with schema unification.
+    """
+    extension = 'parquet'
+
+    def __init__(self, file_name_template: str, shard_size: int, compression: str = 'zstd'):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('Install `pyarrow` for exporting to `parquet`: `pip install stc-geck[export]`')
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.file_name_template = file_name_template
+        self.shard_size = shard_size
+        self.compression = compression
+        self.shard = 0
+        self.written = 0
+        self.writer = None
+        self.file_names = []
+
+    @staticmethod
+    def flatten(document: dict) -> dict:
+        return {
+            key: orjson.dumps(value).decode() if isinstance(value, (dict, list)) else value
+            for key, value in document.items()
+        }
+
+    @staticmethod
+    def coerce_mixed_columns(rows: List[dict]) -> List[dict]:
+        types = {}
+        for row in rows:
+            for key, value in row.items():
+                if value is not None:
+                    types.setdefault(key, set()).add(float if isinstance(value, int) and not isinstance(value, bool) else type(value))
+        mixed_keys = {key for key, key_types in types.items() if len(key_types) > 1}
+        return [{
+            key: orjson.dumps(value).decode() if key in mixed_keys and value is not None else value
+            for key, value in row.items()
+        } for row in rows]
+
+    def open_shard(self, table):
+        schema = self.pa.schema([
+            field.with_type(self.pa.string()) if self.pa.types.is_null(field.type) else field
+            for field in table.schema
+        ])
+        file_name = self.file_name_template.format(shard=self.shard, extension=self.extension)
+        self.writer = self.pq.ParquetWriter(file_name, schema, compression=self.compression)
+        self.file_names.append(file_name)
+        self.shard += 1
+        self.written = 0
+
+    def write(self, documents: List[Union[str, bytes]]):
+        rows = [self.flatten(orjson.loads(document)) for document in documents]
+        if self.writer is not None and self.written < self.shard_size:
+            try:
+                table = self.pa.Table.from_pylist(rows, schema=self.writer.schema)
+            except (self.pa.ArrowInvalid, self.pa.ArrowTypeError):
+                table = None
+            if table is not None and set().union(*rows) <= set(self.writer.schema.names):
+                self.writer.write_table(table)
+                self.written += len(rows)
+                return
+        self.close()
+        try:
+            table = self.pa.Table.from_pylist(rows)
+        except (self.pa.ArrowInvalid, self.pa.ArrowTypeError):
+            # Values of different types in the same column are stored as JSON strings
+            rows = self.coerce_mixed_columns(rows)
+            table = self.pa.Table.from_pylist(rows)
+        self.open_shard(table)
+        self.writer.write_table(self.pa.Table.from_pylist(rows, schema=self.writer.schema))
+        self.written += len(rows)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def create_shard_writer(export_format: str, file_name_template: str, shard_size: int):
+    if export_format == 'jsonl.zst':
+        return JsonlZstShardWriter(file_name_template, shard_size)
+    elif export_format == 'parquet':
+        return ParquetShardWriter(file_name_template, shard_size)
+    else:
+        raise ValueError(f'Unknown format `{export_format}`, should be one of {EXPORT_FORMATS}')
+
+
+async def export_documents(
+    documents: AsyncIterator[Union[str, bytes]],
+    output_directory: str,
+    export_format: str = 'jsonl.zst',
+    shard_size: int = 1_000_000,
+    batch_size: int = 10_000,
+    writers: int = 2,
+    queue_size: int = 4,
+) -> List[str]:
+    """
+    Writes documents into sharded files. Documents are collected in batches on the event loop while
+    decoding, encoding and compression are done by writer threads. The queue between them is bounded, so
+    reading from Summa slows down instead of accumulating documents in memory if writers cannot keep up.
+
+    :param documents: JSON documents
+    :param output_directory: directory for writing shards
+    :param export_format: `jsonl.zst` or `parquet`
+    :param shard_size: maximum number of documents in a single file
+    :param batch_size: number of documents passed to writer at once, it is also the size of Parquet row groups
+    :param writers: number of writer threads, each of them writes its own sequence of shards
+    :param queue_size: number of batches waiting for writers
+    :return: names of written files
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    shard_writers = [
+        create_shard_writer(
+            export_format,
+            os.path.join(output_directory, f'part-{writer_id:02d}-{{shard:05d}}.{{extension}}'),
+            shard_size,
+        )
+        for writer_id in range(writers)
+    ]
+    queue = asyncio.Queue(maxsize=queue_size)
+    loop = asyncio.get_running_loop()
+
+    with ThreadPoolExecutor(max_workers=writers, thread_name_prefix='geck_export') as executor:
+        async def write_batches(shard_writer):
+            try:
+                while (batch := await queue.get()) is not None:
+                    await loop.run_in_executor(executor, shard_writer.write, batch)
+            finally:
+                await loop.run_in_executor(executor, shard_writer.close)
+
+        writer_tasks = [asyncio.create_task(write_batches(shard_writer)) for shard_writer in shard_writers]
+
+        async def put(item):
+            # Failed writer would never take batches from the queue, so it must not be awaited forever
+            put_task = asyncio.create_task(queue.put(item))
+            await asyncio.wait([put_task, *writer_tasks], return_when=asyncio.FIRST_COMPLETED)
+            if not put_task.done():
+                put_task.cancel()
+                for writer_task in writer_tasks:
+                    if writer_task.done():
+                        writer_task.result()
+
+        try:
+            batch = []
+            async for document in documents:
+                batch.append(document)
+                if len(batch) >= batch_size:
+                    await put(batch)
+                    batch = []
+            if batch:
+                await put(batch)
+            for _ in writer_tasks:
+                await put(None)
+            await asyncio.gather(*writer_tasks)
+        except BaseException:
+            for writer_task in writer_tasks:
+                writer_task.cancel()
+            await asyncio.gather(*writer_tasks, return_exceptions=True)
+            raise
+    return [file_name for shard_writer in shard_writers for file_name in shard_writer.file_names]
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import (
+    List,
+    Optional,
+    Tuple,
+)
+
+import aiohttp
+from aiokit import AioThing
+
+from .metrics import IoMetrics
+
+PASSED_HEADERS = ('Content-Range', 'Content-Type', 'Accept-Ranges')
+
+
+class GatewayError(Exception):
+    pass
+
+
+class Gateway:
+    def __init__(self, base_url: str, host_header: Optional[str] = None, max_samples: int = 200):
+        """
+        :param base_url: URL of the index directory on IPFS gateway, i.e `http://127.0.0.1:8080/ipns/libstc.cc/data/`
+        :param host_header: `Host` header required by subdomain gateways
+        :param max_samples: number of recent latencies used for estimating gateway speed
+        """
+        self.base_url = base_url
+        self.host_header = host_header
+        self.latencies = deque(maxlen=max_samples)
+        self.unhealthy_until = 0.0
+
+    def is_healthy(self) -> bool:
+        return self.unhealthy_until <= time.monotonic()
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(int(len(latencies) * percentile / 100), len(latencies) - 1)]
+
+
+class GatewayPool(AioThing):
+    """
+    Reads ranges of index files from several IPFS gateways.
+
+    Every request goes to the healthy gateway with the lowest median latency. If it has not responded within
+    `hedge_percentile` of its recent latencies, the same request is sent to the next gateway and the first response
+    wins. Gateways that fail are excluded for `cooldown` seconds, and the request fails over to the next one.
+    """
+    def __init__(
+        self,
+        gateways: List[Gateway],
+        timeout: int = 300,
+        hedge_percentile: float = 95.0,
+        default_hedge_delay: float = 1.0,
+        min_hedge_delay: float = 0.05,
+        cooldown: float = 60.0,
+        io_metrics: Optional[IoMetrics] = None,
+    ):
+        """
+        :param gateways: gateways serving the same index directory
+        :param timeout: timeout for requests sent to IPFS
+        :param hedge_percentile: percentile of latencies after which a hedged request is sent
+        :param default_hedge_delay: delay before hedged request for gateways without latency statistics yet
+        :param min_hedge_delay: lower bound for hedge delay, prevents duplicating every request to fast gateways
+        :param cooldown: time in seconds during which failed gateway is not used
+        :param io_metrics: metrics for recording latencies and failures of gateways
+        """
+        super().__init__()
+        self.gateways = gateways
+        self.timeout = timeout
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.cooldown = cooldown
+        self.io_metrics = io_metrics
+        self.session = None
+
+    def ranked_gateways(self) -> List[Gateway]:
+        # Gateways without statistics go first, so every gateway gets probed
+        def rank(gateway: Gateway):
+            median = gateway.latency_percentile(50)
+            return not gateway.is_healthy(), median if median is not None else 0.0
+        return sorted(self.gateways, key=rank)
+
+    def hedge_delay(self, gateway: Gateway) -> float:
+        delay = gateway.latency_percentile(self.hedge_percentile) if len(gateway.latencies) >= 10 else None
+        return max(delay if delay is not None else self.default_hedge_delay, self.min_hedge_delay)
+
+    async def fetch_from(self, gateway: Gateway, file_name: str, headers: dict) -> Tuple[int, dict, bytes]:
+        request_headers = dict(headers)
+        if gateway.host_header:
+            request_headers['Host'] = gateway.host_header
+        started_at = time.monotonic()
+        try:
+            async with self.session.get(gateway.base_url + file_name, headers=request_headers) as response:
+                data = await response.read()
+                if response.status >= 500 or response.status == 429:
+                    raise GatewayError(f'{gateway.base_url} responded with {response.status}')
+                gateway.latencies.append(time.monotonic() - started_at)
+                if self.io_metrics:
+                    self.io_metrics.record_gateway_request(gateway.base_url, gateway.latencies[-1])
+                return response.status, {
+                    header: response.headers[header] for header in PASSED_HEADERS if header in response.headers
+                }, data
+        except asyncio.CancelledError:
+            # Gateway lost the race to the hedged request, elapsed time is the lower bound of its latency
+            gateway.latencies.append(time.monotonic() - started_at)
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError, GatewayError) as e:
+            gateway.unhealthy_until = time.monotonic() + self.cooldown
+            if self.io_metrics:
+                self.io_metrics.record_gateway_request(gateway.base_url, time.monotonic() - started_at, is_failed=True)
+            logging.getLogger('warning').warning({
+                'action': 'gateway_failed',
+                'mode': 'gateway_pool',
+                'gateway': gateway.base_url,
+                'error': str(e),
+            })
+            raise GatewayError(str(e)) from e
+
+    async def fetch(self, file_name: str, headers: dict) -> Tuple[int, dict, bytes]:
+        """
+        Fetches file or range of the file from the gateways
+
+        :param file_name: name of the index file
+        :param headers: headers of the request, i.e. `Range`
+        :return: status, headers and body of the first successful response
+        """
+        gateways = self.ranked_gateways()
+        next_gateway = 0
+        pending = set()
+        last_error = None
+        try:
+            while True:
+                if not pending:
+                    if next_gateway >= len(gateways):
+                        raise last_error
+                    pending.add(asyncio.create_task(self.fetch_from(gateways[next_gateway], file_name, headers)))
+                    next_gateway += 1
+                hedge_delay = self.hedge_delay(gateways[next_gateway - 1]) if next_gateway < len(gateways) else None
+                done, pending = await asyncio.wait(pending, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    pending.add(asyncio.create_task(self.fetch_from(gateways[next_gateway], file_name, headers)))
+                    next_gateway += 1
+                    continue
+                for task in done:
+                    try:
+                        return task.result()
+                    except GatewayError as e:
+                        last_error = e
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    async def stop(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
@@ -0,0 +1,202 @@
+import bisect
+import time
+from contextlib import asynccontextmanager
+from typing import (
+    Callable,
+    Dict,
+    Optional,
+    Sequence,
+    Union,
+)
+
+from aiosumma import SummaClient
+from aiosumma.client import prepare_search_request
+from aiosumma.proto import query_pb2 as query_pb
+from izihawa_ipfs_api import IpfsHttpClient
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNTERS = (
+    'range_requests',
+    'fetched_bytes',
+    'cache_hits',
+    'cache_misses',
+    'gateway_requests',
+    'gateway_failures',
+    'ipfs_http_requests',
+    'ipfs_http_bytes',
+)
+
+
+class LatencyHistogram:
+    """
+    Histogram with fixed buckets, `buckets[i]` counts observations that are not greater than `bounds[i]`
+    """
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """
+        Upper bound of the bucket containing the percentile, `inf` for the last bucket
+        """
+        if not self.count:
+            return None
+        rank = self.count * percentile / 100
+        accumulated = 0
+        for bound, bucket in zip(self.bounds + (float('inf'),), self.buckets):
+            accumulated += bucket
+            if accumulated >= rank:
+                return bound
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'buckets': {
+                str(bound): bucket
+                for bound, bucket in zip(self.bounds + (float('inf'),), self.buckets)
+            },
+        }
+
+
+class IoMetrics:
+    """
+    Counters and latency histograms of I/O done for reading the remote index and downloading items from IPFS.
+
+    Range requests are issued by embedded Summa, so they cannot be attributed to a particular query exactly.
+    Per-query statistics are the difference of counters between the start and the end of the query, they are exact
+    if queries are not running concurrently. `concurrent_queries` tells how many queries overlapped with the query.
+    """
+    def __init__(self, callback: Optional[Callable[[dict], None]] = None):
+        """
+        :param callback: function called with statistics of every finished query
+        """
+        self.callback = callback
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.latencies: Dict[str, LatencyHistogram] = {}
+        self.active_queries = 0
+        self.started_queries = 0
+
+    def increment(self, counter: str, value: int = 1):
+        self.counters[counter] += value
+
+    def observe(self, histogram: str, value: float):
+        if histogram not in self.latencies:
+            self.latencies[histogram] = LatencyHistogram()
+        self.latencies[histogram].observe(value)
+
+    def record_range_request(self, size: int, is_cache_hit: Optional[bool], latency: float):
+        self.increment('range_requests')
+        if is_cache_hit is not None:
+            self.increment('cache_hits' if is_cache_hit else 'cache_misses')
+        if not is_cache_hit:
+            self.increment('fetched_bytes', size)
+        self.observe('range_request', latency)
+
+    def record_gateway_request(self, gateway: str, latency: float, is_failed: bool = False):
+        self.increment('gateway_requests')
+        if is_failed:
+            self.increment('gateway_failures')
+        else:
+            self.observe(f'gateway:{gateway}', latency)
+
+    def record_ipfs_http_request(self, size: int, latency: float):
+        self.increment('ipfs_http_requests')
+        self.increment('ipfs_http_bytes', size)
+        self.observe('ipfs_http_request', latency)
+
+    @asynccontextmanager
+    async def track_query(self, index_alias: str):
+        counters_before = dict(self.counters)
+        active_queries_before, started_queries_before = self.active_queries, self.started_queries
+        self.active_queries += 1
+        self.started_queries += 1
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started_at
+            self.active_queries -= 1
+            # Queries that were running at the start plus queries started while this one was running
+            concurrent_queries = active_queries_before + self.started_queries - started_queries_before - 1
+            self.observe('query', elapsed)
+            if self.callback:
+                self.callback({
+                    'index_alias': index_alias,
+                    'elapsed': elapsed,
+                    'concurrent_queries': concurrent_queries,
+                    **{counter: self.counters[counter] - counters_before[counter] for counter in COUNTERS},
+                })
+
+    def stats(self) -> dict:
+        lookups = self.counters['cache_hits'] + self.counters['cache_misses']
+        return {
+            **self.counters,
+            'cache_hit_ratio': self.counters['cache_hits'] / lookups if lookups else 0.0,
+            'latencies': {name: histogram.to_dict() for name, histogram in sorted(self.latencies.items())},
+        }
+
+    def reset(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.latencies = {}
+
+
+class InstrumentedSummaClient(SummaClient):
+    """
+    Summa client that records I/O done by every search request, including methods built on top of `search`
+    """
+    def __init__(self, *args, io_metrics: Optional[IoMetrics] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.io_metrics = io_metrics
+
+    async def search(
+        self,
+        search_request: Union[dict, query_pb.SearchRequest],
+        ignore_not_found: bool = False,
+        request_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+    ) -> query_pb.SearchResponse:
+        if not self.io_metrics:
+            return await super().search(
+                search_request,
+                ignore_not_found=ignore_not_found,
+                request_id=request_id,
+                session_id=session_id,
+            )
+        search_request = prepare_search_request(search_request)
+        async with self.io_metrics.track_query(search_request.index_alias):
+            return await super().search(
+                search_request,
+                ignore_not_found=ignore_not_found,
+                request_id=request_id,
+                session_id=session_id,
+            )
+
+
+class InstrumentedIpfsHttpClient(IpfsHttpClient):
+    """
+    IPFS HTTP client that records time to response headers and declared sizes of responses
+    """
+    def __init__(self, *args, io_metrics: Optional[IoMetrics] = None, **kwargs):
+        self.io_metrics = io_metrics
+        super().__init__(*args, **kwargs)
+
+    async def request(self, *args, **kwargs):
+        if not self.io_metrics:
+            return await super().request(*args, **kwargs)
+        started_at = time.monotonic()
+        response = await super().request(*args, **kwargs)
+        self.io_metrics.record_ipfs_http_request(
+            getattr(response, 'content_length', None) or 0,
+            time.monotonic() - started_at,
+        )
+        return response
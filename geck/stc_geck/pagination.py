@@ -0,0 +1,112 @@
+"""
+Cursor pagination over results sorted by a field.
+
+Deeper pages are selected by a range filter on the sort field, so they cost the same as the first page.
+Results ordered by relevance cannot be paged this way: Summa has no search-after for `top_docs`, does not return
+addresses of documents and cannot filter by score. They are still paged with `offset`.
+"""
+import base64
+import copy
+import re
+from typing import (
+    List,
+    Optional,
+    Union,
+)
+
+import orjson
+from aiosumma.proto import query_pb2 as query_pb
+
+FIELD_NAME_REGEX = re.compile(r'[A-Za-z_][A-Za-z0-9_.]*')
+
+
+def encode_cursor(cursor: dict) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(cursor)).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> dict:
+    return orjson.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+
+
+def get_top_docs(search_request: dict) -> dict:
+    for collector in search_request['collectors']:
+        if 'top_docs' in collector:
+            return collector['top_docs']
+    raise ValueError('Cursor pagination requires `top_docs` collector')
+
+
+def get_sort_field(search_request: dict) -> Optional[str]:
+    """
+    Returns the field documents are sorted by, or `None` if they are sorted by an arbitrary expression such as relevance
+    """
+    scorer = get_top_docs(search_request).get('scorer') or {}
+    if 'order_by' in scorer:
+        return scorer['order_by']
+    if FIELD_NAME_REGEX.fullmatch(scorer.get('eval_expr', '')):
+        return scorer['eval_expr']
+
+
+def get_score(scored_document: query_pb.ScoredDocument) -> Union[int, float]:
+    return getattr(scored_document.score, scored_document.score.WhichOneof('score'))
+
+
+def format_value(value: Union[int, float]) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def apply_cursor(search_request: dict, cursor: Optional[str]) -> dict:
+    """
+    Returns search request for the page following the cursor.
+
+    The page is selected by a range filter on the sort field, so Summa does not collect and discard documents
+    of previous pages. `skip` documents having the same value as the last document of the previous page are skipped
+    with a small offset.
+
+    :param search_request: search request for the first page, should be sorted by a field
+    :param cursor: cursor returned by `get_next_cursor()` or `None` for the first page
+    """
+    if not cursor:
+        return search_request
+    if not get_sort_field(search_request):
+        raise ValueError('Cursor pagination requires results sorted by a field')
+    cursor = decode_cursor(cursor)
+    search_request = copy.deepcopy(search_request)
+    top_docs = get_top_docs(search_request)
+    search_request['query'] = {'boolean': {'subqueries': [
+        {'occur': 'must', 'query': search_request['query']},
+        {'occur': 'must', 'query': {'range': {
+            'field': get_sort_field(search_request),
+            'value': {'left': '*', 'right': cursor['value'], 'including_left': True, 'including_right': True},
+        }}},
+    ]}}
+    top_docs['offset'] = cursor['skip']
+    return search_request
+
+
+def get_next_cursor(
+    search_request: dict,
+    scored_documents: List[query_pb.ScoredDocument],
+    has_next: bool,
+    cursor: Optional[str] = None,
+) -> Optional[str]:
+    """
+    Returns cursor pointing to the page after `scored_documents`
+
+    :param search_request: search request for the first page
+    :param scored_documents: documents of the current page
+    :param has_next: whether there are more documents
+    :param cursor: cursor of the current page
+    :return: cursor or `None` if there are no more documents or results are not sorted by a field
+    """
+    if not has_next or not scored_documents or not get_sort_field(search_request):
+        return None
+    cursor = decode_cursor(cursor) if cursor else {}
+    last_value = format_value(get_score(scored_documents[-1]))
+    skip = 0
+    for scored_document in reversed(scored_documents):
+        if format_value(get_score(scored_document)) != last_value:
+            break
+        skip += 1
+    if cursor.get('value') == last_value:
+        skip += cursor['skip']
+    return encode_cursor({'value': last_value, 'skip': skip})
@@ -0,0 +1,123 @@
+import re
+import time
+from collections import OrderedDict
+from typing import (
+    Optional,
+    Union,
+)
+
+import orjson
+from aiosumma.client import prepare_search_request
+from aiosumma.proto import query_pb2 as query_pb
+from izihawa_utils.pb_to_json import MessageToDict
+
+from .metrics import InstrumentedSummaClient
+
+BOOLEAN_OPERATOR_REGEX = re.compile(r'\b(AND|OR|NOT)\b')
+MULTIWHITESPACE_REGEX = re.compile(r'\s+')
+
+
+def canonize_match_value(value: str) -> str:
+    # Boolean operators are case-sensitive in Summa query language, so they are preserved
+    parts = BOOLEAN_OPERATOR_REGEX.split(MULTIWHITESPACE_REGEX.sub(' ', value.strip()))
+    return ''.join(part if i % 2 else part.lower() for i, part in enumerate(parts))
+
+
+def canonize_query(query):
+    if isinstance(query, dict):
+        canonized_query = {}
+        for key, value in query.items():
+            if key == 'match' and isinstance(value, dict) and 'value' in value:
+                value = {**value, 'value': canonize_match_value(value['value'])}
+            canonized_query[key] = canonize_query(value)
+        return canonized_query
+    elif isinstance(query, list):
+        return [canonize_query(item) for item in query]
+    return query
+
+
+def canonize_search_request(search_request: Union[dict, query_pb.SearchRequest]) -> bytes:
+    """
+    Returns key that is equal for search requests differing only in the order of keys, the case of words
+    or whitespaces in match queries.
+    """
+    search_request = prepare_search_request(search_request)
+    return orjson.dumps(
+        canonize_query(MessageToDict(search_request, preserving_proto_field_name=True)),
+        option=orjson.OPT_SORT_KEYS,
+    )
+
+
+class QueryCache:
+    """
+    Bounded LRU cache with TTL eviction for search responses
+    """
+    def __init__(self, max_size: int = 1024, ttl: float = 600.0):
+        """
+        :param max_size: maximum number of stored responses
+        :param ttl: time in seconds after which response is considered stale
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: bytes):
+        entry = self.entries.get(key)
+        if entry is not None:
+            expire_at, response = entry
+            if expire_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return response
+            del self.entries[key]
+        self.misses += 1
+
+    def put(self, key: bytes, response):
+        self.entries[key] = (time.monotonic() + self.ttl, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+
+class CachingSummaClient(InstrumentedSummaClient):
+    """
+    Summa client that returns cached responses for repeated search requests.
+    All methods built on top of `search`, such as `search_documents` and `get_one_by_field_value`, are cached too.
+    """
+    def __init__(self, *args, query_cache: QueryCache, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.query_cache = query_cache
+
+    async def search(
+        self,
+        search_request: Union[dict, query_pb.SearchRequest],
+        ignore_not_found: bool = False,
+        request_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+    ) -> query_pb.SearchResponse:
+        search_request = prepare_search_request(search_request)
+        key = canonize_search_request(search_request)
+        if (response := self.query_cache.get(key)) is not None:
+            return response
+        response = await super().search(
+            search_request,
+            ignore_not_found=ignore_not_found,
+            request_id=request_id,
+            session_id=session_id,
+        )
+        self.query_cache.put(key, response)
+        return response
@@ -0,0 +1,114 @@
+import logging
+import re
+import time
+from typing import (
+    Optional,
+    Tuple,
+)
+
+from aiohttp import web
+from aiokit import AioThing
+
+from .block_cache import DiskBlockCache
+from .gateway_pool import (
+    GatewayError,
+    GatewayPool,
+)
+from .metrics import IoMetrics
+
+RANGE_REGEX = re.compile(r'bytes=(\d+)-(\d+)')
+
+
+class RangeProxy(AioThing):
+    """
+    Local HTTP server standing between embedded Summa and IPFS gateways.
+
+    Summa reads remote index by issuing HTTP range requests. The proxy serves these requests from `DiskBlockCache`
+    if it is set and sends the rest of them to `GatewayPool`.
+    """
+    def __init__(
+        self,
+        gateway_pool: GatewayPool,
+        block_cache: Optional[DiskBlockCache] = None,
+        host: str = '127.0.0.1',
+        io_metrics: Optional[IoMetrics] = None,
+    ):
+        """
+        :param gateway_pool: gateways serving the index directory
+        :param block_cache: cache for storing fetched ranges
+        :param host: interface for listening
+        :param io_metrics: metrics for recording range requests issued by Summa
+        """
+        super().__init__()
+        self.gateway_pool = gateway_pool
+        self.starts.append(self.gateway_pool)
+        self.block_cache = block_cache
+        if self.block_cache:
+            self.starts.append(self.block_cache)
+        self.host = host
+        self.port = None
+        self.runner = None
+        self.fetched_bytes = 0
+        self.io_metrics = io_metrics
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.host}:{self.port}/'
+
+    async def fetch(self, file_name: str, headers: dict):
+        try:
+            status, headers, data = await self.gateway_pool.fetch(file_name, headers)
+        except GatewayError as e:
+            return 502, {}, str(e).encode()
+        self.fetched_bytes += len(data)
+        return status, headers, data
+
+    async def handle(self, request: web.Request) -> web.Response:
+        started_at = time.monotonic()
+        response, is_cache_hit = await self.serve(request)
+        if self.io_metrics:
+            self.io_metrics.record_range_request(len(response.body), is_cache_hit, time.monotonic() - started_at)
+        return response
+
+    async def serve(self, request: web.Request) -> Tuple[web.Response, Optional[bool]]:
+        file_name = request.match_info['file_name']
+        range_header = request.headers.get('Range')
+        range_match = RANGE_REGEX.fullmatch(range_header) if range_header else None
+
+        if not range_match or not self.block_cache or not self.block_cache.is_cacheable(file_name):
+            status, headers, data = await self.fetch(file_name, {'Range': range_header} if range_header else {})
+            return web.Response(status=status, headers=headers, body=data), None
+
+        start, end = int(range_match.group(1)), int(range_match.group(2))
+        if (data := await self.block_cache.get(file_name, start, end)) is not None:
+            return web.Response(status=206, headers={'Content-Range': f'bytes {start}-{end}/*'}, body=data), True
+
+        status, headers, data = await self.fetch(file_name, {'Range': range_header})
+        if status in (200, 206):
+            if status == 200:
+                data = data[start:end + 1]
+                status = 206
+                headers['Content-Range'] = f'bytes {start}-{end}/*'
+            await self.block_cache.put(file_name, start, end, data)
+        else:
+            logging.getLogger('warning').warning({
+                'action': 'failed_range_request',
+                'mode': 'range_proxy',
+                'file_name': file_name,
+                'status': status,
+            })
+        return web.Response(status=status, headers=headers, body=data), False
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route('GET', '/{file_name:.*}', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
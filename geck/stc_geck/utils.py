@@ -1,13 +1,14 @@
 import asyncio
+import json
 import logging
-import os
+import os.path
 import re
 import socket
-import tempfile
-from urllib.parse import quote
 
-import ipfs_hamt_directory_py
+from .car import write_car
 
+MIRROR_MANIFEST_FILE_NAME = '.geck-mirror.json'
+MIRROR_PROGRESS_FILE_NAME = '.geck-mirror.progress.json'
 NON_ALNUMWHITESPACE_REGEX = re.compile(r'([^\s\w])+')
 MULTIWHITESPACE_REGEX = re.compile(r"\s+")
 
@@ -18,40 +19,83 @@ def cast_string_to_single_string(s):
     return processed
 
 
-async def create_car(output_car, documents, limit, name_template) -> str:
-    with tempfile.TemporaryDirectory() as td:
-        input_data = os.path.join(td, 'input_data.txt')
-        with open(input_data, 'wb') as f:
-            async for document in documents:
-                if limit <= 0:
-                    break
-                id_ = document.get('doi') or document.get('md5')
-                item_name = name_template.format(
-                    title=cast_string_to_single_string(document['title']) if 'title' in document else id_,
-                    id=id_,
-                    md5=document.get('md5'),
-                    doi=document.get('doi'),
-                    extension=document.get('metadata', {}).get('extension', 'pdf'),
-                )
-                f.write(quote(item_name, safe='').encode())
-                f.write(b' ')
-                f.write(document['cid'].encode())
-                f.write(b' ')
-                f.write(str(document.get('filesize') or 0).encode())
-                f.write(b'\n')
-                limit -= 1
-        return await asyncio.get_event_loop().run_in_executor(
-            None, lambda: ipfs_hamt_directory_py.from_file(input_data, output_car, td),
+async def iter_car_entries(documents, limit, name_template):
+    async for document in documents:
+        if limit <= 0:
+            break
+        id_ = document.get('doi') or document.get('md5')
+        item_name = name_template.format(
+            title=cast_string_to_single_string(document['title']) if 'title' in document else id_,
+            id=id_,
+            md5=document.get('md5'),
+            doi=document.get('doi'),
+            extension=document.get('metadata', {}).get('extension', 'pdf'),
         )
+        yield item_name, document['cid'], document.get('filesize') or 0
+        limit -= 1
+
 
+async def create_car(output_car, documents, limit, name_template) -> str:
+    return await write_car(iter_car_entries(documents, limit, name_template), output_car)
 
-def is_endpoint_listening(endpoint):
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    ip, port = endpoint.split(':')
+
+async def is_endpoint_listening(endpoint: str, timeout: float = 5.0) -> bool:
+    ip, port = endpoint.rsplit(':', 1)
     try:
-        is_open = sock.connect_ex((ip, int(port))) == 0
-        sock.close()
-        return is_open
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, int(port)), timeout=timeout)
     except socket.gaierror as e:
         logging.getLogger('warning').warning({'action': 'warning', 'error': str(e)})
         return False
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    return True
+
+
+def get_free_endpoint(host: str = '127.0.0.1') -> str:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return f'{host}:{sock.getsockname()[1]}'
+
+
+def is_mirrored(mirror_directory: str) -> bool:
+    return os.path.exists(os.path.join(mirror_directory, MIRROR_MANIFEST_FILE_NAME))
+
+
+def read_mirror_manifest(mirror_directory: str) -> dict:
+    """
+    Returns hashes of files of the complete mirror, or of files that are known to be intact if mirroring
+    has been interrupted
+    """
+    for file_name in (MIRROR_MANIFEST_FILE_NAME, MIRROR_PROGRESS_FILE_NAME):
+        file_name = os.path.join(mirror_directory, file_name)
+        if os.path.exists(file_name):
+            with open(file_name) as f:
+                return json.load(f)
+    return {}
+
+
+def _write_json_atomically(file_name: str, data):
+    with open(file_name + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(file_name + '.tmp', file_name)
+
+
+def write_mirror_progress(mirror_directory: str, files: dict):
+    """
+    Records files that are intact while the mirror is being updated and invalidates the manifest,
+    so the mirror is not opened until it is complete again
+    """
+    # Progress is written before the manifest is removed, so files are never left without a record
+    _write_json_atomically(os.path.join(mirror_directory, MIRROR_PROGRESS_FILE_NAME), files)
+    manifest_file_name = os.path.join(mirror_directory, MIRROR_MANIFEST_FILE_NAME)
+    if os.path.exists(manifest_file_name):
+        os.remove(manifest_file_name)
+
+
+def write_mirror_manifest(mirror_directory: str, files: dict):
+    # Manifest is written only after all files are downloaded, so its presence means the mirror is complete
+    _write_json_atomically(os.path.join(mirror_directory, MIRROR_MANIFEST_FILE_NAME), files)
+    progress_file_name = os.path.join(mirror_directory, MIRROR_PROGRESS_FILE_NAME)
+    if os.path.exists(progress_file_name):
+        os.remove(progress_file_name)
@@ -7,7 +7,9 @@ from pydoc import locate
 from aiobaseclient import BaseClient
 from aiokit import AioRootThing
 from izihawa_ipfs_api import IpfsHttpClient
+from stc_geck.advices import default_scorer_thresholds
 from stc_geck.client import StcGeck
+from stc_geck.query_cache import QueryCache
 
 from library.sciparse.sciparser import (
     ClientPool,
@@ -31,7 +33,35 @@ class TelegramApplication(AioRootThing):
         self.database = Database(data_directory=config['application']['data_directory'])
         self.starts.append(self.database)
 
-        is_embed = self.config['summa']['embed'].get('enabled', True)
+        self.geck = StcGeck(
+            ipfs_http_base_url=[self.config['ipfs']['http']['base_url']] + self.config['ipfs']['http'].get('extra_base_urls', []),
+            ipfs_data_directory=self.config['summa']['embed']['ipfs_data_directory'],
+            grpc_api_endpoint=self.config['summa']['endpoint'],
+            cache_directory=self.config['summa']['embed'].get('cache_directory'),
+            mirror_directory=self.config['summa']['embed'].get('mirror_directory'),
+            prewarm=self.config['summa']['embed'].get('prewarm', False),
+            query_cache_size=self.config['summa'].get('query_cache', {}).get('size', 0),
+            query_cache_ttl=self.config['summa'].get('query_cache', {}).get('ttl', 600.0),
+        )
+        self.starts.append(self.geck)
+
+        self._search_request_builder = None
+
+        self.summa_client = self.geck.get_summa_client()
+        self.starts.append(self.summa_client)
+
+        self.scorer_thresholds = None
+        self.scorer_count_cache = None
+        adaptive_scorer_config = self.config['summa'].get('adaptive_scorer', {})
+        if adaptive_scorer_config.get('enabled', False):
+            self.scorer_thresholds = adaptive_scorer_config.get('thresholds', default_scorer_thresholds)
+            self.scorer_count_cache = QueryCache(
+                max_size=adaptive_scorer_config.get('count_cache_size', 4096),
+                ttl=adaptive_scorer_config.get('count_cache_ttl', 600.0),
+            )
+
+        # GECK detects whether Summa is embedded only on start, so services are wired according to the config
+        self.is_embed = self.config['summa']['embed'].get('enabled', True)
 
         self.dynamic_bot_manager = DynamicBotManager(
             data_directory=config['application']['data_directory'],
@@ -44,7 +74,7 @@ class TelegramApplication(AioRootThing):
                     'tgbot.handlers.trends.TrendsHelpHandler',
                     'tgbot.handlers.trends.TrendsHandler',
                     'tgbot.handlers.trends.TrendsEditHandler'
-                ] if not is_embed else [],
+                ] if not self.is_embed else [],
             ),
             pre_stop_hook=lambda bot_name, telegram_client: telegram_client.remove_event_handlers(),
             total_shards=config['application']['workers'],
@@ -52,18 +82,6 @@ class TelegramApplication(AioRootThing):
         )
         self.starts.append(self.dynamic_bot_manager)
 
-        self.geck = StcGeck(
-            ipfs_http_base_url=self.config['ipfs']['http']['base_url'],
-            ipfs_data_directory=self.config['summa']['embed']['ipfs_data_directory'],
-            grpc_api_endpoint=self.config['summa']['endpoint'],
-        )
-        self.starts.append(self.geck)
-
-        self.search_request_builder = TelegramSearchRequestBuilder('nexus_science', 'light' if self.geck.is_embed else 'full')
-
-        self.summa_client = self.geck.get_summa_client()
-        self.starts.append(self.summa_client)
-
         self.cybrex = None
         if (
             'cybrex' in self.config
@@ -163,8 +181,16 @@ class TelegramApplication(AioRootThing):
             'action': 'started',
         })
 
+    @property
+    def search_request_builder(self) -> TelegramSearchRequestBuilder:
+        # Profile depends on whether Summa is embedded, that is known only after GECK has started
+        if self._search_request_builder is None:
+            self._search_request_builder = TelegramSearchRequestBuilder('nexus_science', 'light' if self.geck.is_embed else 'full')
+        return self._search_request_builder
+
     def is_read_only(self):
-        return self.config['application'].get('is_read_only', False) or self.geck.is_embed
+        is_embed = self.geck.is_embed if self.geck.is_embed is not None else self.is_embed
+        return self.config['application'].get('is_read_only', False) or is_embed
 
     def set_handlers(self, telegram_client, bot_config: dict, extra_handlers=None, extra_warning=None):
         for handler in (
@@ -100,16 +100,11 @@ class LibrarianService(AioThing):
                     'mode': 'librarian_service',
                     'n': len(self.requests),
                 })
-                for internal_id in list(self.requests.keys()):
-                    field, value = internal_id.split(':', 1)
-                    if document := await self.application.summa_client.get_one_by_field_value(
-                        'nexus_science',
-                        field,
-                        value
-                    ):
-                        document_holder = BaseTelegramDocumentHolder(document)
-                        if document_holder.get_links().get_link_with_extension('pdf'):
-                            await self.delete_request(internal_id)
+                documents = await self.application.geck.get_many_by_internal_ids(list(self.requests.keys()))
+                for internal_id, document in documents.items():
+                    document_holder = BaseTelegramDocumentHolder(document)
+                    if document_holder.get_links().get_link_with_extension('pdf'):
+                        await self.delete_request(internal_id)
                 await asyncio.sleep(3600)
         except asyncio.CancelledError:
             logging.getLogger('debug').debug({
@@ -376,14 +376,15 @@ class SearchEditHandler(BaseSearchHandler):
 
 
 class SearchPagingHandler(BaseCallbackQueryHandler):
-    filter = events.CallbackQuery(pattern='^/search_([0-9]+)$')
+    filter = events.CallbackQuery(pattern='^/search_([0-9]+)(?::([A-Za-z0-9_-]+))?$')
 
     def parse_pattern(self, event: events.ChatAction):
         page = int(event.pattern_match.group(1).decode())
-        return page
+        cursor = event.pattern_match.group(2).decode() if event.pattern_match.group(2) else None
+        return page, cursor
 
     async def handler(self, event: events.ChatAction, request_context: RequestContext):
-        page = self.parse_pattern(event)
+        page, cursor = self.parse_pattern(event)
         request_context.add_default_fields(mode='search_paging')
         message = await event.get_message()
 
@@ -407,6 +408,7 @@ class SearchPagingHandler(BaseCallbackQueryHandler):
                 page=page,
                 load_cache=True,
                 store_cache=True,
+                cursor=cursor,
             )
         except InvalidSearchError:
             return await event.answer(
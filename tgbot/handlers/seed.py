@@ -1,11 +1,9 @@
-import asyncio
 import os
 import re
 import tempfile
-from urllib.parse import quote
 
-import ipfs_hamt_directory_py
 from stc_geck.advices import LinksWrapper
+from stc_geck.car import write_car
 from telethon import events
 from telethon.tl.types import DocumentAttributeFilename
 
@@ -19,47 +17,21 @@ from tgbot.views.telegram.base_holder import BaseTelegramDocumentHolder
 from .base import BaseHandler
 
 
-def create_car(documents, name_template) -> (str, bytes):
-    with tempfile.TemporaryDirectory() as td:
-        input_data = os.path.join(td, 'input_data.txt')
-        output_car = os.path.join(td, 'output.car')
-        with open(input_data, 'wb') as f:
-            for document in documents:
-                document_holder = BaseTelegramDocumentHolder.create(document)
-                links = LinksWrapper(document_holder.links)
-                if link := links.get_link_with_extension('pdf'):
-                    item_name = name_template.format(
-                        doi=document_holder.doi,
-                        md5=document_holder.md5,
-                        suggested_filename=document_holder.get_purified_name({
-                            'doi': document_holder.doi,
-                            'cid': link['cid'],
-                        }),
-                    ) + '.' + 'pdf'
-                    f.write(quote(item_name, safe='').encode())
-                    f.write(b' ')
-                    f.write(link['cid'].encode())
-                    f.write(b' ')
-                    f.write(str(link.get('filesize') or 0).encode())
-                    f.write(b'\n')
-                if link := links.get_link_with_extension('epub'):
-                    item_name = name_template.format(
-                        doi=document_holder.doi,
-                        md5=document_holder.md5,
-                        suggested_filename=document_holder.get_purified_name({
-                            'doi': document_holder.doi,
-                            'cid': link['cid'],
-                        }),
-                    ) + '.' + 'epub'
-                    f.write(quote(item_name, safe='').encode())
-                    f.write(b' ')
-                    f.write(link['cid'].encode())
-                    f.write(b' ')
-                    f.write(str(link.get('filesize') or 0).encode())
-                    f.write(b'\n')
-        cid = ipfs_hamt_directory_py.from_file(input_data, output_car, td)
-        with open(output_car, 'rb') as f:
-            return cid, f.read()
+async def iter_car_entries(documents, name_template):
+    for document in documents:
+        document_holder = BaseTelegramDocumentHolder.create(document)
+        links = LinksWrapper(document_holder.links)
+        for extension in ('pdf', 'epub'):
+            if link := links.get_link_with_extension(extension):
+                item_name = name_template.format(
+                    doi=document_holder.doi,
+                    md5=document_holder.md5,
+                    suggested_filename=document_holder.get_purified_name({
+                        'doi': document_holder.doi,
+                        'cid': link['cid'],
+                    }),
+                ) + '.' + extension
+                yield item_name, link['cid'], link.get('filesize') or 0
 
 
 class SeedHandler(BaseHandler):
@@ -160,25 +132,26 @@ class SeedHandler(BaseHandler):
         filename = f'{casted_query[:16]}-{page}-{string_page_size}-{count}.car'
         page_head = f'**Page:** {page}\n' if not random_seed else ''
 
-        root_cid, file = await asyncio.get_event_loop().run_in_executor(None, lambda: create_car(documents, name_template))
-
-        await self.application.get_telegram_client(request_context.bot_name).send_file(
-            attributes=[DocumentAttributeFilename(filename)],
-            buttons=[close_button()],
-            caption=f'{page_head}'
-                    f'**Page size:** {string_page_size}\n'
-                    f'**Total:** {count}\n\n'
-                    f'**Root CID:** `{root_cid}`\n\n'
-                    f'**Import (without pinning):** \n'
-                    f'`ipfs dag import --stats --pin-roots=false {filename}`\n\n'
-                    f'**Import:** \n'
-                    f'`ipfs dag import --stats {filename}`\n\n'
-                    f'**View:** \n'
-                    f'In Terminal: `ipfs ls --resolve-type=false --size=false -s {root_cid}`\n'
-                    f'In Browser: https://ipfs.io/ipfs/{root_cid}',
-            entity=request_context.chat['chat_id'],
-            file=file,
-            reply_to=event,
-        )
+        with tempfile.TemporaryDirectory() as td:
+            output_car = os.path.join(td, 'output.car')
+            root_cid = await write_car(iter_car_entries(documents, name_template), output_car)
+            await self.application.get_telegram_client(request_context.bot_name).send_file(
+                attributes=[DocumentAttributeFilename(filename)],
+                buttons=[close_button()],
+                caption=f'{page_head}'
+                        f'**Page size:** {string_page_size}\n'
+                        f'**Total:** {count}\n\n'
+                        f'**Root CID:** `{root_cid}`\n\n'
+                        f'**Import (without pinning):** \n'
+                        f'`ipfs dag import --stats --pin-roots=false {filename}`\n\n'
+                        f'**Import:** \n'
+                        f'`ipfs dag import --stats {filename}`\n\n'
+                        f'**View:** \n'
+                        f'In Terminal: `ipfs ls --resolve-type=false --size=false -s {root_cid}`\n'
+                        f'In Browser: https://ipfs.io/ipfs/{root_cid}',
+                entity=request_context.chat['chat_id'],
+                file=output_car,
+                reply_to=event,
+            )
         async with safe_execution(error_log=request_context.error_log):
             await self.application.get_telegram_client(request_context.bot_name).delete_messages(request_context.chat['chat_id'], [wait_message.id])
@@ -4,7 +4,10 @@ from urllib.parse import quote
 
 import orjson
 from bs4 import BeautifulSoup
-from stc_geck.advices import BaseDocumentHolder
+from stc_geck.advices import (
+    BaseDocumentHolder,
+    DocumentView,
+)
 
 from library.textutils.utils import cast_string_to_single_string
 
@@ -30,7 +33,7 @@ class BaseTelegramDocumentHolder(BaseDocumentHolder):
 
     @classmethod
     def create(cls, scored_document, snippets=None):
-        return BaseTelegramDocumentHolder(orjson.loads(scored_document.document), snippets)
+        return BaseTelegramDocumentHolder(DocumentView(orjson.loads(scored_document.document)), snippets)
 
     def base_render(self, request_context, with_librarian_service):
         el = (
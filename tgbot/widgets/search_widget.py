@@ -1,3 +1,12 @@
+from typing import Optional
+
+from stc_geck.advices import search_with_adaptive_scorer
+from stc_geck.pagination import (
+    apply_cursor,
+    decode_cursor,
+    get_next_cursor,
+    get_sort_field,
+)
 from telethon import Button
 
 from library.telegram.base import RequestContext
@@ -10,6 +19,8 @@ from tgbot.views.telegram.common import (
     encode_query_to_deep_link,
 )
 
+MAX_CALLBACK_DATA_LENGTH = 64
+
 
 class BaseSearchWidget:
     """
@@ -26,6 +37,7 @@ class BaseSearchWidget:
         string_query: str,
         page: int = 0,
         is_group_mode: bool = False,
+        cursor: Optional[str] = None,
     ):
         self.application = application
         self.request_context = request_context
@@ -33,6 +45,7 @@ class BaseSearchWidget:
         self.string_query = string_query
         self.page = page
         self.is_group_mode = is_group_mode
+        self.cursor = cursor
 
     @classmethod
     async def create(
@@ -45,6 +58,7 @@ class BaseSearchWidget:
         is_group_mode: bool = False,
         load_cache: bool = False,
         store_cache: bool = False,
+        cursor: Optional[str] = None,
     ):
         search_widget_view = cls(
             application=application,
@@ -53,6 +67,7 @@ class BaseSearchWidget:
             string_query=string_query,
             page=page,
             is_group_mode=is_group_mode,
+            cursor=cursor,
         )
         await search_widget_view._acquire_documents(load_cache=load_cache, store_cache=store_cache)
         return search_widget_view
@@ -66,11 +81,34 @@ class BaseSearchWidget:
         )
         self.query['load_cache'] = load_cache
         self.query['store_cache'] = store_cache
-        self._search_response = await self.application.summa_client.search(self.query)
+        # Cursors are used only for results sorted by a field, deeper pages are selected by a range filter then
+        if not get_sort_field(self.query):
+            self.cursor = None
+        search_request = apply_cursor(self.query, self.cursor)
+        # Embedded Summa uses `light` profile without ranking formula, so there is nothing to make cheaper
+        if self.application.scorer_thresholds is not None and self.application.search_request_builder.profile == 'full':
+            self._search_response, _ = await search_with_adaptive_scorer(
+                self.application.summa_client,
+                search_request,
+                thresholds=self.application.scorer_thresholds,
+                count_cache=self.application.scorer_count_cache,
+            )
+        else:
+            self._search_response = await self.application.summa_client.search(search_request)
 
     @property
     def count(self) -> int:
-        return self._search_response.collector_outputs[1].count.count
+        count = self._search_response.collector_outputs[1].count.count
+        if self.cursor:
+            # Documents of previous pages are excluded by the range filter, except `skip` ones
+            count += self.page * self.application.config['application']['page_size'] - decode_cursor(self.cursor)['skip']
+        return count
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        if not get_sort_field(self.query):
+            return None
+        return get_next_cursor(self.query, self.scored_documents, self.has_next, self.cursor)
 
     @property
     def has_next(self) -> bool:
@@ -82,6 +120,12 @@ class BaseSearchWidget:
 
 
 class SearchWidget(BaseSearchWidget):
+    def next_page_data(self) -> str:
+        data = f'/search_{self.page + 1}'
+        if (next_cursor := self.next_cursor) and len(data) + len(next_cursor) + 1 <= MAX_CALLBACK_DATA_LENGTH:
+            data = f'{data}:{next_cursor}'
+        return data
+
     async def render(self, request_context: RequestContext) -> tuple:
         if len(self.scored_documents) == 0:
             return t('COULD_NOT_FIND_ANYTHING', self.chat['language']), [close_button()]
@@ -135,8 +179,7 @@ class SearchWidget(BaseSearchWidget):
                     ),
                     Button.inline(
                         text=f'{self.page + 2}>' if self.has_next else ' ',
-                        data=f'/search_{self.page + 1}'
-                        if self.has_next else '/noop',
+                        data=self.next_page_data() if self.has_next else '/noop',
                     )
                 ]
             buttons.append(close_button())